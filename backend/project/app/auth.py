@@ -5,17 +5,20 @@ Incluye: Login con BD, validación de tokens, control de acceso por roles
 """
 
 import os
-from datetime import datetime, timedelta
-from typing import Optional, List
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Optional, List, Tuple, Union, Dict
 from fastapi import HTTPException, Request, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import jwt
 from dotenv import load_dotenv
-import psycopg2
-from psycopg2.extras import RealDictCursor
-
-from app.database import get_db_connection
-from app.models import RolEnum, Usuario
+from app.database import async_db_connection
+from app.avisos import escucha_avisos, publicar
+from app.models import RolEnum, Usuario, UsuarioClaims
+from app.passwords import verify_password, HashingSaturado
 
 load_dotenv(override=False)
 
@@ -24,6 +27,18 @@ SECRET_KEY = os.getenv("SECRET_KEY", "cambia_esto_en_produccion")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
 
+# Caché de usuarios autenticados (0 segundos = deshabilitada)
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", 60))
+USER_CACHE_MAX_SIZE = int(os.getenv("USER_CACHE_MAX_SIZE", 1024))
+USUARIOS_CANAL = os.getenv("USUARIOS_CANAL", "usuarios_cambios")  # Avisos de cambios entre réplicas
+
+# Modo claims: los roles se autorizan solo con el token firmado
+AUTH_CLAIMS_MODE = os.getenv("AUTH_CLAIMS_MODE", "false").lower() in ("1", "true", "yes")
+AUTH_EPOCH_REFRESH_SECONDS = float(os.getenv("AUTH_EPOCH_REFRESH_SECONDS", 15))
+
+# Escritura diferida de usuarios.ultimo_acceso
+ULTIMO_ACCESO_FLUSH_SECONDS = float(os.getenv("ULTIMO_ACCESO_FLUSH_SECONDS", 5))
+
 
 # ==================== HTTP BEARER PERSONALIZADO ====================
 
@@ -68,9 +83,96 @@ security = HTTPBearerFixed()
 
 # ==================== AUTENTICACIÓN CON BASE DE DATOS ====================
 
-def authenticate_user(username: str, password: str) -> Optional[Usuario]:
+class BufferUltimoAcceso:
+    """
+    Escritura diferida (write-behind) de usuarios.ultimo_acceso.
+
+    Los logins solo registran el momento en memoria; una tarea en segundo
+    plano aplica todos los pendientes con un único UPDATE cada `intervalo`
+    segundos y al apagar la aplicación.
+    """
+
+    def __init__(self, intervalo: float = ULTIMO_ACCESO_FLUSH_SECONDS):
+        self.intervalo = intervalo
+        self._pendientes: Dict[int, datetime] = {}
+        self._tarea: Optional[asyncio.Task] = None
+        self._detener: Optional[asyncio.Event] = None
+        self._metricas = {"registrados": 0, "lotes": 0, "filas_actualizadas": 0, "errores": 0}
+
+    def registrar(self, user_id: int, momento: Optional[datetime] = None):
+        self._pendientes[user_id] = momento or datetime.now(timezone.utc)
+        self._metricas["registrados"] += 1
+
+    async def vaciar(self):
+        """Aplica los accesos pendientes en un solo UPDATE; reintenta en el próximo ciclo si falla"""
+        if not self._pendientes:
+            return
+        lote, self._pendientes = self._pendientes, {}
+
+        try:
+            async with async_db_connection() as conn:
+                async with conn.cursor() as cur:
+                    # timestamptz -> timestamp usa la zona de la sesión, igual que NOW()
+                    await cur.execute("""
+                        UPDATE public.usuarios AS u
+                        SET ultimo_acceso = v.momento
+                        FROM unnest(%s::int[], %s::timestamptz[]) AS v(id, momento)
+                        WHERE u.id = v.id
+                        AND (u.ultimo_acceso IS NULL OR u.ultimo_acceso < v.momento)
+                    """, (list(lote.keys()), list(lote.values())))
+                    self._metricas["filas_actualizadas"] += cur.rowcount
+                await conn.commit()
+            self._metricas["lotes"] += 1
+        except asyncio.CancelledError:
+            self._reencolar(lote)
+            raise
+        except Exception as e:
+            self._metricas["errores"] += 1
+            self._reencolar(lote)
+            print(f"Error actualizando último acceso: {e}")
+
+    def _reencolar(self, lote: Dict[int, datetime]):
+        for user_id, momento in lote.items():
+            if user_id not in self._pendientes or self._pendientes[user_id] < momento:
+                self._pendientes[user_id] = momento
+
+    async def _ciclo(self):
+        while not self._detener.is_set():
+            try:
+                await asyncio.wait_for(self._detener.wait(), timeout=self.intervalo)
+            except asyncio.TimeoutError:
+                pass
+            await self.vaciar()
+        # Lo registrado mientras corría el último vaciado
+        await self.vaciar()
+
+    def iniciar(self):
+        if self._tarea is None:
+            self._detener = asyncio.Event()
+            self._tarea = asyncio.create_task(self._ciclo())
+
+    async def detener(self):
+        """Detiene la tarea periódica tras un último vaciado"""
+        if self._tarea is not None:
+            self._detener.set()
+            await self._tarea
+            self._tarea = None
+        else:
+            await self.vaciar()
+
+    def estadisticas(self) -> dict:
+        return {"intervalo_segundos": self.intervalo, "pendientes": len(self._pendientes), **self._metricas}
+
+
+# Instancia global por proceso
+buffer_ultimo_acceso = BufferUltimoAcceso()
+
+
+async def authenticate_user(username: str, password: str) -> Optional[Usuario]:
     """
     Autentica un usuario contra la base de datos.
+    El hash bcrypt se verifica en la aplicación (app.passwords), no en
+    PostgreSQL, para no consumir CPU del coordinador.
 
     Args:
         username: Nombre de usuario
@@ -78,50 +180,47 @@ def authenticate_user(username: str, password: str) -> Optional[Usuario]:
 
     Returns:
         Usuario si las credenciales son válidas, None si no
+
+    Raises:
+        HashingSaturado: Si la cola de verificación de contraseñas está llena
     """
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-
-        # Buscar usuario y verificar contraseña usando crypt
-        cur.execute("""
-            SELECT
-                id, username, rol, nombres, apellidos,
-                documento_vinculado, activo, fecha_creacion, ultimo_acceso
-            FROM public.usuarios
-            WHERE username = %s
-            AND password_hash = crypt(%s, password_hash)
-            AND activo = TRUE
-        """, (username, password))
-
-        row = cur.fetchone()
-
-        if not row:
+        async with async_db_connection() as conn:
+            cur = conn.cursor()
+
+            # Buscar usuario activo (la contraseña se verifica fuera de la BD)
+            await cur.execute("""
+                SELECT
+                    id, username, rol, nombres, apellidos,
+                    documento_vinculado, activo, fecha_creacion, ultimo_acceso,
+                    token_epoch, password_hash
+                FROM public.usuarios
+                WHERE username = %s
+                AND activo = TRUE
+            """, (username,))
+
+            row = await cur.fetchone()
+            await cur.close()
+
+        # Sin conexión prestada mientras corre bcrypt
+        password_hash = row.pop('password_hash') if row else None
+        if not await verify_password(password, password_hash):
             return None
 
-        # Actualizar último acceso
-        cur.execute("""
-            UPDATE public.usuarios
-            SET ultimo_acceso = NOW()
-            WHERE id = %s
-        """, (row['id'],))
-        conn.commit()
-
-        cur.close()
+        # Último acceso: se escribe en lote en segundo plano
+        buffer_ultimo_acceso.registrar(row['id'])
 
         # Convertir a modelo Usuario
         return Usuario(**dict(row))
 
+    except HashingSaturado:
+        raise
     except Exception as e:
         print(f"Error en autenticación: {e}")
         return None
-    finally:
-        if conn:
-            conn.close()
 
 
-def get_user_by_username(username: str) -> Optional[Usuario]:
+async def get_user_by_username(username: str) -> Optional[Usuario]:
     """
     Obtiene un usuario por su username
 
@@ -131,21 +230,21 @@ def get_user_by_username(username: str) -> Optional[Usuario]:
     Returns:
         Usuario si existe, None si no
     """
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
+        async with async_db_connection() as conn:
+            cur = conn.cursor()
 
-        cur.execute("""
-            SELECT
-                id, username, rol, nombres, apellidos,
-                documento_vinculado, activo, fecha_creacion, ultimo_acceso
-            FROM public.usuarios
-            WHERE username = %s AND activo = TRUE
-        """, (username,))
+            await cur.execute("""
+                SELECT
+                    id, username, rol, nombres, apellidos,
+                    documento_vinculado, activo, fecha_creacion, ultimo_acceso,
+                    token_epoch
+                FROM public.usuarios
+                WHERE username = %s AND activo = TRUE
+            """, (username,))
 
-        row = cur.fetchone()
-        cur.close()
+            row = await cur.fetchone()
+            await cur.close()
 
         if not row:
             return None
@@ -155,9 +254,196 @@ def get_user_by_username(username: str) -> Optional[Usuario]:
     except Exception as e:
         print(f"Error obteniendo usuario: {e}")
         return None
-    finally:
-        if conn:
-            conn.close()
+
+
+# ==================== CACHÉ DE USUARIOS AUTENTICADOS ====================
+
+class CacheUsuarios:
+    """
+    Caché LRU con TTL de usuarios ya validados contra la BD.
+
+    La clave es (username, iat del token): un token nuevo siempre consulta
+    la BD al menos una vez. Las entradas expiran tras `ttl` segundos y se
+    invalidan explícitamente cuando el usuario cambia vía /usuarios: en
+    este proceso al instante y en las demás réplicas con el aviso del
+    canal USUARIOS_CANAL. Si la escucha de avisos se corta, la caché se
+    vacía; mientras no se restablece, un cambio hecho en otra réplica se
+    ve aquí como máximo tras `ttl` segundos.
+    """
+
+    def __init__(self, ttl: float = USER_CACHE_TTL_SECONDS, max_size: int = USER_CACHE_MAX_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._datos: "OrderedDict[Tuple[str, Optional[int]], Tuple[float, Usuario]]" = OrderedDict()
+        self._versiones = {}  # username -> contador de invalidaciones
+        self._lock = threading.Lock()
+        self._metricas = {"hits": 0, "misses": 0, "expirados": 0, "desalojados": 0, "invalidaciones": 0}
+
+    @property
+    def habilitada(self) -> bool:
+        return self.ttl > 0 and self.max_size > 0
+
+    def obtener(self, username: str, iat: Optional[int]) -> Optional[Usuario]:
+        if not self.habilitada:
+            return None
+        clave = (username, iat)
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                self._metricas["misses"] += 1
+                return None
+            expira_en, usuario = entrada
+            if time.monotonic() >= expira_en:
+                del self._datos[clave]
+                self._metricas["expirados"] += 1
+                self._metricas["misses"] += 1
+                return None
+            self._datos.move_to_end(clave)
+            self._metricas["hits"] += 1
+            return usuario
+
+    def version(self, username: str) -> int:
+        """Versión actual del usuario; se toma antes de consultar la BD"""
+        with self._lock:
+            return self._versiones.get(username, 0)
+
+    def guardar(self, username: str, iat: Optional[int], usuario: Usuario, version: int = 0):
+        """Guarda el usuario salvo que haya sido invalidado durante la consulta"""
+        if not self.habilitada:
+            return
+        with self._lock:
+            if self._versiones.get(username, 0) != version:
+                return
+            self._datos[(username, iat)] = (time.monotonic() + self.ttl, usuario)
+            self._datos.move_to_end((username, iat))
+            while len(self._datos) > self.max_size:
+                self._datos.popitem(last=False)
+                self._metricas["desalojados"] += 1
+
+    def invalidar(self, username: str):
+        """Elimina todas las entradas del usuario (todos sus tokens)"""
+        with self._lock:
+            claves = [clave for clave in self._datos if clave[0] == username]
+            for clave in claves:
+                del self._datos[clave]
+            self._versiones[username] = self._versiones.get(username, 0) + 1
+            self._metricas["invalidaciones"] += 1
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+            self._versiones.clear()
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            consultas = self._metricas["hits"] + self._metricas["misses"]
+            return {
+                "habilitada": self.habilitada,
+                "ttl_segundos": self.ttl,
+                "max_entradas": self.max_size,
+                "entradas": len(self._datos),
+                **self._metricas,
+                "tasa_aciertos": round(self._metricas["hits"] / consultas, 4) if consultas else 0.0,
+            }
+
+
+# Instancia global por proceso
+cache_usuarios = CacheUsuarios()
+
+
+def invalidar_usuario(username: str):
+    """Invalida el usuario en caché tras modificarlo o desactivarlo"""
+    cache_usuarios.invalidar(username)
+
+
+async def notificar_cambio_usuario(cur, username: str):
+    """Avisa del cambio a las demás réplicas (se entrega al hacer commit)"""
+    await publicar(cur, USUARIOS_CANAL, username)
+
+
+# ==================== ÉPOCAS DE REVOCACIÓN ====================
+
+class RegistroRevocaciones:
+    """
+    Épocas de revocación por usuario, usadas en modo claims.
+
+    Un token es válido si su claim `epoch` es >= a la época conocida del
+    usuario y el usuario no está inactivo. El registro se refresca desde la
+    BD como máximo cada `intervalo` segundos (una sola consulta por proceso,
+    solo de usuarios revocados o inactivos) y se actualiza al instante
+    cuando el cambio se hace desde este mismo proceso; un aviso de otra
+    réplica adelanta el refresco.
+
+    Las épocas solo avanzan: el refresco se combina con lo conocido
+    tomando la mayor por usuario, así una lectura que empezó antes de una
+    revocación local no la deshace. El estado activo acompaña a la época
+    (cambiarlo la incrementa) y se toma de la más reciente.
+    """
+
+    def __init__(self, intervalo: float = AUTH_EPOCH_REFRESH_SECONDS):
+        self.intervalo = intervalo
+        self._epocas = {}  # username -> época mínima válida
+        self._inactivos = set()
+        self._actualizado_en = 0.0
+        self._lock = asyncio.Lock()
+
+    async def refrescar_si_vencido(self):
+        if time.monotonic() - self._actualizado_en < self.intervalo:
+            return
+        async with self._lock:
+            if time.monotonic() - self._actualizado_en < self.intervalo:
+                return
+            async with async_db_connection() as conn:
+                async with conn.cursor() as cur:
+                    await cur.execute("""
+                        SELECT username, token_epoch, activo
+                        FROM public.usuarios
+                        WHERE token_epoch > 0 OR activo = FALSE
+                    """)
+                    rows = await cur.fetchall()
+            for row in rows:
+                self.combinar(row['username'], row['token_epoch'], row['activo'])
+            self._actualizado_en = time.monotonic()
+
+    def combinar(self, username: str, epoca: int, activo: bool = True):
+        """Incorpora el estado de un usuario salvo que ya se conozca uno más reciente"""
+        conocida = self._epocas.get(username, 0)
+        if epoca < conocida:
+            return
+        self._epocas[username] = epoca
+        if activo:
+            self._inactivos.discard(username)
+        else:
+            self._inactivos.add(username)
+
+    def revocar(self, username: str, epoca: int, activo: bool = True):
+        """Aplica un cambio local sin esperar al próximo refresco"""
+        self.combinar(username, epoca, activo)
+
+    def es_valido(self, username: str, epoca: int) -> bool:
+        if username in self._inactivos:
+            return False
+        return epoca >= self._epocas.get(username, 0)
+
+    def vencer(self):
+        """Fuerza el refresco en la próxima validación (cambio en otra réplica)"""
+        self._actualizado_en = 0.0
+
+
+# Instancia global por proceso
+revocaciones = RegistroRevocaciones()
+
+
+def _aviso_usuario(username: str):
+    cache_usuarios.invalidar(username)
+    revocaciones.vencer()
+
+
+if cache_usuarios.habilitada or AUTH_CLAIMS_MODE:
+    escucha_avisos.suscribir(
+        USUARIOS_CANAL, _aviso_usuario,
+        al_conectar=cache_usuarios.limpiar, al_desconectar=cache_usuarios.limpiar
+    )
 
 
 # ==================== GESTIÓN DE TOKENS JWT ====================
@@ -189,6 +475,20 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return token
 
 
+def claims_usuario(user: Usuario) -> dict:
+    """
+    Claims firmados del usuario para create_access_token.
+    Incluye lo necesario para autorizar sin consultar la BD (modo claims).
+    """
+    return {
+        "sub": user.username,
+        "rol": user.rol,
+        "user_id": user.id,
+        "documento_vinculado": user.documento_vinculado,
+        "epoch": user.token_epoch
+    }
+
+
 def decode_token(token: str) -> dict:
     """
     Decodifica y valida un token JWT
@@ -221,12 +521,39 @@ def decode_token(token: str) -> dict:
 
 # ==================== DEPENDENCIES PARA ENDPOINTS ====================
 
+async def _usuario_desde_payload(payload: dict) -> Usuario:
+    """Hidrata el usuario del token desde la caché o la BD"""
+    username: str = payload.get("sub")
+    if not username:
+        raise HTTPException(
+            status_code=401,
+            detail="Token inválido: falta información del usuario"
+        )
+
+    iat = payload.get("iat")
+    user = cache_usuarios.obtener(username, iat)
+    if user:
+        return user
+
+    version = cache_usuarios.version(username)
+    user = await get_user_by_username(username)
+    if not user:
+        raise HTTPException(
+            status_code=401,
+            detail="Usuario no encontrado o inactivo"
+        )
+
+    cache_usuarios.guardar(username, iat, user, version)
+    return user
+
+
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security)
 ) -> Usuario:
     """
     Dependency que obtiene el usuario actual desde el token JWT.
-    Valida el token y retorna el usuario autenticado.
+    Valida el token y retorna el usuario autenticado. Los usuarios ya
+    validados se sirven desde cache_usuarios sin consultar la BD.
 
     Args:
         credentials: Credenciales HTTP Bearer del header
@@ -237,24 +564,55 @@ async def get_current_user(
     Raises:
         HTTPException: Si el token es inválido o el usuario no existe
     """
-    token = credentials.credentials
-    payload = decode_token(token)
+    payload = decode_token(credentials.credentials)
+    return await _usuario_desde_payload(payload)
 
-    username: str = payload.get("sub")
+
+async def get_current_principal(
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+) -> Union[Usuario, UsuarioClaims]:
+    """
+    Dependency para autorización. En modo claims (AUTH_CLAIMS_MODE) y con
+    un token que trae rol/documento_vinculado/epoch, el usuario se arma
+    solo desde el token verificado, tras comprobar su época de revocación.
+    En otro caso se comporta como get_current_user.
+
+    Raises:
+        HTTPException 401: Si el token es inválido o fue revocado
+    """
+    payload = decode_token(credentials.credentials)
+
+    if not AUTH_CLAIMS_MODE or "rol" not in payload or "epoch" not in payload:
+        return await _usuario_desde_payload(payload)
+
+    username = payload.get("sub")
     if not username:
         raise HTTPException(
             status_code=401,
             detail="Token inválido: falta información del usuario"
         )
 
-    user = get_user_by_username(username)
-    if not user:
+    await revocaciones.refrescar_si_vencido()
+    if not revocaciones.es_valido(username, payload["epoch"]):
         raise HTTPException(
             status_code=401,
-            detail="Usuario no encontrado o inactivo"
+            detail="Token revocado. Por favor, inicie sesión nuevamente.",
+            headers={"WWW-Authenticate": "Bearer"}
         )
 
-    return user
+    try:
+        return UsuarioClaims(
+            id=payload.get("user_id"),
+            username=username,
+            rol=payload["rol"],
+            documento_vinculado=payload.get("documento_vinculado"),
+            token_epoch=payload["epoch"]
+        )
+    except ValueError:
+        raise HTTPException(
+            status_code=401,
+            detail="Token inválido: claims incorrectos"
+        )
 
 
 async def get_current_active_user(
@@ -271,6 +629,21 @@ async def get_current_active_user(
     return current_user
 
 
+async def get_current_active_principal(
+    current_user: Union[Usuario, UsuarioClaims] = Depends(get_current_principal)
+) -> Union[Usuario, UsuarioClaims]:
+    """
+    Como get_current_active_user, pero acepta usuarios armados desde claims
+    (sin consultar la tabla usuarios en modo claims)
+    """
+    if not current_user.activo:
+        raise HTTPException(
+            status_code=403,
+            detail="Usuario inactivo"
+        )
+    return current_user
+
+
 # ==================== CONTROL DE ACCESO POR ROLES ====================
 
 class RoleChecker:
@@ -282,12 +655,15 @@ class RoleChecker:
     def __init__(self, allowed_roles: List[str]):
         self.allowed_roles = allowed_roles
 
-    def __call__(self, current_user: Usuario = Depends(get_current_active_user)) -> Usuario:
+    def __call__(
+        self,
+        current_user: Union[Usuario, UsuarioClaims] = Depends(get_current_active_principal)
+    ) -> Union[Usuario, UsuarioClaims]:
         """
         Verifica que el usuario tenga uno de los roles permitidos
 
         Args:
-            current_user: Usuario actual autenticado
+            current_user: Usuario actual autenticado (o sus claims en modo claims)
 
         Returns:
             Usuario si tiene permiso
@@ -338,7 +714,7 @@ require_staff = lambda: require_role(
 
 # ==================== VERIFICACIÓN DE PERMISOS ====================
 
-def user_can_access_patient(user: Usuario, numero_documento: str) -> bool:
+def user_can_access_patient(user: Union[Usuario, UsuarioClaims], numero_documento: str) -> bool:
     """
     Verifica si un usuario puede acceder a un paciente específico.
 
@@ -367,8 +743,8 @@ def user_can_access_patient(user: Usuario, numero_documento: str) -> bool:
 
 def verify_patient_access(
     numero_documento: str,
-    current_user: Usuario = Depends(get_current_active_user)
-) -> Usuario:
+    current_user: Union[Usuario, UsuarioClaims] = Depends(get_current_active_principal)
+) -> Union[Usuario, UsuarioClaims]:
     """
     Dependency para verificar acceso a un paciente específico.
 
@@ -0,0 +1,116 @@
+# backend/project/app/avisos.py
+"""
+Avisos entre réplicas con LISTEN/NOTIFY
+Una sola conexión dedicada por proceso escucha todos los canales suscritos
+y despacha cada aviso a su manejador; las cachés en memoria la usan para
+enterarse de los cambios hechos por otras réplicas o por los scripts
+"""
+
+import os
+import asyncio
+from typing import Callable, Dict, List, Optional
+
+from app.database import conexion_dedicada
+
+AVISOS_PING_SECONDS = float(os.getenv("AVISOS_PING_SECONDS", 30))  # Verificar la escucha
+AVISOS_REINTENTO_SECONDS = float(os.getenv("AVISOS_REINTENTO_SECONDS", 5))
+
+
+class EscuchaAvisos:
+    """
+    Escucha de canales NOTIFY con reconexión automática.
+
+    Cada suscriptor registra su manejador de avisos y, opcionalmente,
+    funciones para el inicio y el fin de la escucha: mientras no hay
+    escucha los avisos se pierden, así que las cachés deben descartar lo
+    que tengan (o dejar de usarse) en ambos momentos.
+    """
+
+    def __init__(self):
+        self._manejadores: Dict[str, Callable[[str], None]] = {}
+        self._al_conectar: List[Callable[[], None]] = []
+        self._al_desconectar: List[Callable[[], None]] = []
+        self._escuchando = False
+        self._tarea: Optional[asyncio.Task] = None
+        self._metricas = {"avisos": 0, "reconexiones": 0}
+
+    @property
+    def escuchando(self) -> bool:
+        return self._escuchando
+
+    def suscribir(
+        self,
+        canal: str,
+        al_aviso: Callable[[str], None],
+        al_conectar: Optional[Callable[[], None]] = None,
+        al_desconectar: Optional[Callable[[], None]] = None
+    ):
+        """Registra un canal; debe llamarse antes de iniciar()"""
+        self._manejadores[canal] = al_aviso
+        if al_conectar:
+            self._al_conectar.append(al_conectar)
+        if al_desconectar:
+            self._al_desconectar.append(al_desconectar)
+
+    async def _escuchar(self):
+        while True:
+            try:
+                conn = await conexion_dedicada()
+                try:
+                    for canal in self._manejadores:
+                        await conn.execute(f"LISTEN {canal}")
+                    self._escuchando = True
+                    for funcion in self._al_conectar:
+                        funcion()
+                    while True:
+                        async for aviso in conn.notifies(timeout=AVISOS_PING_SECONDS):
+                            self._metricas["avisos"] += 1
+                            manejador = self._manejadores.get(aviso.channel)
+                            if manejador:
+                                manejador(aviso.payload)
+                        # Sin avisos en el intervalo: confirmar que la conexión sigue viva
+                        await conn.execute("SELECT 1")
+                finally:
+                    self._escuchando = False
+                    for funcion in self._al_desconectar:
+                        funcion()
+                    await conn.close()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._metricas["reconexiones"] += 1
+                print(f"Escucha de avisos interrumpida: {e}")
+            await asyncio.sleep(AVISOS_REINTENTO_SECONDS)
+
+    def iniciar(self):
+        if self._tarea is None and self._manejadores:
+            self._tarea = asyncio.create_task(self._escuchar())
+
+    async def detener(self):
+        if self._tarea is not None:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
+
+    def estadisticas(self) -> Dict:
+        return {
+            "escuchando": self._escuchando,
+            "canales": list(self._manejadores),
+            **self._metricas,
+        }
+
+
+# Instancia global por proceso
+escucha_avisos = EscuchaAvisos()
+
+
+async def publicar(cur, canal: str, payload: str):
+    """
+    Publica el aviso en la transacción de escritura (se entrega al hacer
+    commit, y no se entrega si hay rollback)
+    """
+    await cur.execute("SELECT pg_notify(%s, %s)", (canal, payload))
+
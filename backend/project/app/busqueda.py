@@ -0,0 +1,85 @@
+# backend/project/app/busqueda.py
+"""
+Búsqueda de pacientes respaldada por índices de trigramas (pg_trgm)
+Ver infra/initdb/11_busqueda_trigram.sql
+"""
+
+import unicodedata
+from typing import List, Optional, Tuple
+
+# Expresión indexada (idx_pacientes_nombre_trgm): debe coincidir literalmente
+EXPR_NOMBRE = (
+    "public.nombre_busqueda(primer_nombre, segundo_nombre, primer_apellido, segundo_apellido)"
+)
+
+
+def normalizar(texto: str) -> str:
+    """
+    Minúsculas y sin tildes, equivalente a public.normalizar_texto() en SQL
+    ('José Muñoz' -> 'jose munoz')
+    """
+    descompuesto = unicodedata.normalize("NFKD", texto)
+    sin_tildes = "".join(c for c in descompuesto if not unicodedata.combining(c))
+    return " ".join(sin_tildes.lower().split())
+
+
+def _patron_contiene(texto: str) -> str:
+    """Patrón LIKE '%texto%' escapando los comodines del usuario"""
+    escapado = texto.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escapado}%"
+
+
+def construir_busqueda(
+    nombre: Optional[str],
+    documento: Optional[str],
+    limit: int
+) -> Tuple[str, List]:
+    """
+    Construye la consulta de búsqueda de pacientes.
+
+    - nombre: cada palabra debe aparecer en alguno de los cuatro campos de
+      nombre (sin importar tildes ni mayúsculas), o el texto completo debe
+      ser similar por trigramas (tolera errores de digitación)
+    - documento: coincidencia parcial en numero_documento
+    - Orden: similitud con el nombre buscado y luego registro más reciente
+
+    Returns:
+        (query, params) listos para cursor.execute
+    """
+    conditions = ["activo = TRUE"]
+    params: List = []
+    orden = ["fecha_registro DESC"]
+    orden_params: List = []
+
+    if nombre:
+        consulta = normalizar(nombre)
+        palabras = consulta.split() or [consulta]
+        contiene = " AND ".join(f"{EXPR_NOMBRE} LIKE %s" for _ in palabras)
+        conditions.append(f"(({contiene}) OR %s <%% {EXPR_NOMBRE})")
+        params.extend(_patron_contiene(p) for p in palabras)
+        params.append(consulta)
+
+        orden.insert(0, f"word_similarity(%s, {EXPR_NOMBRE}) DESC")
+        orden_params.append(consulta)
+
+    if documento:
+        conditions.append("numero_documento ILIKE %s")
+        params.append(_patron_contiene(documento.strip()))
+
+    query = f"""
+        SELECT
+            id,
+            numero_documento,
+            CONCAT(primer_nombre, ' ', primer_apellido) as nombre_completo,
+            DATE_PART('year', AGE(fecha_nacimiento))::INTEGER as edad,
+            sexo,
+            tipo_atencion,
+            fecha_atencion,
+            nombre_profesional
+        FROM public.pacientes
+        WHERE {' AND '.join(conditions)}
+        ORDER BY {', '.join(orden)}
+        LIMIT %s
+    """
+
+    return query, params + orden_params + [limit]
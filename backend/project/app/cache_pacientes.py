@@ -0,0 +1,128 @@
+# backend/project/app/cache_pacientes.py
+"""
+Caché en memoria de filas de pacientes por numero_documento (LRU acotado)
+Cada réplica de la API escucha el canal NOTIFY de cambios de pacientes y
+descarta las filas modificadas; sin escucha activa la caché no se usa
+"""
+
+import os
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from app.avisos import escucha_avisos, publicar
+
+CACHE_PACIENTES_MAX = int(os.getenv("CACHE_PACIENTES_MAX", 5000))  # Filas por proceso
+CACHE_PACIENTES_CANAL = os.getenv("CACHE_PACIENTES_CANAL", "pacientes_cambios")
+
+# Documentos invalidados recientemente que se recuerdan para el control de lecturas en curso
+_MAX_INVALIDADOS = 10000
+
+
+class CachePacientes:
+    """
+    LRU de filas completas (`SELECT *`) de pacientes.
+
+    Una lectura toma `marca()` antes de consultar la base y llama a
+    `guardar(..., marca)` con el resultado: si el documento se invalidó
+    entretanto, la fila (posiblemente vieja) se descarta en lugar de
+    quedar en caché.
+    """
+
+    def __init__(self, maximo: int):
+        self.maximo = maximo
+        self._filas: "OrderedDict[str, dict]" = OrderedDict()
+        self._contador = 0  # Avanza con cada invalidación
+        self._invalidados: "OrderedDict[str, int]" = OrderedDict()  # documento -> contador
+        self._piso = 0  # Lecturas con marca anterior no se guardan (historial recortado)
+        self._escuchando = False
+        self._metricas = {"aciertos": 0, "fallos": 0, "invalidaciones": 0, "descartadas": 0}
+
+    @property
+    def activa(self) -> bool:
+        return self._escuchando and self.maximo > 0
+
+    # ---------- lectura / escritura ----------
+
+    def obtener(self, numero_documento: str) -> Optional[dict]:
+        if not self.activa:
+            return None
+        row = self._filas.get(numero_documento)
+        if row is None:
+            self._metricas["fallos"] += 1
+            return None
+        self._filas.move_to_end(numero_documento)
+        self._metricas["aciertos"] += 1
+        return dict(row)
+
+    def marca(self) -> int:
+        return self._contador
+
+    def guardar(self, numero_documento: str, row: dict, marca: int):
+        if not self.activa:
+            return
+        if marca < self._piso or self._invalidados.get(numero_documento, -1) > marca:
+            self._metricas["descartadas"] += 1
+            return
+        self._filas[numero_documento] = dict(row)
+        self._filas.move_to_end(numero_documento)
+        while len(self._filas) > self.maximo:
+            self._filas.popitem(last=False)
+
+    def invalidar(self, numero_documento: str):
+        self._contador += 1
+        self._filas.pop(numero_documento, None)
+        self._invalidados[numero_documento] = self._contador
+        self._invalidados.move_to_end(numero_documento)
+        while len(self._invalidados) > _MAX_INVALIDADOS:
+            _, contador = self._invalidados.popitem(last=False)
+            self._piso = contador + 1
+        self._metricas["invalidaciones"] += 1
+
+    def limpiar(self):
+        """Descarta todo, incluidas las lecturas en curso (avisos posiblemente perdidos)"""
+        self._contador += 1
+        self._piso = self._contador
+        self._filas.clear()
+        self._invalidados.clear()
+
+    # ---------- escucha de cambios ----------
+
+    def _conectada(self):
+        # Lo leído sin escuchar pudo perder avisos
+        self.limpiar()
+        self._escuchando = True
+
+    def _desconectada(self):
+        self._escuchando = False
+        self.limpiar()
+
+    def suscribir(self):
+        """Registra la caché en la escucha de avisos del proceso"""
+        if self.maximo > 0:
+            escucha_avisos.suscribir(
+                CACHE_PACIENTES_CANAL, self.invalidar,
+                al_conectar=self._conectada, al_desconectar=self._desconectada
+            )
+
+    def estadisticas(self) -> Dict:
+        consultas = self._metricas["aciertos"] + self._metricas["fallos"]
+        return {
+            "activa": self.activa,
+            "filas": len(self._filas),
+            "maximo": self.maximo,
+            **self._metricas,
+            "tasa_aciertos": round(self._metricas["aciertos"] / consultas, 3) if consultas else 0.0,
+        }
+
+
+cache_pacientes = CachePacientes(CACHE_PACIENTES_MAX)
+cache_pacientes.suscribir()
+
+
+async def notificar_cambio(cur, numero_documento: str):
+    """
+    Publica el cambio en la transacción de escritura (se entrega al hacer
+    commit). Con Citus los triggers corren en los shards de los workers,
+    cuyo NOTIFY no llega a quien escucha en el coordinador.
+    """
+    await publicar(cur, CACHE_PACIENTES_CANAL, numero_documento)
@@ -2,11 +2,24 @@
 """
 Módulo de conexión a PostgreSQL/Citus
 VERSIÓN CORREGIDA - Con mejor manejo de errores
+Incluye pool de conexiones compartido por todo el proceso:
+- Pool síncrono (psycopg2) para scripts y workers en segundo plano
+- Pool asíncrono (psycopg 3) para los endpoints de la API
 """
 
 import os
-from psycopg2 import connect, OperationalError
+import time
+import asyncio
+import threading
+import weakref
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+from psycopg2 import connect, OperationalError, extensions
 from psycopg2.extras import RealDictCursor
+from psycopg import AsyncConnection
+from psycopg.conninfo import make_conninfo
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool, PoolTimeout
 from dotenv import load_dotenv
 
 # Cargar variables de entorno
@@ -19,11 +32,22 @@ POSTGRES_DB = os.getenv("POSTGRES_DB", "historiaclinica")
 POSTGRES_USER = os.getenv("POSTGRES_USER", "postgres")
 POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD", "password")
 
+# Configuración del pool de conexiones
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", 1))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 10))  # Segundos esperando una conexión libre
+DB_POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", 1800))  # Reciclar tras 30 min
+DB_POOL_CHECK_IDLE = float(os.getenv("DB_POOL_CHECK_IDLE", 30))  # Verificar con SELECT 1 si estuvo ociosa
+
+
 def get_db_connection():
     """
     Establece conexión con la base de datos Citus/PostgreSQL.
     Retorna una conexión con RealDictCursor por defecto.
 
+    Nota: abre una conexión nueva en cada llamada. Los endpoints deben
+    usar db_connection(), que toma la conexión del pool del proceso.
+
     Raises:
         RuntimeError: Si no se puede conectar a la base de datos
     """
@@ -52,6 +76,426 @@ def get_db_connection():
     except Exception as e:
         raise RuntimeError(f"Error inesperado al conectar: {str(e)}")
 
+
+# ==================== POOL DE CONEXIONES ====================
+
+class PoolConexiones:
+    """
+    Pool de conexiones psycopg2 seguro para hilos.
+
+    - Mantiene entre `minimo` y `maximo` conexiones abiertas
+    - Verifica la conexión al entregarla (cerrada, transacción colgada,
+      SELECT 1 si estuvo ociosa más de `verificar_ociosa` segundos)
+    - Recicla conexiones que superan `vida_maxima` segundos
+    - Registra tiempos de espera y conexiones en uso como métricas
+    """
+
+    def __init__(
+        self,
+        minimo: int = DB_POOL_MIN,
+        maximo: int = DB_POOL_MAX,
+        timeout: float = DB_POOL_TIMEOUT,
+        vida_maxima: float = DB_POOL_MAX_LIFETIME,
+        verificar_ociosa: float = DB_POOL_CHECK_IDLE,
+        fabrica=get_db_connection
+    ):
+        if minimo < 0 or maximo < 1 or minimo > maximo:
+            raise ValueError("Configuración de pool inválida (0 <= min <= max, max >= 1)")
+
+        self.minimo = minimo
+        self.maximo = maximo
+        self.timeout = timeout
+        self.vida_maxima = vida_maxima
+        self.verificar_ociosa = verificar_ociosa
+        self._fabrica = fabrica
+
+        self._cond = threading.Condition()
+        self._libres = deque()  # (conn, creada_en, devuelta_en)
+        self._creadas = {}  # id(conn) -> creada_en
+        self._en_uso = 0
+        self._abriendo = 0  # Conexiones reservadas que se están abriendo fuera del lock
+        self._cerrado = False
+
+        self._metricas = {
+            "prestamos": 0,
+            "esperas": 0,
+            "espera_total_ms": 0.0,
+            "espera_max_ms": 0.0,
+            "timeouts": 0,
+            "conexiones_creadas": 0,
+            "conexiones_recicladas": 0,
+            "conexiones_descartadas": 0,
+        }
+
+        for _ in range(minimo):
+            conn = self._crear()
+            self._libres.append((conn, self._creadas[id(conn)], time.monotonic()))
+
+    # ---------- ciclo de vida de conexiones ----------
+
+    def _crear(self):
+        conn = self._fabrica()
+        self._creadas[id(conn)] = time.monotonic()
+        self._metricas["conexiones_creadas"] += 1
+        return conn
+
+    def _descartar(self, conn):
+        self._creadas.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _es_valida(self, conn, creada_en: float, devuelta_en: float) -> bool:
+        """Health check al momento de entregar la conexión (fuera del lock)"""
+        ahora = time.monotonic()
+
+        if conn.closed:
+            return False
+
+        if self.vida_maxima and ahora - creada_en > self.vida_maxima:
+            with self._cond:
+                self._metricas["conexiones_recicladas"] += 1
+            return False
+
+        if ahora - devuelta_en > self.verificar_ociosa:
+            try:
+                cur = conn.cursor()
+                cur.execute("SELECT 1")
+                cur.close()
+                conn.rollback()
+            except Exception:
+                return False
+
+        return True
+
+    # ---------- préstamo y devolución ----------
+
+    def _reservar(self, inicio: float, limite: float):
+        """
+        Espera (con el lock tomado) hasta conseguir una conexión libre o un
+        cupo para abrir una nueva. Retorna (conn, creada_en, devuelta_en, espero)
+        o (None, None, None, espero) si hay que abrirla; `espero` indica si
+        hubo que esperar a que se liberara una conexión.
+        """
+        espero = False
+        while True:
+            if self._cerrado:
+                raise RuntimeError("El pool de conexiones está cerrado")
+
+            if self._libres:
+                return self._libres.pop() + (espero,)
+
+            if len(self._creadas) + self._abriendo < self.maximo:
+                self._abriendo += 1
+                return None, None, None, espero
+
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                self._metricas["timeouts"] += 1
+                raise RuntimeError(
+                    f"Timeout esperando conexión del pool "
+                    f"({self.timeout}s, {self.maximo} conexiones en uso)"
+                )
+            espero = True
+            self._cond.wait(restante)
+
+    def _abrir(self):
+        """Abre una conexión nueva sobre un cupo ya reservado"""
+        try:
+            conn = self._fabrica()
+        except Exception:
+            with self._cond:
+                self._abriendo -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._abriendo -= 1
+            self._creadas[id(conn)] = time.monotonic()
+            self._metricas["conexiones_creadas"] += 1
+        return conn
+
+    def obtener(self):
+        """
+        Toma una conexión del pool, esperando hasta `timeout` segundos.
+
+        Raises:
+            RuntimeError: Si el pool está cerrado, se agota el tiempo de
+                espera o no se puede abrir una conexión nueva
+        """
+        inicio = time.monotonic()
+        limite = inicio + self.timeout
+        espero = False
+
+        while True:
+            with self._cond:
+                conn, creada_en, devuelta_en, espero_ahora = self._reservar(inicio, limite)
+            espero = espero or espero_ahora
+
+            if conn is None:
+                conn = self._abrir()
+                break
+
+            if self._es_valida(conn, creada_en, devuelta_en):
+                break
+
+            with self._cond:
+                self._descartar(conn)
+                self._metricas["conexiones_descartadas"] += 1
+                self._cond.notify()
+
+        espera_ms = (time.monotonic() - inicio) * 1000
+        with self._cond:
+            self._en_uso += 1
+            self._metricas["prestamos"] += 1
+            if espero:
+                self._metricas["esperas"] += 1
+            self._metricas["espera_total_ms"] += espera_ms
+            self._metricas["espera_max_ms"] = max(self._metricas["espera_max_ms"], espera_ms)
+
+        return conn
+
+    def devolver(self, conn, descartar: bool = False):
+        """Devuelve una conexión al pool, dejando la sesión limpia"""
+        if not descartar and not conn.closed:
+            try:
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                descartar = True
+
+        with self._cond:
+            self._en_uso -= 1
+            creada_en = self._creadas.get(id(conn))
+            if descartar or conn.closed or self._cerrado or creada_en is None:
+                if descartar or conn.closed:
+                    self._metricas["conexiones_descartadas"] += 1
+                self._descartar(conn)
+            else:
+                self._libres.append((conn, creada_en, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def conexion(self):
+        """
+        Context manager para usar una conexión del pool.
+        Hace rollback si el bloque lanza una excepción y siempre la devuelve.
+        """
+        conn = self.obtener()
+        try:
+            yield conn
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            raise
+        finally:
+            self.devolver(conn)
+
+    def cerrar(self):
+        """Cierra todas las conexiones libres; las prestadas se cierran al devolverse"""
+        with self._cond:
+            self._cerrado = True
+            while self._libres:
+                conn, _, _ = self._libres.pop()
+                self._descartar(conn)
+            self._cond.notify_all()
+
+    def estadisticas(self) -> dict:
+        """Métricas del pool: conexiones en uso/libres y tiempos de espera"""
+        with self._cond:
+            prestamos = self._metricas["prestamos"]
+            return {
+                "minimo": self.minimo,
+                "maximo": self.maximo,
+                "abiertas": len(self._creadas),
+                "en_uso": self._en_uso,
+                "libres": len(self._libres),
+                "prestamos": prestamos,
+                "esperas": self._metricas["esperas"],
+                "espera_promedio_ms": round(self._metricas["espera_total_ms"] / prestamos, 3) if prestamos else 0.0,
+                "espera_max_ms": round(self._metricas["espera_max_ms"], 3),
+                "timeouts": self._metricas["timeouts"],
+                "conexiones_creadas": self._metricas["conexiones_creadas"],
+                "conexiones_recicladas": self._metricas["conexiones_recicladas"],
+                "conexiones_descartadas": self._metricas["conexiones_descartadas"],
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> PoolConexiones:
+    """Retorna el pool del proceso, creándolo en el primer uso"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = PoolConexiones()
+    return _pool
+
+
+@contextmanager
+def db_connection():
+    """
+    Toma una conexión del pool del proceso.
+
+    Uso:
+        with db_connection() as conn:
+            cur = conn.cursor()
+            ...
+            conn.commit()
+    """
+    with get_pool().conexion() as conn:
+        yield conn
+
+
+def close_pool():
+    """Cierra el pool del proceso (al apagar la aplicación)"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.cerrar()
+            _pool = None
+
+
+def get_pool_stats() -> dict:
+    """Métricas del pool, o estado vacío si aún no se ha creado"""
+    if _pool is None:
+        return {"estado": "sin_inicializar", "maximo": DB_POOL_MAX}
+    return _pool.estadisticas()
+
+
+# ==================== POOL ASÍNCRONO (API) ====================
+
+_async_pool = None
+_async_pool_lock = asyncio.Lock()
+_devueltas = weakref.WeakKeyDictionary()  # conexión -> momento en que volvió al pool
+
+
+async def _marcar_devuelta(conn):
+    """Callback `reset` del pool: registra cuándo quedó ociosa la conexión"""
+    _devueltas[conn] = time.monotonic()
+
+
+async def _verificar_conexion(conn):
+    """
+    Callback `check` del pool: SELECT 1 solo si la conexión estuvo
+    ociosa más de DB_POOL_CHECK_IDLE (evita un round trip por préstamo)
+    """
+    devuelta_en = _devueltas.get(conn)
+    if devuelta_en is not None and time.monotonic() - devuelta_en <= DB_POOL_CHECK_IDLE:
+        return
+    await conn.execute("SELECT 1")
+    await conn.rollback()
+
+
+def _conninfo_async() -> str:
+    return make_conninfo(
+        host=POSTGRES_HOST,
+        port=POSTGRES_PORT,
+        dbname=POSTGRES_DB,
+        user=POSTGRES_USER,
+        password=POSTGRES_PASSWORD,
+        connect_timeout=5
+    )
+
+
+async def open_async_pool() -> AsyncConnectionPool:
+    """Crea y abre el pool asíncrono del proceso (idempotente)"""
+    global _async_pool
+    async with _async_pool_lock:
+        if _async_pool is None:
+            pool = AsyncConnectionPool(
+                _conninfo_async(),
+                kwargs={"row_factory": dict_row},
+                min_size=DB_POOL_MIN,
+                max_size=DB_POOL_MAX,
+                timeout=DB_POOL_TIMEOUT,
+                max_lifetime=DB_POOL_MAX_LIFETIME,
+                check=_verificar_conexion,
+                reset=_marcar_devuelta,
+                name="api",
+                open=False
+            )
+            await pool.open()
+            _async_pool = pool
+    return _async_pool
+
+
+async def close_async_pool():
+    """Cierra el pool asíncrono (al apagar la aplicación)"""
+    global _async_pool
+    async with _async_pool_lock:
+        if _async_pool is not None:
+            await _async_pool.close()
+            _async_pool = None
+
+
+@asynccontextmanager
+async def async_db_connection():
+    """
+    Toma una conexión del pool asíncrono. Las filas se retornan como dict.
+
+    Uso:
+        async with async_db_connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(...)
+                row = await cur.fetchone()
+            await conn.commit()
+
+    Raises:
+        RuntimeError: Si no se obtiene una conexión a tiempo
+    """
+    pool = _async_pool or await open_async_pool()
+    try:
+        async with pool.connection() as conn:
+            yield conn
+    except PoolTimeout as e:
+        raise RuntimeError(f"Timeout esperando conexión del pool ({DB_POOL_TIMEOUT}s): {e}")
+
+
+async def conexion_dedicada() -> AsyncConnection:
+    """
+    Conexión asíncrona propia, fuera del pool y en autocommit, para tareas
+    que la retienen indefinidamente (LISTEN). El llamador la cierra.
+    Los keepalives TCP detectan un servidor caído aunque no haya tráfico.
+    """
+    return await AsyncConnection.connect(
+        _conninfo_async(),
+        autocommit=True,
+        row_factory=dict_row,
+        keepalives=1,
+        keepalives_idle=30,
+        keepalives_interval=10,
+        keepalives_count=3
+    )
+
+
+def get_async_pool_stats() -> dict:
+    """Métricas del pool asíncrono con el mismo formato que el síncrono"""
+    if _async_pool is None:
+        return {"estado": "sin_inicializar", "maximo": DB_POOL_MAX}
+    stats = _async_pool.get_stats()
+    solicitudes = stats.get("requests_num", 0)
+    return {
+        "minimo": _async_pool.min_size,
+        "maximo": _async_pool.max_size,
+        "abiertas": stats.get("pool_size", 0),
+        "en_uso": stats.get("pool_size", 0) - stats.get("pool_available", 0),
+        "libres": stats.get("pool_available", 0),
+        "prestamos": solicitudes,
+        "esperando": stats.get("requests_waiting", 0),
+        "esperas": stats.get("requests_queued", 0),
+        "espera_promedio_ms": round(stats.get("requests_wait_ms", 0) / solicitudes, 3) if solicitudes else 0.0,
+        "timeouts": stats.get("requests_errors", 0),
+        "conexiones_creadas": stats.get("connections_num", 0),
+        "conexiones_perdidas": stats.get("connections_lost", 0),
+    }
+
+
 def test_connection():
     """
     Función de utilidad para probar la conexión.
@@ -81,7 +525,8 @@ def get_connection_info():
         "port": POSTGRES_PORT,
         "database": POSTGRES_DB,
         "user": POSTGRES_USER,
-        "password_set": bool(POSTGRES_PASSWORD)
+        "password_set": bool(POSTGRES_PASSWORD),
+        "pool": {"min": DB_POOL_MIN, "max": DB_POOL_MAX, "max_lifetime": DB_POOL_MAX_LIFETIME}
     }
 
 if __name__ == "__main__":
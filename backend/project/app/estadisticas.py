@@ -0,0 +1,540 @@
+# backend/project/app/estadisticas.py
+"""
+Estadísticas pre-agregadas de pacientes (tabla public.estadisticas_pacientes)
+Los endpoints de escritura agregan deltas en su misma transacción a
+public.estadisticas_pacientes_deltas; los workers los consolidan en el
+rollup y un proceso de reconciliación corrige cualquier desvío contra
+public.pacientes
+"""
+
+import os
+from collections import Counter, OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.avisos import escucha_avisos, publicar
+
+ESTADISTICAS_RECONCILIAR_SECONDS = float(os.getenv("ESTADISTICAS_RECONCILIAR_SECONDS", 3600))
+ESTADISTICAS_CONSOLIDAR_SECONDS = float(os.getenv("ESTADISTICAS_CONSOLIDAR_SECONDS", 30))  # Deltas -> rollup
+ESTADISTICAS_RECONCILIAR_DIAS = int(os.getenv("ESTADISTICAS_RECONCILIAR_DIAS", 31))  # Días por transacción
+ACTIVIDAD_MAX_PERIODOS = int(os.getenv("ACTIVIDAD_MAX_PERIODOS", 400))  # Periodos por consulta
+ACTIVIDAD_CACHE_MAX = int(os.getenv("ACTIVIDAD_CACHE_MAX", 20000))  # Periodos cerrados en memoria
+ACTIVIDAD_CANAL = os.getenv("ACTIVIDAD_CANAL", "actividad_cambios")  # Avisos de fechas modificadas
+
+DIMENSIONES = ("tipo_atencion", "sexo", "regimen_afiliacion")
+
+# Columnas previas que retornan UPDATE ... FROM (SELECT ...) AS anterior
+COLUMNAS_ANTERIOR = ", ".join(
+    f"anterior.{columna} AS anterior_{columna}"
+    for columna in ("fecha_registro", "activo", "fecha_atencion") + DIMENSIONES
+)
+
+_LLAVE_RECONCILIACION = "estadisticas_pacientes"
+
+Clave = Tuple[date, str, str, str]
+
+
+# ==================== DELTAS ====================
+
+def _clave(row: dict) -> Optional[Clave]:
+    """Celda del rollup a la que cuenta una fila (None si no cuenta)"""
+    if not row or row.get("activo") is False:
+        return None
+    dia = row.get("fecha_registro") or datetime.now()
+    if isinstance(dia, datetime):
+        dia = dia.date()
+    return (dia,) + tuple(row.get(d) or "" for d in DIMENSIONES)
+
+
+def separar_anterior(row: dict) -> Tuple[dict, dict]:
+    """Separa una fila RETURNING p.*, anterior_* en (nueva, anterior)"""
+    nueva, anterior = {}, {}
+    for columna, valor in row.items():
+        if columna.startswith("anterior_"):
+            anterior[columna[len("anterior_"):]] = valor
+        else:
+            nueva[columna] = valor
+    return nueva, anterior
+
+
+def calcular_deltas(anterior: Optional[dict], nueva: Optional[dict]) -> List[Tuple[Clave, int]]:
+    """
+    Cambios del rollup al pasar de `anterior` a `nueva` (None = no existe),
+    ordenados por clave.
+    """
+    return calcular_deltas_lote([(anterior, nueva)])
+
+
+def calcular_deltas_lote(cambios_filas: Iterable[Tuple[Optional[dict], Optional[dict]]]) -> List[Tuple[Clave, int]]:
+    """Deltas acumulados de varios cambios (anterior, nueva), p. ej. una importación"""
+    cambios: Counter = Counter()
+    for anterior, nueva in cambios_filas:
+        clave_anterior, clave_nueva = _clave(anterior), _clave(nueva)
+        if clave_anterior:
+            cambios[clave_anterior] -= 1
+        if clave_nueva:
+            cambios[clave_nueva] += 1
+    return sorted((clave, delta) for clave, delta in cambios.items() if delta)
+
+
+def _parametros(deltas: List[Tuple[Clave, int]]) -> tuple:
+    columnas = list(zip(*[clave + (delta,) for clave, delta in deltas]))
+    return tuple(list(c) for c in columnas)
+
+
+# Solo agrega filas: las altas concurrentes del mismo día no se esperan
+# entre sí, como pasaría actualizando la misma fila del rollup
+SQL_APLICAR_DELTAS = """
+    INSERT INTO public.estadisticas_pacientes_deltas
+        (dia, tipo_atencion, sexo, regimen_afiliacion, delta)
+    SELECT * FROM unnest(%s::date[], %s::text[], %s::text[], %s::text[], %s::bigint[])
+"""
+
+# Pasa los deltas visibles al rollup en una sola sentencia. Dos workers a
+# la vez no duplican: el segundo espera las filas que borra el primero y
+# luego las omite
+SQL_CONSOLIDAR = """
+    WITH movidos AS (
+        DELETE FROM public.estadisticas_pacientes_deltas
+        RETURNING dia, tipo_atencion, sexo, regimen_afiliacion, delta
+    )
+    INSERT INTO public.estadisticas_pacientes AS e
+        (dia, tipo_atencion, sexo, regimen_afiliacion, total)
+    SELECT dia, tipo_atencion, sexo, regimen_afiliacion, SUM(delta)
+    FROM movidos
+    GROUP BY dia, tipo_atencion, sexo, regimen_afiliacion
+    ON CONFLICT (dia, tipo_atencion, sexo, regimen_afiliacion)
+    DO UPDATE SET total = e.total + EXCLUDED.total
+"""
+
+
+async def aplicar_deltas(cur, deltas: List[Tuple[Clave, int]]):
+    """Registra los deltas con el cursor de la transacción de escritura (antes del commit)"""
+    if deltas:
+        await cur.execute(SQL_APLICAR_DELTAS, _parametros(deltas))
+
+
+def aplicar_deltas_sync(cur, deltas: List[Tuple[Clave, int]]):
+    """Igual que aplicar_deltas, para el pool síncrono (workers, scripts)"""
+    if deltas:
+        cur.execute(SQL_APLICAR_DELTAS, _parametros(deltas))
+
+
+def consolidar_estadisticas(db_connection) -> int:
+    """Suma los deltas pendientes al rollup; retorna cuántas celdas tocó"""
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(SQL_CONSOLIDAR)
+        celdas = cur.rowcount
+        conn.commit()
+        cur.close()
+    return celdas
+
+
+# ==================== LECTURA ====================
+
+# Rollup más deltas aún no consolidados
+SQL_TOTALES = """
+    SELECT COALESCE(SUM(total), 0)::bigint AS total_pacientes,
+           COALESCE(SUM(total) FILTER (WHERE dia = CURRENT_DATE), 0)::bigint AS consultas_hoy
+    FROM public.estadisticas_pacientes_vigentes
+"""
+
+SQL_POR_DIMENSION = """
+    SELECT {dimension}, SUM(total)::bigint AS cantidad
+    FROM public.estadisticas_pacientes_vigentes
+    WHERE {dimension} <> ''
+    GROUP BY {dimension}
+    HAVING SUM(total) > 0
+    ORDER BY cantidad DESC
+"""
+
+
+def consultas_resumen() -> List[Tuple[str, str]]:
+    """(nombre, SQL) de las consultas que arman el resumen de estadísticas"""
+    return [("totales", SQL_TOTALES)] + [
+        (dimension, SQL_POR_DIMENSION.format(dimension=dimension)) for dimension in DIMENSIONES
+    ]
+
+
+def armar_resumen(resultados: Dict[str, list]) -> dict:
+    """Resumen con las llaves que consume reportes.html / panel_admin.html"""
+    totales = resultados["totales"][0]
+    return {
+        "total_pacientes": totales["total_pacientes"],
+        "consultas_hoy": totales["consultas_hoy"],
+        "tipos_atencion": [dict(row) for row in resultados["tipo_atencion"]],
+        "por_sexo": [dict(row) for row in resultados["sexo"]],
+        "pacientes_por_genero": {row["sexo"]: row["cantidad"] for row in resultados["sexo"]},
+        "por_regimen": [dict(row) for row in resultados["regimen_afiliacion"]],
+    }
+
+
+# ==================== ACTIVIDAD POR PERIODO ====================
+
+GRANULARIDADES = {"dia": "day", "semana": "week", "mes": "month"}
+DIMENSIONES_ACTIVIDAD = ("tipo_atencion", "nombre_profesional", "estado_egreso")
+SIN_DATO = "(sin dato)"
+
+
+def inicio_periodo(dia: date, granularidad: str) -> date:
+    """Primer día del periodo que contiene `dia` (semanas ISO, desde el lunes)"""
+    if granularidad == "semana":
+        return dia - timedelta(days=dia.weekday())
+    if granularidad == "mes":
+        return dia.replace(day=1)
+    return dia
+
+
+def siguiente_periodo(inicio: date, granularidad: str) -> date:
+    if granularidad == "semana":
+        return inicio + timedelta(days=7)
+    if granularidad == "mes":
+        return (inicio + timedelta(days=32)).replace(day=1)
+    return inicio + timedelta(days=1)
+
+
+def contar_periodos(desde: date, hasta: date, granularidad: str) -> int:
+    """
+    Cantidad de periodos de periodos(desde, hasta) sin generarlos.
+    ValueError si el último periodo termina fuera de las fechas soportadas.
+    """
+    try:
+        siguiente_periodo(inicio_periodo(hasta, granularidad), granularidad)
+    except OverflowError:
+        raise ValueError("'hasta' está fuera del rango de fechas soportado")
+    if granularidad == "semana":
+        return (inicio_periodo(hasta, granularidad) - inicio_periodo(desde, granularidad)).days // 7 + 1
+    if granularidad == "mes":
+        return (hasta.year - desde.year) * 12 + hasta.month - desde.month + 1
+    return (hasta - desde).days + 1
+
+
+def periodos(desde: date, hasta: date, granularidad: str) -> List[date]:
+    """Inicios de los periodos completos que cubren [desde, hasta]"""
+    resultado = []
+    inicio = inicio_periodo(desde, granularidad)
+    while inicio <= hasta:
+        resultado.append(inicio)
+        inicio = siguiente_periodo(inicio, granularidad)
+    return resultado
+
+
+class CacheActividad:
+    """
+    Conteos por periodo ya cerrado (terminó antes de hoy), por granularidad
+    y dimensión. Un periodo cerrado solo cambia si se crea, edita o borra
+    una atención de esa fecha: toda escritura (API o importación por CLI)
+    publica las fechas en ACTIVIDAD_CANAL y cada réplica descarta esos
+    periodos; el proceso que escribe además invalida al instante. Sin
+    escucha de avisos activa la caché no se usa; los periodos abiertos
+    nunca se guardan.
+    """
+
+    def __init__(self, maximo: int):
+        self.maximo = maximo
+        self._periodos: "OrderedDict[Tuple[str, str, date], Dict[str, int]]" = OrderedDict()
+        self._contador = 0  # Avanza con cada invalidación
+        self._invalidados: "OrderedDict[Tuple[str, date], int]" = OrderedDict()  # periodo -> contador
+        self._piso = 0  # Lecturas con marca anterior no se guardan (historial recortado)
+        self._escuchando = False
+        self.aciertos = 0
+        self.fallos = 0
+
+    @property
+    def activa(self) -> bool:
+        return self._escuchando and self.maximo > 0
+
+    def obtener(self, granularidad: str, dimension: str, inicio: date) -> Optional[Dict[str, int]]:
+        if not self.activa:
+            return None
+        clave = (granularidad, dimension, inicio)
+        valores = self._periodos.get(clave)
+        if valores is None:
+            self.fallos += 1
+            return None
+        self._periodos.move_to_end(clave)
+        self.aciertos += 1
+        return valores
+
+    def marca(self) -> int:
+        return self._contador
+
+    def guardar(self, granularidad: str, dimension: str, inicio: date, valores: Dict[str, int], marca: int):
+        """Guarda el conteo salvo que el periodo se haya invalidado desde `marca` (lectura quizá vieja)"""
+        if not self.activa:
+            return
+        if marca < self._piso or self._invalidados.get((granularidad, inicio), -1) > marca:
+            return
+        self._periodos[(granularidad, dimension, inicio)] = valores
+        self._periodos.move_to_end((granularidad, dimension, inicio))
+        while len(self._periodos) > self.maximo:
+            self._periodos.popitem(last=False)
+
+    def invalidar(self, fechas: Iterable[Optional[datetime]]):
+        """Descarta los periodos que contienen alguna de las fechas de atención"""
+        self._contador += 1
+        for fecha in fechas:
+            if fecha is None:
+                continue
+            dia = fecha.date() if isinstance(fecha, datetime) else fecha
+            for granularidad in GRANULARIDADES:
+                inicio = inicio_periodo(dia, granularidad)
+                for dimension in DIMENSIONES_ACTIVIDAD:
+                    self._periodos.pop((granularidad, dimension, inicio), None)
+                self._invalidados[(granularidad, inicio)] = self._contador
+                self._invalidados.move_to_end((granularidad, inicio))
+        while len(self._invalidados) > self.maximo:
+            _, contador = self._invalidados.popitem(last=False)
+            self._piso = contador + 1
+
+    def limpiar(self):
+        """Descarta todo, incluidas las lecturas en curso (avisos posiblemente perdidos)"""
+        self._contador += 1
+        self._piso = self._contador
+        self._periodos.clear()
+        self._invalidados.clear()
+
+    # ---------- avisos entre réplicas ----------
+
+    def _aviso(self, payload: str):
+        if payload == "*":
+            self.limpiar()
+        else:
+            self.invalidar(date.fromisoformat(dia) for dia in payload.split(","))
+
+    def _conectada(self):
+        self.limpiar()
+        self._escuchando = True
+
+    def _desconectada(self):
+        self._escuchando = False
+        self.limpiar()
+
+    def suscribir(self):
+        """Registra la caché en la escucha de avisos del proceso"""
+        if self.maximo > 0:
+            escucha_avisos.suscribir(
+                ACTIVIDAD_CANAL, self._aviso,
+                al_conectar=self._conectada, al_desconectar=self._desconectada
+            )
+
+    def estadisticas(self) -> dict:
+        return {
+            "activa": self.activa,
+            "periodos": len(self._periodos),
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+        }
+
+
+cache_actividad = CacheActividad(ACTIVIDAD_CACHE_MAX)
+cache_actividad.suscribir()
+
+# Más fechas que esto en un aviso (límite de 8000 bytes del payload): se vacía todo
+_MAX_FECHAS_AVISO = 500
+
+
+async def notificar_actividad(cur, fechas: Iterable[Optional[datetime]]):
+    """Avisa en la transacción de escritura qué fechas de atención cambiaron"""
+    dias = sorted({
+        (fecha.date() if isinstance(fecha, datetime) else fecha).isoformat()
+        for fecha in fechas if fecha is not None
+    })
+    if dias:
+        await publicar(cur, ACTIVIDAD_CANAL, ",".join(dias) if len(dias) <= _MAX_FECHAS_AVISO else "*")
+
+
+def sql_actividad(granularidad: str, dimension: str) -> str:
+    """
+    Conteo por periodo y valor de la dimensión en un rango de fecha_atencion.
+    Citus agrega en cada shard (usando idx_pacientes_fecha_atencion para el
+    rango) y el coordinador solo suma los parciales.
+    """
+    return f"""
+        SELECT date_trunc('{GRANULARIDADES[granularidad]}', fecha_atencion)::date AS periodo,
+               {dimension} AS valor,
+               COUNT(*) AS cantidad
+        FROM public.pacientes
+        WHERE activo = TRUE AND fecha_atencion >= %s AND fecha_atencion < %s
+        GROUP BY 1, 2
+    """
+
+
+async def consultar_actividad(cur, desde: date, hasta: date, granularidad: str, dimension: str) -> dict:
+    """
+    Actividad por periodos completos entre `desde` y `hasta`. Solo consulta
+    la base para el tramo que va del primer periodo faltante en caché al
+    último; normalmente es solo el periodo en curso.
+    """
+    inicios = periodos(desde, hasta, granularidad)
+    hoy = date.today()
+    conteos: Dict[date, Dict[str, int]] = {}
+    faltantes = []
+    marca = cache_actividad.marca()
+    for inicio in inicios:
+        cerrado = siguiente_periodo(inicio, granularidad) <= hoy
+        valores = cache_actividad.obtener(granularidad, dimension, inicio) if cerrado else None
+        if valores is None:
+            faltantes.append(inicio)
+        else:
+            conteos[inicio] = valores
+
+    if faltantes:
+        await cur.execute(
+            sql_actividad(granularidad, dimension),
+            (faltantes[0], siguiente_periodo(faltantes[-1], granularidad))
+        )
+        nuevos: Dict[date, Dict[str, int]] = {inicio: {} for inicio in faltantes}
+        for row in await cur.fetchall():
+            if row["periodo"] in nuevos:
+                nuevos[row["periodo"]][row["valor"] or SIN_DATO] = row["cantidad"]
+        for inicio, valores in nuevos.items():
+            if siguiente_periodo(inicio, granularidad) <= hoy:
+                cache_actividad.guardar(granularidad, dimension, inicio, valores, marca)
+            conteos[inicio] = valores
+
+    return {
+        "granularidad": granularidad,
+        "dimension": dimension,
+        "desde": inicios[0].isoformat() if inicios else desde.isoformat(),
+        "hasta": (siguiente_periodo(inicios[-1], granularidad) - timedelta(days=1)).isoformat()
+        if inicios else hasta.isoformat(),
+        "periodos": [
+            {
+                "periodo": inicio.isoformat(),
+                "cerrado": siguiente_periodo(inicio, granularidad) <= hoy,
+                "total": sum(conteos[inicio].values()),
+                "valores": conteos[inicio],
+            }
+            for inicio in inicios
+        ],
+    }
+
+
+# ==================== RECONCILIACIÓN ====================
+
+_SQL_REAL = """
+    SELECT fecha_registro::date AS dia,
+           COALESCE(tipo_atencion, '') AS tipo_atencion,
+           COALESCE(sexo, '') AS sexo,
+           COALESCE(regimen_afiliacion, '') AS regimen_afiliacion,
+           COUNT(*) AS total
+    FROM public.pacientes
+    WHERE activo = TRUE AND fecha_registro >= %s AND fecha_registro < %s {filtro}
+    GROUP BY 1, 2, 3, 4
+"""
+
+_SQL_GUARDADO = """
+    SELECT dia, tipo_atencion, sexo, regimen_afiliacion, total
+    FROM public.estadisticas_pacientes_vigentes
+    WHERE dia >= %s AND dia < %s {filtro}
+"""
+
+
+def _diferencias(cur, inicio: date, fin: date, dias: Optional[List[date]] = None) -> List[Tuple[Clave, int]]:
+    """Deltas que llevan el rollup a los conteos reales en [inicio, fin), opcionalmente solo en `dias`"""
+    parametros = [inicio, fin] + ([dias] if dias else [])
+    cur.execute(
+        _SQL_REAL.format(filtro="AND fecha_registro::date = ANY(%s::date[])" if dias else ""), parametros
+    )
+    real = {
+        (r["dia"], r["tipo_atencion"], r["sexo"], r["regimen_afiliacion"]): r["total"]
+        for r in cur.fetchall()
+    }
+    cur.execute(_SQL_GUARDADO.format(filtro="AND dia = ANY(%s::date[])" if dias else ""), parametros)
+    guardado = {
+        (r["dia"], r["tipo_atencion"], r["sexo"], r["regimen_afiliacion"]): r["total"]
+        for r in cur.fetchall()
+    }
+    return sorted(
+        (clave, real.get(clave, 0) - guardado.get(clave, 0))
+        for clave in set(real) | set(guardado)
+        if real.get(clave, 0) != guardado.get(clave, 0)
+    )
+
+
+def reconciliar_estadisticas(db_connection, desde: Optional[date] = None) -> Optional[dict]:
+    """
+    Recalcula el rollup contra public.pacientes por tramos de días y corrige
+    las diferencias.
+
+    Primero consolida los deltas pendientes. Cada tramo se compara sin
+    bloquear nada, en una transacción REPEATABLE READ, contra el rollup
+    más los deltas. Solo los días con diferencias (normalmente ninguno) se
+    vuelven a contar en una transacción corta que detiene el registro de
+    deltas: las altas concurrentes esperan solo ese recuento. La corrección
+    se registra como un delta más.
+
+    Recibe la fábrica de conexiones síncronas (db_connection).
+
+    Solo un proceso reconcilia a la vez (advisory lock); si otro lo está
+    haciendo retorna None.
+    """
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT pg_try_advisory_lock(hashtext(%s)) AS ok", (_LLAVE_RECONCILIACION,))
+        if not cur.fetchone()["ok"]:
+            cur.close()
+            return None
+
+        corregidas = 0
+        tramos = 0
+        dias_recontados = 0
+        try:
+            cur.execute(SQL_CONSOLIDAR)
+            conn.commit()
+
+            if desde is None:
+                cur.execute("""
+                    SELECT LEAST(
+                        (SELECT MIN(fecha_registro)::date FROM public.pacientes),
+                        (SELECT MIN(dia) FROM public.estadisticas_pacientes)
+                    ) AS desde
+                """)
+                desde = cur.fetchone()["desde"]
+            conn.commit()
+
+            inicio = desde
+            hoy = date.today()
+            while inicio is not None and inicio <= hoy:
+                fin = inicio + timedelta(days=ESTADISTICAS_RECONCILIAR_DIAS)
+                tramos += 1
+
+                # Comparación sin bloqueo: una sola instantánea para pacientes y rollup
+                cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+                candidatos = sorted({clave[0] for clave, _ in _diferencias(cur, inicio, fin)})
+                conn.commit()
+
+                if candidatos:
+                    # Recuento de esos días con el registro de deltas detenido
+                    cur.execute("LOCK TABLE public.estadisticas_pacientes_deltas IN SHARE ROW EXCLUSIVE MODE")
+                    deltas = _diferencias(cur, inicio, fin, candidatos)
+                    aplicar_deltas_sync(cur, deltas)
+                    conn.commit()
+                    corregidas += len(deltas)
+                    dias_recontados += len(candidatos)
+
+                inicio = fin
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cur.execute("SELECT pg_advisory_unlock(hashtext(%s))", (_LLAVE_RECONCILIACION,))
+            conn.commit()
+            cur.close()
+
+    # Las correcciones pasan al rollup; las celdas que quedan en cero se quitan
+    consolidar_estadisticas(db_connection)
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM public.estadisticas_pacientes WHERE total = 0")
+        conn.commit()
+        cur.close()
+
+    return {
+        "celdas_corregidas": corregidas,
+        "tramos": tramos,
+        "dias_recontados": dias_recontados,
+        "desde": desde.isoformat() if desde else None,
+    }
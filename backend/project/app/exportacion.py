@@ -0,0 +1,223 @@
+# backend/project/app/exportacion.py
+"""
+Exportación masiva de historias clínicas en PDF como ZIP en streaming
+Los pacientes se leen por lotes, los PDFs se generan en paralelo en el pool
+de procesos y el ZIP se envía a medida que se arma, sin retenerlo en memoria
+"""
+
+import io
+import os
+import time
+import asyncio
+import zipfile
+from typing import AsyncIterator, List, Optional, Tuple
+
+from app.database import async_db_connection
+from app.models import ExportacionLote
+from app.pdf_generator import preparar_datos_pdf, calcular_edad, cache_pdf
+from app.pdf_workers import renderizar_pdf, RenderSaturado, PDF_WORKERS
+
+EXPORTACION_LOTE_TAMANO = int(os.getenv("EXPORTACION_LOTE_TAMANO", 20))  # Filas por consulta
+EXPORTACION_ESPERA_MAX = float(os.getenv("EXPORTACION_ESPERA_MAX", 60))  # Segundos esperando cupo de render
+
+
+# ==================== ZIP SIN SEEK ====================
+
+class _BufferZip(io.RawIOBase):
+    """
+    Destino no posicionable para zipfile: acumula lo escrito hasta que se
+    drena. zipfile detecta que no hay seek() y escribe descriptores de
+    datos después de cada archivo en lugar de reescribir cabeceras.
+    """
+
+    def __init__(self):
+        self._partes: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, datos) -> int:
+        self._partes.append(bytes(datos))
+        return len(datos)
+
+    def drenar(self) -> bytes:
+        datos = b"".join(self._partes)
+        self._partes = []
+        return datos
+
+
+# ==================== LECTURA POR LOTES ====================
+
+def _condiciones_filtro(solicitud: ExportacionLote):
+    conditions = ["activo = TRUE"]
+    params: list = []
+    if solicitud.tipo_atencion:
+        conditions.append("tipo_atencion = %s")
+        params.append(solicitud.tipo_atencion)
+    if solicitud.fecha_desde:
+        conditions.append("fecha_atencion >= %s")
+        params.append(solicitud.fecha_desde)
+    if solicitud.fecha_hasta:
+        conditions.append("fecha_atencion < %s::date + 1")
+        params.append(solicitud.fecha_hasta)
+    return conditions, params
+
+
+async def contar_pacientes(solicitud: ExportacionLote) -> int:
+    """Total a exportar (header X-Total-Pacientes)"""
+    if solicitud.documentos:
+        return len(dict.fromkeys(solicitud.documentos))
+
+    conditions, params = _condiciones_filtro(solicitud)
+    async with async_db_connection() as conn:
+        cur = conn.cursor()
+        await cur.execute(
+            f"SELECT COUNT(*) AS total FROM public.pacientes WHERE {' AND '.join(conditions)}",
+            params
+        )
+        row = await cur.fetchone()
+        await cur.close()
+    return min(row['total'], solicitud.limite)
+
+
+class SeleccionLotes:
+    """
+    Consultas por lotes de una exportación: los documentos indicados, de a
+    EXPORTACION_LOTE_TAMANO, o el filtro paginado por keyset
+    (fecha_registro, id) hasta `limite`. No ejecuta nada: la API la recorre
+    con el pool asíncrono y el worker de trabajos con el síncrono.
+    """
+
+    def __init__(self, solicitud: ExportacionLote):
+        self.solicitud = solicitud
+        self.tamano = EXPORTACION_LOTE_TAMANO
+        self.fallidos: List[str] = []  # Documentos pedidos que no se encontraron
+        self._documentos = list(dict.fromkeys(solicitud.documentos)) if solicitud.documentos else None
+        self._grupo: List[str] = []
+        self._posicion = 0
+        self._restantes = solicitud.limite
+        self._desde: Optional[Tuple] = None
+        self._terminado = False
+
+    def siguiente(self) -> Optional[Tuple[str, list]]:
+        """(query, params) del próximo lote, o None si no quedan"""
+        if self._terminado:
+            return None
+
+        if self._documentos is not None:
+            self._grupo = self._documentos[self._posicion:self._posicion + self.tamano]
+            if not self._grupo:
+                return None
+            # Citus envía a cada shard solo los documentos que le corresponden
+            return """
+                SELECT * FROM public.pacientes
+                WHERE numero_documento = ANY(%s) AND activo = TRUE
+            """, [self._grupo]
+
+        if self._restantes <= 0:
+            return None
+        conditions, params = _condiciones_filtro(self.solicitud)
+        if self._desde:
+            conditions.append("(fecha_registro, id) < (%s, %s)")
+            params.extend(self._desde)
+        params.append(min(self.tamano, self._restantes))
+        return f"""
+            SELECT * FROM public.pacientes
+            WHERE {' AND '.join(conditions)}
+            ORDER BY fecha_registro DESC, id DESC
+            LIMIT %s
+        """, params
+
+    def recibir(self, rows: List[dict]) -> List[dict]:
+        """Filas de la consulta anterior, en el orden en que se exportan"""
+        if self._documentos is not None:
+            self._posicion += len(self._grupo)
+            encontrados = {row['numero_documento']: row for row in rows}
+            self.fallidos.extend(f"{d}: no encontrado" for d in self._grupo if d not in encontrados)
+            return [encontrados[d] for d in self._grupo if d in encontrados]
+
+        if not rows:
+            self._terminado = True
+            return []
+        self._restantes -= len(rows)
+        self._desde = (rows[-1]['fecha_registro'], rows[-1]['id'])
+        return rows
+
+
+async def _lotes(seleccion: SeleccionLotes) -> AsyncIterator[List[dict]]:
+    """Filas completas de pacientes; una conexión del pool por consulta"""
+    while True:
+        consulta = seleccion.siguiente()
+        if consulta is None:
+            return
+        async with async_db_connection() as conn:
+            cur = conn.cursor()
+            await cur.execute(*consulta)
+            rows = await cur.fetchall()
+            await cur.close()
+        yield seleccion.recibir(rows)
+
+
+# ==================== RENDER ====================
+
+async def _pdf_paciente(row: dict, cupos: asyncio.Semaphore) -> bytes:
+    """PDF desde la caché en disco o generado en el pool de procesos"""
+    clave = cache_pdf.clave(
+        row['numero_documento'], row['ultima_actualizacion'], calcular_edad(row['fecha_nacimiento'])
+    )
+    ruta = cache_pdf.obtener(clave)
+    if ruta:
+        try:
+            with open(ruta, "rb") as f:
+                return await asyncio.to_thread(f.read)
+        except FileNotFoundError:
+            pass  # Desalojado entre la consulta y la lectura
+
+    datos = preparar_datos_pdf(row)
+    limite = time.monotonic() + EXPORTACION_ESPERA_MAX
+    async with cupos:
+        while True:
+            try:
+                pdf = await renderizar_pdf(datos)
+                break
+            except RenderSaturado:
+                # La exportación cede el pool a las descargas individuales
+                if time.monotonic() > limite:
+                    raise
+                await asyncio.sleep(0.5)
+
+    try:
+        await asyncio.to_thread(cache_pdf.guardar, clave, pdf)
+    except OSError:
+        pass
+    return pdf
+
+
+async def generar_zip(solicitud: ExportacionLote) -> AsyncIterator[bytes]:
+    """
+    Genera el ZIP por partes: cada lote se renderiza en paralelo y sus PDFs
+    se escriben (sin comprimir, ya lo están) y se envían antes del siguiente.
+    """
+    buffer = _BufferZip()
+    zf = zipfile.ZipFile(buffer, mode="w", compression=zipfile.ZIP_STORED)
+    cupos = asyncio.Semaphore(PDF_WORKERS)  # Renders simultáneos de esta exportación
+    seleccion = SeleccionLotes(solicitud)
+    fallidos = seleccion.fallidos
+
+    async for rows in _lotes(seleccion):
+        resultados = await asyncio.gather(
+            *[_pdf_paciente(row, cupos) for row in rows], return_exceptions=True
+        )
+        for row, resultado in zip(rows, resultados):
+            documento = row['numero_documento']
+            if isinstance(resultado, Exception):
+                fallidos.append(f"{documento}: {resultado}")
+            else:
+                info = zipfile.ZipInfo(f"HC_{documento}.pdf", date_time=time.localtime()[:6])
+                zf.writestr(info, resultado)
+            yield buffer.drenar()
+
+    if fallidos:
+        zf.writestr("errores.txt", "\n".join(fallidos) + "\n")
+    zf.close()
+    yield buffer.drenar()
@@ -0,0 +1,391 @@
+# backend/project/app/importacion.py
+"""
+Importación masiva de pacientes desde CSV o NDJSON
+Las filas se leen en streaming y se validan por lotes con PacienteCreate;
+las válidas se cargan con COPY a una tabla temporal y pasan a pacientes
+con un solo INSERT ... SELECT ... ON CONFLICT por lote
+
+Uso como CLI (desde backend/project):
+    python -m app.importacion pacientes.csv
+    python -m app.importacion pacientes.ndjson --formato ndjson
+"""
+
+import os
+import sys
+import csv
+import json
+import codecs
+import asyncio
+import argparse
+from collections import deque
+from datetime import datetime
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+from psycopg import errors as pg_errors
+from pydantic import ValidationError
+
+from app.database import async_db_connection, open_async_pool, close_async_pool
+from app.models import PacienteCreate
+from app.estadisticas import calcular_deltas_lote, aplicar_deltas, notificar_actividad
+from app.sugerencias import COLUMNAS_INDICE
+
+IMPORTACION_LOTE = int(os.getenv("IMPORTACION_LOTE", 5000))  # Filas por COPY / transacción
+IMPORTACION_MAX_ERRORES = int(os.getenv("IMPORTACION_MAX_ERRORES", 1000))  # Errores detallados en el reporte
+IMPORTACION_MAX_REGISTRO_KB = int(os.getenv("IMPORTACION_MAX_REGISTRO_KB", 64))  # Registro CSV de varias líneas
+
+FORMATOS = ("csv", "ndjson")
+
+
+class PacienteImportacion(PacienteCreate):
+    """Fila de importación: PacienteCreate más las fechas de la atención original"""
+    fecha_atencion: Optional[datetime] = None
+    fecha_cierre: Optional[datetime] = None
+
+
+COLUMNAS = tuple(PacienteImportacion.model_fields)
+
+# Columnas que retorna el INSERT: índice de sugerencias y rollup de estadísticas
+COLUMNAS_RETORNO = f"{COLUMNAS_INDICE}, regimen_afiliacion"
+
+
+# ==================== LECTURA EN STREAMING ====================
+
+async def _lineas(bloques: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Líneas de texto (UTF-8, con o sin BOM) a partir de bloques de bytes"""
+    decodificador = codecs.getincrementaldecoder("utf-8-sig")()
+    resto = ""
+    async for bloque in bloques:
+        texto = resto + decodificador.decode(bloque)
+        lineas = texto.split("\n")
+        resto = lineas.pop()
+        for linea in lineas:
+            yield linea + "\n"
+    resto += decodificador.decode(b"", final=True)
+    if resto:
+        yield resto
+
+
+def _termina_en_comillas(linea: str, en_comillas: bool) -> bool:
+    """
+    ¿La línea deja abierto un campo entre comillas? Misma regla que el
+    módulo csv: un campo está entre comillas solo si empieza con una, y
+    una comilla en medio de un campo sin comillas (O"Brien) es literal.
+    """
+    i, n = 0, len(linea)
+    while i < n:
+        if en_comillas:
+            j = linea.find('"', i)
+            if j < 0:
+                return True
+            if linea.startswith('"', j + 1):  # Comilla escapada ("")
+                i = j + 2
+                continue
+            en_comillas = False
+            i = j + 1
+        elif linea.startswith('"', i):
+            en_comillas = True
+            i += 1
+            continue
+        # Resto del campo sin comillas: hasta la próxima coma
+        j = linea.find(",", i)
+        if j < 0:
+            return False
+        i = j + 1
+    return en_comillas
+
+
+class _RegistrosCsv:
+    """
+    Arma registros CSV a partir de líneas. Un registro ocupa varias líneas
+    si un campo entre comillas tiene saltos de línea; si no se cierra en
+    `maximo` caracteres (o al terminar el archivo) se reporta como error en
+    su primera línea y las siguientes se vuelven a leer como registros.
+    """
+
+    def __init__(self, maximo: int):
+        self.maximo = maximo
+        self._pendiente: List[Tuple[int, str]] = []
+        self._tamano = 0
+        self._en_comillas = False
+
+    def agregar(self, numero: int, linea: str) -> List[Tuple[int, Optional[List[str]]]]:
+        """(línea de inicio, valores) de los registros completos; valores None si quedó sin cerrar"""
+        if not self._pendiente and '"' not in linea:
+            # Caso común: registro de una sola línea sin comillas
+            return [(numero, next(csv.reader([linea]), []))]
+        salida: List[Tuple[int, Optional[List[str]]]] = []
+        cola = deque([(numero, linea)])
+        while cola:
+            numero, linea = cola.popleft()
+            if self._en_comillas or '"' in linea:
+                self._en_comillas = _termina_en_comillas(linea, self._en_comillas)
+            self._pendiente.append((numero, linea))
+            self._tamano += len(linea)
+            if not self._en_comillas:
+                texto = "".join(parte for _, parte in self._pendiente)
+                salida.append((self._pendiente[0][0], next(csv.reader([texto]), [])))
+                self._reiniciar()
+            elif self._tamano > self.maximo:
+                cola.extendleft(reversed(self._descartar(salida)))
+        return salida
+
+    def terminar(self) -> List[Tuple[int, Optional[List[str]]]]:
+        """Registros que quedan al terminar el archivo"""
+        salida: List[Tuple[int, Optional[List[str]]]] = []
+        while self._pendiente:
+            for numero, linea in self._descartar(salida):
+                salida.extend(self.agregar(numero, linea))
+        return salida
+
+    def _descartar(self, salida: list) -> List[Tuple[int, str]]:
+        """Reporta el registro sin cerrar en su primera línea; retorna las demás para releerlas"""
+        pendiente = self._pendiente
+        salida.append((pendiente[0][0], None))
+        self._reiniciar()
+        return pendiente[1:]
+
+    def _reiniciar(self):
+        self._pendiente = []
+        self._tamano = 0
+        self._en_comillas = False
+
+
+async def _registros_csv(bloques: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, dict]]:
+    """(línea de inicio, dict) por registro CSV, con la primera fila como encabezado"""
+    lector = _RegistrosCsv(IMPORTACION_MAX_REGISTRO_KB * 1024)
+    encabezado = None
+
+    def convertir(registros: Iterable[Tuple[int, Optional[List[str]]]]):
+        nonlocal encabezado
+        for fila, valores in registros:
+            if valores is None:
+                yield fila, {"__error__": "Comillas sin cerrar: el registro que empieza en esta línea no termina"}
+            elif encabezado is None:
+                encabezado = [columna.strip() for columna in valores]
+            elif any(valores):
+                yield fila, {
+                    columna: (valor if valor != "" else None)
+                    for columna, valor in zip(encabezado, valores)
+                }
+
+    numero = 0
+    async for linea in _lineas(bloques):
+        numero += 1
+        for registro in convertir(lector.agregar(numero, linea)):
+            yield registro
+    for registro in convertir(lector.terminar()):
+        yield registro
+
+
+async def _registros_ndjson(bloques: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, dict]]:
+    fila = 0
+    async for linea in _lineas(bloques):
+        fila += 1
+        if not linea.strip():
+            continue
+        try:
+            registro = json.loads(linea)
+        except ValueError as e:
+            registro = {"__error__": f"JSON inválido: {e}"}
+        yield fila, registro if isinstance(registro, dict) else {"__error__": "Se esperaba un objeto JSON"}
+
+
+def leer_registros(bloques: AsyncIterator[bytes], formato: str) -> AsyncIterator[Tuple[int, dict]]:
+    if formato == "csv":
+        return _registros_csv(bloques)
+    return _registros_ndjson(bloques)
+
+
+# ==================== CARGA ====================
+
+def _sql_staging(tipos: Dict[str, str]) -> str:
+    columnas = ", ".join(f"{columna} {tipos[columna]}" for columna in COLUMNAS)
+    return f"CREATE TEMP TABLE importacion_pacientes (fila INTEGER, {columnas}) ON COMMIT DROP"
+
+
+SQL_COPY = f"COPY importacion_pacientes (fila, {', '.join(COLUMNAS)}) FROM STDIN"
+
+SQL_INSERTAR = f"""
+    INSERT INTO public.pacientes ({', '.join(COLUMNAS)})
+    SELECT {', '.join('COALESCE(fecha_atencion, NOW())' if c == 'fecha_atencion' else c for c in COLUMNAS)}
+    FROM importacion_pacientes
+    ON CONFLICT (numero_documento) DO NOTHING
+    RETURNING {COLUMNAS_RETORNO}
+"""
+
+
+async def _tipos_columnas() -> Dict[str, str]:
+    """Tipos SQL de las columnas de pacientes (la tabla temporal los replica)"""
+    async with async_db_connection() as conn:
+        cur = conn.cursor()
+        await cur.execute("""
+            SELECT attname, format_type(atttypid, atttypmod) AS tipo
+            FROM pg_attribute
+            WHERE attrelid = 'public.pacientes'::regclass AND attnum > 0 AND NOT attisdropped
+        """)
+        tipos = {row['attname']: row['tipo'] for row in await cur.fetchall()}
+        await cur.close()
+    faltantes = [columna for columna in COLUMNAS if columna not in tipos]
+    if faltantes:
+        raise RuntimeError(f"Columnas inexistentes en public.pacientes: {', '.join(faltantes)}")
+    return tipos
+
+
+async def _insertar(filas: List[Tuple[int, list]], sql_staging: str) -> List[dict]:
+    """COPY a la tabla temporal + INSERT ... SELECT en una transacción"""
+    async with async_db_connection() as conn:
+        try:
+            cur = conn.cursor()
+            await cur.execute(sql_staging)
+            async with cur.copy(SQL_COPY) as copia:
+                for fila, valores in filas:
+                    await copia.write_row([fila] + valores)
+            await cur.execute(SQL_INSERTAR)
+            insertados = await cur.fetchall()
+            await aplicar_deltas(cur, calcular_deltas_lote((None, row) for row in insertados))
+            # Las réplicas de la API descartan los periodos de actividad afectados
+            await notificar_actividad(cur, (row['fecha_atencion'] for row in insertados))
+            await conn.commit()
+            await cur.close()
+        except Exception:
+            await conn.rollback()
+            raise
+    return insertados
+
+
+async def _insertar_lote(filas: List[Tuple[int, list]], sql_staging: str, errores: List[Tuple[int, str]]) -> List[dict]:
+    """
+    Inserta el lote; si una restricción de la base rechaza alguna fila
+    (CHECK, NOT NULL, longitud) lo divide en mitades hasta aislarla.
+    """
+    try:
+        return await _insertar(filas, sql_staging)
+    except (pg_errors.IntegrityError, pg_errors.DataError) as e:
+        if len(filas) == 1:
+            errores.append((filas[0][0], str(e).splitlines()[0]))
+            return []
+        mitad = len(filas) // 2
+        return (
+            await _insertar_lote(filas[:mitad], sql_staging, errores)
+            + await _insertar_lote(filas[mitad:], sql_staging, errores)
+        )
+
+
+async def importar_pacientes(
+    bloques: AsyncIterator[bytes],
+    formato: str,
+    al_insertar=None
+) -> dict:
+    """
+    Importa pacientes desde un stream CSV o NDJSON. Retorna el resumen con
+    los errores por número de línea del archivo (los primeros
+    IMPORTACION_MAX_ERRORES).
+
+    `al_insertar(rows)` es una corrutina que recibe las filas insertadas de
+    cada lote (p. ej. para actualizar el índice de sugerencias del proceso).
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato no soportado: {formato}")
+
+    inicio = datetime.now()
+    sql_staging = _sql_staging(await _tipos_columnas())
+    resumen = {"leidas": 0, "insertadas": 0, "duplicadas": 0, "invalidas": 0}
+    errores: List[Tuple[int, str]] = []
+    vistos = set()
+    lote: List[Tuple[int, list]] = []
+
+    def error(fila: int, detalle: str):
+        resumen["invalidas"] += 1
+        errores.append((fila, detalle))
+
+    async def cargar():
+        documentos = {valores[COLUMNAS.index("numero_documento")]: fila for fila, valores in lote}
+        rechazos: List[Tuple[int, str]] = []
+        insertados = await _insertar_lote(lote, sql_staging, rechazos)
+        for fila, detalle in rechazos:
+            error(fila, detalle)
+        resumen["insertadas"] += len(insertados)
+        insertados_docs = {row["numero_documento"] for row in insertados}
+        rechazadas = {fila for fila, _ in rechazos}
+        for documento, fila in documentos.items():
+            if documento not in insertados_docs and fila not in rechazadas:
+                resumen["duplicadas"] += 1
+                errores.append((fila, f"Ya existe un paciente con documento {documento}"))
+        if al_insertar and insertados:
+            await al_insertar(insertados)
+        lote.clear()
+
+    async for fila, registro in leer_registros(bloques, formato):
+        resumen["leidas"] += 1
+        if "__error__" in registro:
+            error(fila, registro["__error__"])
+            continue
+        try:
+            paciente = PacienteImportacion.model_validate(registro)
+        except ValidationError as e:
+            error(fila, "; ".join(
+                f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors()
+            ))
+            continue
+        if paciente.numero_documento in vistos:
+            error(fila, f"Documento {paciente.numero_documento} repetido en el archivo")
+            continue
+        vistos.add(paciente.numero_documento)
+
+        # Sin model_dump: los enums (str) y fechas se adaptan directo en el COPY
+        datos = paciente.__dict__
+        lote.append((fila, [datos[columna] for columna in COLUMNAS]))
+        if len(lote) >= IMPORTACION_LOTE:
+            await cargar()
+
+    if lote:
+        await cargar()
+
+    errores.sort()
+    duracion = (datetime.now() - inicio).total_seconds()
+    return {
+        **resumen,
+        "segundos": round(duracion, 2),
+        "filas_por_segundo": round(resumen["leidas"] / duracion) if duracion else None,
+        "errores": [{"fila": fila, "detalle": detalle} for fila, detalle in errores[:IMPORTACION_MAX_ERRORES]],
+        "errores_omitidos": max(0, len(errores) - IMPORTACION_MAX_ERRORES),
+    }
+
+
+# ==================== CLI ====================
+
+async def _bloques_archivo(ruta: str, tamano: int = 1 << 20) -> AsyncIterator[bytes]:
+    archivo = sys.stdin.buffer if ruta == "-" else open(ruta, "rb")
+    try:
+        while True:
+            bloque = await asyncio.to_thread(archivo.read, tamano)
+            if not bloque:
+                break
+            yield bloque
+    finally:
+        if archivo is not sys.stdin.buffer:
+            archivo.close()
+
+
+async def _main(ruta: str, formato: str) -> dict:
+    await open_async_pool()
+    try:
+        return await importar_pacientes(_bloques_archivo(ruta), formato)
+    finally:
+        await close_async_pool()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Importación masiva de pacientes")
+    parser.add_argument("archivo", help="Ruta del archivo CSV/NDJSON ('-' para stdin)")
+    parser.add_argument("--formato", choices=FORMATOS, help="Por defecto según la extensión")
+    args = parser.parse_args()
+
+    formato = args.formato or ("ndjson" if args.archivo.endswith((".ndjson", ".jsonl")) else "csv")
+    resultado = asyncio.run(_main(args.archivo, formato))
+    print(json.dumps(resultado, ensure_ascii=False, indent=2))
+    sys.exit(1 if resultado["invalidas"] or resultado["duplicadas"] else 0)
+
+
+if __name__ == "__main__":
+    main()
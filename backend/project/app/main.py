@@ -5,28 +5,64 @@ VERSIÓN CORREGIDA - Fixes para listar, buscar y exportar PDF
 """
 
 import os
-from datetime import timedelta, datetime
+import time
+import asyncio
+import logging
+from datetime import date, timedelta, datetime
 from typing import List, Optional
-from fastapi import FastAPI, HTTPException, Depends, Query
+from fastapi import FastAPI, HTTPException, Depends, Query, Response, Header, Request
 from fastapi.responses import FileResponse, StreamingResponse
-from psycopg2.extras import RealDictCursor
+from fastapi.concurrency import run_in_threadpool
 import io
+from functools import lru_cache
+from pydantic import ValidationError
 
-from app.database import get_db_connection
+from app.database import (
+    async_db_connection, open_async_pool, close_async_pool,
+    get_async_pool_stats, get_pool_stats, close_pool
+)
 from app.models import (
-    Usuario, UsuarioCreate, UsuarioLogin, TokenResponse,
+    Usuario, UsuarioCreate, UsuarioUpdate, UsuarioLogin, TokenResponse,
     PacienteCreate, PacienteUpdate, PacienteResponse, PacienteResumen,
-    RolEnum
+    RolEnum, ExportacionLote, TrabajoCreate, TrabajoResponse,
+    resolver_campos, columnas_para, proyectar_paciente, PacientesLote, ResultadoPacienteLote
 )
 from app.auth import (
     authenticate_user, create_access_token, get_token_expiration,
-    get_current_active_user, require_role, require_admin,
-    require_medico, require_admisionista, require_staff,
-    user_can_access_patient
+    get_current_active_user, get_current_active_principal,
+    require_role, require_admin, require_medico, require_admisionista,
+    require_staff, user_can_access_patient, claims_usuario,
+    invalidar_usuario, notificar_cambio_usuario, cache_usuarios, revocaciones, buffer_ultimo_acceso
+)
+from app.passwords import (
+    hash_password, HashingSaturado, get_hashing_stats, shutdown_hashing
+)
+from app.paginacion import codificar_cursor, decodificar_cursor, CursorInvalido
+from app.busqueda import construir_busqueda
+from app.sugerencias import indice_sugerencias
+from app.avisos import escucha_avisos
+from app.cache_pacientes import cache_pacientes, notificar_cambio
+from app.importacion import FORMATOS as FORMATOS_IMPORTACION
+from app.estadisticas import (
+    COLUMNAS_ANTERIOR, separar_anterior, calcular_deltas, aplicar_deltas,
+    SQL_TOTALES, consultas_resumen, armar_resumen, consultar_actividad, contar_periodos,
+    cache_actividad, notificar_actividad, DIMENSIONES_ACTIVIDAD, ACTIVIDAD_MAX_PERIODOS
+)
+from app.versiones import (
+    etag_version, parsear_if_match, VersionInvalida, coincide_if_none_match
+)
+from app.pdf_workers import (
+    renderizar_pdf, RenderSaturado, PDF_RETRY_AFTER,
+    iniciar_pdf_workers, detener_pdf_workers, get_pdf_workers_stats
 )
 
 # ==================== CONFIGURACIÓN APP ====================
 
+logger = logging.getLogger(__name__)
+
+HEALTH_CACHE_SECONDS = float(os.getenv("HEALTH_CACHE_SECONDS", 30))  # Vigencia del diagnóstico detallado
+READYZ_TIMEOUT_SECONDS = float(os.getenv("READYZ_TIMEOUT_SECONDS", 2))
+
 from fastapi.middleware.cors import CORSMiddleware
 
 app = FastAPI(
@@ -94,9 +130,33 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "X-Total-Pacientes"],
 )
 
 
+# ==================== CICLO DE VIDA ====================
+
+@app.on_event("startup")
+async def iniciar_recursos():
+    """Abre el pool asíncrono antes de recibir tráfico e inicia tareas de fondo"""
+    await open_async_pool()
+    buffer_ultimo_acceso.iniciar()
+    indice_sugerencias.iniciar()
+    escucha_avisos.iniciar()
+    iniciar_pdf_workers()
+
+
+@app.on_event("shutdown")
+async def cerrar_recursos():
+    """Vacía escrituras pendientes y cierra las conexiones al apagar el worker"""
+    await buffer_ultimo_acceso.detener()
+    await indice_sugerencias.detener()
+    await escucha_avisos.detener()
+    await close_async_pool()
+    close_pool()
+    shutdown_hashing()
+    detener_pdf_workers()
+
 
 # ==================== ENDPOINTS PÚBLICOS ====================
 
@@ -105,7 +165,7 @@ app.add_middleware(
     tags=["Sistema"],
     summary="🏠 Información del sistema"
 )
-def root():
+async def root():
     """Información general de la API"""
     return {
         "nombre": "Sistema de Historia Clínica Distribuida",
@@ -128,18 +188,12 @@ def root():
     }
 
 
-@app.get(
-    "/health",
-    tags=["Sistema"],
-    summary="🏥 Estado del sistema"
-)
-def health_check():
+async def _diagnostico() -> tuple:
     """
-    Verifica el estado de la API y la base de datos.
-    Retorna información detallada de conectividad.
+    Reporte detallado de la API y la base de datos: (status_code, reporte).
+    Los conteos salen de tablas locales del coordinador (usuarios y el
+    rollup de estadísticas), sin recorrer los shards de pacientes.
     """
-    from datetime import datetime
-
     health_status = {
         "timestamp": datetime.now().isoformat(),
         "api": "operativa",
@@ -156,70 +210,64 @@ def health_check():
     }
 
     # Intentar conexión a base de datos
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-
-        # Test 1: Verificar conexión
-        cur.execute("SELECT 1 as test")
-        test_result = cur.fetchone()
-
-        # Test 2: Verificar versión
-        cur.execute("SELECT version()")
-        version_result = cur.fetchone()
-
-        # Test 3: Verificar tablas
-        cur.execute("""
-            SELECT COUNT(*) as count FROM information_schema.tables
-            WHERE table_schema = 'public'
-            AND table_name IN ('usuarios', 'pacientes')
-        """)
-        tables_result = cur.fetchone()
-        tables_count = tables_result['count']
-
-        # Test 4: Verificar distribución Citus
-        cur.execute("""
-            SELECT COUNT(*) as count
-            FROM citus_tables
-            WHERE table_name::text = 'pacientes'
-        """)
-        citus_result = cur.fetchone()
-        distributed = citus_result['count'] > 0
-
-        # Test 5: Contar registros
-        cur.execute("SELECT COUNT(*) as count FROM public.usuarios")
-        users_count = cur.fetchone()['count']
-
-        cur.execute("SELECT COUNT(*) as count FROM public.pacientes")
-        patients_count = cur.fetchone()['count']
-
-        cur.close()
-
-        health_status["base_datos"] = {
-            "estado": "conectada",
-            "version": version_result['version'][:50] + "...",
-            "tablas_requeridas": tables_count == 2,
-            "distribucion_citus": distributed,
-            "datos": {
-                "usuarios": users_count,
-                "pacientes": patients_count
-            },
-            "detalles": "Todas las verificaciones pasaron exitosamente",
-            "error": None
-        }
+        async with async_db_connection() as conn:
+            cur = conn.cursor()
+
+            # Test 1: Verificar versión
+            await cur.execute("SELECT version()")
+            version_result = await cur.fetchone()
+
+            # Test 2: Verificar tablas
+            await cur.execute("""
+                SELECT COUNT(*) as count FROM information_schema.tables
+                WHERE table_schema = 'public'
+                AND table_name IN ('usuarios', 'pacientes')
+            """)
+            tables_result = await cur.fetchone()
+            tables_count = tables_result['count']
+
+            # Test 3: Verificar distribución Citus
+            await cur.execute("""
+                SELECT COUNT(*) as count
+                FROM citus_tables
+                WHERE table_name::text = 'pacientes'
+            """)
+            citus_result = await cur.fetchone()
+            distributed = citus_result['count'] > 0
+
+            # Test 4: Contar registros (pacientes desde el rollup)
+            await cur.execute("SELECT COUNT(*) as count FROM public.usuarios")
+            users_count = (await cur.fetchone())['count']
+
+            await cur.execute(SQL_TOTALES)
+            patients_count = (await cur.fetchone())['total_pacientes']
+
+            await cur.close()
+
+            health_status["base_datos"] = {
+                "estado": "conectada",
+                "version": version_result['version'][:50] + "...",
+                "tablas_requeridas": tables_count == 2,
+                "distribucion_citus": distributed,
+                "datos": {
+                    "usuarios": users_count,
+                    "pacientes": patients_count
+                },
+                "detalles": "Todas las verificaciones pasaron exitosamente",
+                "error": None
+            }
 
-        # Determinar estado general
-        if tables_count == 2 and distributed:
-            health_status["estado"] = "saludable"
-            status_code = 200
-        else:
-            health_status["estado"] = "degradado"
-            health_status["advertencias"] = []
-            if tables_count != 2:
-                health_status["advertencias"].append("Faltan tablas requeridas")
-            if not distributed:
-                health_status["advertencias"].append("Tabla pacientes no está distribuida")
+            # Determinar estado general
+            if tables_count == 2 and distributed:
+                health_status["estado"] = "saludable"
+            else:
+                health_status["estado"] = "degradado"
+                health_status["advertencias"] = []
+                if tables_count != 2:
+                    health_status["advertencias"].append("Faltan tablas requeridas")
+                if not distributed:
+                    health_status["advertencias"].append("Tabla pacientes no está distribuida")
             status_code = 200
 
     except RuntimeError as e:
@@ -242,12 +290,78 @@ def health_check():
         health_status["estado"] = "no_saludable"
         status_code = 503
 
-    finally:
-        if conn:
-            try:
-                conn.close()
-            except:
-                pass
+    return status_code, health_status
+
+
+_diagnostico_cache = {"generado": 0.0, "resultado": None}
+_diagnostico_lock = asyncio.Lock()
+
+
+async def diagnostico_cacheado() -> tuple:
+    """Diagnóstico reutilizado durante HEALTH_CACHE_SECONDS; una sola ejecución a la vez"""
+    async with _diagnostico_lock:
+        if (
+            _diagnostico_cache["resultado"] is None
+            or time.monotonic() - _diagnostico_cache["generado"] > HEALTH_CACHE_SECONDS
+        ):
+            _diagnostico_cache["resultado"] = await _diagnostico()
+            _diagnostico_cache["generado"] = time.monotonic()
+        return _diagnostico_cache["resultado"]
+
+
+@app.get(
+    "/livez",
+    tags=["Sistema"],
+    summary="Liveness probe"
+)
+async def livez():
+    """El proceso responde. No toca la base de datos (probe de vida de Kubernetes)."""
+    return {"estado": "vivo"}
+
+
+@app.get(
+    "/readyz",
+    tags=["Sistema"],
+    summary="Readiness probe"
+)
+async def readyz():
+    """
+    Listo para recibir tráfico: obtiene una conexión del pool y ejecuta
+    `SELECT 1`. Responde 503 si no lo logra en READYZ_TIMEOUT_SECONDS.
+    """
+    async def ping():
+        async with async_db_connection() as conn:
+            await conn.execute("SELECT 1")
+
+    try:
+        await asyncio.wait_for(ping(), READYZ_TIMEOUT_SECONDS)
+    except Exception as e:
+        raise HTTPException(
+            status_code=503,
+            detail={"estado": "no_listo", "error": str(e) or type(e).__name__}
+        )
+    return {"estado": "listo"}
+
+
+@app.get(
+    "/health",
+    tags=["Sistema"],
+    summary="🏥 Estado del sistema"
+)
+@app.get(
+    "/health/detalle",
+    tags=["Sistema"],
+    summary="🏥 Diagnóstico detallado del sistema"
+)
+async def health_check():
+    """
+    Verifica el estado de la API y la base de datos.
+    Retorna información detallada de conectividad.
+
+    El reporte se reutiliza durante `HEALTH_CACHE_SECONDS` (30 por
+    defecto). Para probes de Kubernetes usar `/livez` y `/readyz`.
+    """
+    status_code, health_status = await diagnostico_cacheado()
 
     # Retornar respuesta con código apropiado
     if status_code == 503:
@@ -255,6 +369,34 @@ def health_check():
 
     return health_status
 
+
+@app.get(
+    "/metricas",
+    tags=["Sistema"],
+    summary="📈 Métricas internas del proceso"
+)
+async def metricas():
+    """
+    Métricas del worker actual: uso de los pools de conexiones
+    (conexiones en uso/libres, esperas y tiempo de espera) y aciertos
+    de la caché de usuarios autenticados.
+    """
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "pool_conexiones": get_async_pool_stats(),
+        "pool_conexiones_sync": get_pool_stats(),
+        "cache_usuarios": cache_usuarios.estadisticas(),
+        "bcrypt": get_hashing_stats(),
+        "ultimo_acceso": buffer_ultimo_acceso.estadisticas(),
+        "sugerencias": indice_sugerencias.estadisticas(),
+        "cache_pacientes": cache_pacientes.estadisticas(),
+        "avisos": escucha_avisos.estadisticas(),
+        "actividad": cache_actividad.estadisticas(),
+        "pdf": get_pdf_workers_stats(),
+        "cache_pdf": cache_pdf.estadisticas()
+    }
+
+
 # ==================== AUTENTICACIÓN ====================
 
 @app.post(
@@ -263,7 +405,7 @@ def health_check():
     tags=["🔐 Autenticación"],
     summary="Iniciar sesión"
 )
-def login(credentials: UsuarioLogin):
+async def login(credentials: UsuarioLogin):
     """
     Autenticación de usuarios contra la base de datos.
 
@@ -280,7 +422,14 @@ def login(credentials: UsuarioLogin):
     - Token JWT válido por 30 minutos
     - Información del usuario autenticado
     """
-    user = authenticate_user(credentials.username, credentials.password)
+    try:
+        user = await authenticate_user(credentials.username, credentials.password)
+    except HashingSaturado:
+        raise HTTPException(
+            status_code=503,
+            detail="Servicio de autenticación saturado, intente de nuevo",
+            headers={"Retry-After": "2"}
+        )
 
     if not user:
         raise HTTPException(
@@ -288,14 +437,8 @@ def login(credentials: UsuarioLogin):
             detail="Credenciales inválidas"
         )
 
-    # Crear token con información del usuario
-    access_token = create_access_token(
-        data={
-            "sub": user.username,
-            "rol": user.rol,
-            "user_id": user.id
-        }
-    )
+    # Crear token con información del usuario (rol, documento, época)
+    access_token = create_access_token(data=claims_usuario(user))
 
     return TokenResponse(
         access_token=access_token,
@@ -310,7 +453,7 @@ def login(credentials: UsuarioLogin):
     tags=["🔐 Autenticación"],
     summary="Información del usuario actual"
 )
-def get_me(current_user: Usuario = Depends(get_current_active_user)):
+async def get_me(current_user: Usuario = Depends(get_current_active_user)):
     """
     Obtiene información del usuario autenticado.
     Requiere token JWT válido.
@@ -327,7 +470,7 @@ def get_me(current_user: Usuario = Depends(get_current_active_user)):
     summary="Crear usuario (Admin)",
     status_code=201
 )
-def crear_usuario(
+async def crear_usuario(
     usuario: UsuarioCreate,
     current_user: Usuario = Depends(require_admin())
 ):
@@ -336,49 +479,55 @@ def crear_usuario(
 
     **Requiere rol**: Admin
 
-    La contraseña se hashea automáticamente con bcrypt.
+    La contraseña se hashea automáticamente con bcrypt (en la API,
+    con el costo BCRYPT_ROUNDS).
     """
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-
-        # Verificar que el username no exista
-        cur.execute("SELECT id FROM public.usuarios WHERE username = %s", (usuario.username,))
-        if cur.fetchone():
-            raise HTTPException(status_code=400, detail="El username ya existe")
-
-        # Insertar usuario con contraseña hasheada
-        cur.execute("""
-            INSERT INTO public.usuarios
-            (username, password_hash, rol, nombres, apellidos, documento_vinculado)
-            VALUES (%s, crypt(%s, gen_salt('bf')), %s, %s, %s, %s)
-            RETURNING id, username, rol, nombres, apellidos, documento_vinculado,
-                      activo, fecha_creacion, ultimo_acceso
-        """, (
-            usuario.username,
-            usuario.password,
-            usuario.rol,
-            usuario.nombres,
-            usuario.apellidos,
-            usuario.documento_vinculado
-        ))
-
-        row = cur.fetchone()
-        conn.commit()
-        cur.close()
+        password_hash = await hash_password(usuario.password)
+    except HashingSaturado:
+        raise HTTPException(
+            status_code=503,
+            detail="Servicio de hashing saturado, intente de nuevo",
+            headers={"Retry-After": "2"}
+        )
 
+    try:
+        async with async_db_connection() as conn:
+            cur = conn.cursor()
+
+            # Verificar que el username no exista
+            await cur.execute("SELECT id FROM public.usuarios WHERE username = %s", (usuario.username,))
+            if await cur.fetchone():
+                raise HTTPException(status_code=400, detail="El username ya existe")
+
+            # Insertar usuario con contraseña hasheada
+            await cur.execute("""
+                INSERT INTO public.usuarios
+                (username, password_hash, rol, nombres, apellidos, documento_vinculado)
+                VALUES (%s, %s, %s, %s, %s, %s)
+                RETURNING id, username, rol, nombres, apellidos, documento_vinculado,
+                          activo, fecha_creacion, ultimo_acceso
+            """, (
+                usuario.username,
+                password_hash,
+                usuario.rol,
+                usuario.nombres,
+                usuario.apellidos,
+                usuario.documento_vinculado
+            ))
+
+            row = await cur.fetchone()
+            await notificar_cambio_usuario(cur, usuario.username)
+            await conn.commit()
+            await cur.close()
+
+        invalidar_usuario(usuario.username)
         return Usuario(**dict(row))
 
     except HTTPException:
         raise
     except Exception as e:
-        if conn:
-            conn.rollback()
         raise HTTPException(status_code=500, detail=f"Error al crear usuario: {str(e)}")
-    finally:
-        if conn:
-            conn.close()
 
 
 @app.get(
@@ -387,7 +536,7 @@ def crear_usuario(
     tags=["👥 Usuarios"],
     summary="Listar usuarios (Admin)"
 )
-def listar_usuarios(
+async def listar_usuarios(
     current_user: Usuario = Depends(require_admin()),
     limit: int = Query(50, ge=1, le=100)
 ):
@@ -396,33 +545,247 @@ def listar_usuarios(
 
     **Requiere rol**: Admin
     """
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
+        async with async_db_connection() as conn:
+            cur = conn.cursor()
 
-        cur.execute("""
-            SELECT id, username, rol, nombres, apellidos, documento_vinculado,
-                   activo, fecha_creacion, ultimo_acceso
-            FROM public.usuarios
-            ORDER BY fecha_creacion DESC
-            LIMIT %s
-        """, (limit,))
+            await cur.execute("""
+                SELECT id, username, rol, nombres, apellidos, documento_vinculado,
+                       activo, fecha_creacion, ultimo_acceso
+                FROM public.usuarios
+                ORDER BY fecha_creacion DESC
+                LIMIT %s
+            """, (limit,))
 
-        rows = cur.fetchall()
-        cur.close()
+            rows = await cur.fetchall()
+            await cur.close()
 
-        return [Usuario(**dict(row)) for row in rows]
+            return [Usuario(**dict(row)) for row in rows]
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al listar usuarios: {str(e)}")
-    finally:
-        if conn:
-            conn.close()
+
+
+# Campos que autorizan un token: cambiarlos revoca los tokens emitidos
+_CAMPOS_REVOCAN_TOKENS = ("rol", "activo", "documento_vinculado")
+
+
+@app.put(
+    "/usuarios/{username}",
+    response_model=Usuario,
+    tags=["👥 Usuarios"],
+    summary="Actualizar usuario (Admin)"
+)
+async def actualizar_usuario(
+    username: str,
+    usuario: UsuarioUpdate,
+    current_user: Usuario = Depends(require_admin())
+):
+    """
+    Actualiza rol, datos personales, documento vinculado o estado de un usuario.
+
+    **Requiere rol**: Admin
+
+    Los cambios aplican de inmediato: se invalida la caché de autenticación.
+    Si cambia el rol, el estado o el documento vinculado (lo que autoriza
+    un token) se incrementa la época de revocación y los tokens previos
+    dejan de valer; corregir nombres o apellidos no cierra sesiones.
+    """
+    updates = []
+    values = []
+    revocan = []
+    valores_revocan = []
+
+    for field, value in usuario.dict(exclude_unset=True).items():
+        if value is not None:
+            updates.append(f"{field} = %s")
+            values.append(value)
+            if field in _CAMPOS_REVOCAN_TOKENS:
+                revocan.append(f"{field} IS DISTINCT FROM %s")
+                valores_revocan.append(value)
+
+    if not updates:
+        raise HTTPException(status_code=400, detail="No hay campos para actualizar")
+
+    if revocan:
+        # Las expresiones de SET ven los valores previos de la fila
+        updates.append(f"token_epoch = token_epoch + CASE WHEN {' OR '.join(revocan)} THEN 1 ELSE 0 END")
+        values.extend(valores_revocan)
+    values.append(username)
+
+    try:
+        async with async_db_connection() as conn:
+            cur = conn.cursor()
+
+            await cur.execute(f"""
+                UPDATE public.usuarios
+                SET {', '.join(updates)}
+                WHERE username = %s
+                RETURNING id, username, rol, nombres, apellidos, documento_vinculado,
+                          activo, fecha_creacion, ultimo_acceso, token_epoch
+            """, values)
+
+            row = await cur.fetchone()
+            if not row:
+                raise HTTPException(status_code=404, detail=f"Usuario {username} no encontrado")
+
+            await notificar_cambio_usuario(cur, username)
+            await conn.commit()
+            await cur.close()
+
+        invalidar_usuario(username)
+        revocaciones.revocar(username, row['token_epoch'], row['activo'])
+        return Usuario(**dict(row))
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al actualizar usuario: {str(e)}")
+
+
+@app.delete(
+    "/usuarios/{username}",
+    tags=["👥 Usuarios"],
+    summary="Desactivar usuario (Admin)",
+    status_code=204
+)
+async def desactivar_usuario(
+    username: str,
+    current_user: Usuario = Depends(require_admin())
+):
+    """
+    Desactiva un usuario (borrado lógico). Sus tokens dejan de ser válidos.
+
+    **Requiere rol**: Admin
+    """
+    try:
+        async with async_db_connection() as conn:
+            cur = conn.cursor()
+
+            await cur.execute("""
+                UPDATE public.usuarios
+                SET activo = FALSE, token_epoch = token_epoch + 1
+                WHERE username = %s
+                RETURNING token_epoch
+            """, (username,))
+
+            row = await cur.fetchone()
+            if not row:
+                raise HTTPException(status_code=404, detail=f"Usuario {username} no encontrado")
+
+            await notificar_cambio_usuario(cur, username)
+            await conn.commit()
+            await cur.close()
+
+        invalidar_usuario(username)
+        revocaciones.revocar(username, row['token_epoch'], activo=False)
+        return None
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al desactivar usuario: {str(e)}")
 
 
 # ==================== CRUD PACIENTES ====================
 
+@lru_cache(maxsize=256)
+def _sql_insertar_paciente(campos: tuple) -> str:
+    """INSERT para un conjunto de campos (se arma una vez por combinación)"""
+    return f"""
+        INSERT INTO public.pacientes ({', '.join(campos)})
+        VALUES ({', '.join(['%s'] * len(campos))})
+        ON CONFLICT (numero_documento) DO NOTHING
+        RETURNING *
+    """
+
+
+# `anterior` se lee sin bloquear: si otra transacción cambió la fila antes
+# del UPDATE, su versión ya no coincide con la bloqueada, no se escribe nada
+# y se reintenta con la fila nueva (los deltas nunca parten de una vieja)
+_MISMA_VERSION = (
+    "p.id = anterior.id"
+    " AND p.ultima_actualizacion IS NOT DISTINCT FROM anterior.ultima_actualizacion"
+)
+_REINTENTOS_ESCRITURA = 3
+
+
+async def _escribir_paciente(cur, query: str, params, numero_documento: str, condicional: bool):
+    """
+    Ejecuta un UPDATE ... FROM anterior y retorna (fila, versión actual).
+    Sin fila: la versión actual es None si el paciente no existe; con
+    `condicional` no se reintenta (If-Match vencido).
+    """
+    actual = None
+    for _ in range(_REINTENTOS_ESCRITURA):
+        await cur.execute(query, params)
+        row = await cur.fetchone()
+        if row:
+            return row, None
+        await cur.execute(
+            "SELECT ultima_actualizacion FROM public.pacientes WHERE numero_documento = %s",
+            (numero_documento,)
+        )
+        actual = await cur.fetchone()
+        if not actual or condicional:
+            break
+    return None, actual
+
+
+@lru_cache(maxsize=256)
+def _sql_actualizar_paciente(campos: tuple, condicional: bool) -> str:
+    """UPDATE para un conjunto de campos, opcionalmente condicionado a la versión"""
+    condicion = f"p.numero_documento = %s AND {_MISMA_VERSION}"
+    if condicional:
+        condicion += " AND p.ultima_actualizacion = ANY(%s)"
+    # `anterior` retorna la fila previa para los deltas de estadísticas
+    return f"""
+        UPDATE public.pacientes AS p
+        SET {', '.join(f'{campo} = %s' for campo in campos)}, ultima_actualizacion = NOW()
+        FROM (SELECT * FROM public.pacientes WHERE numero_documento = %s) AS anterior
+        WHERE {condicion}
+        RETURNING p.*, {COLUMNAS_ANTERIOR}
+    """
+
+
+@lru_cache(maxsize=128)
+def _sql_leer_paciente(columnas: tuple) -> str:
+    """SELECT de solo esas columnas (se arma una vez por combinación)"""
+    return f"""
+        SELECT {', '.join(columnas)} FROM public.pacientes
+        WHERE numero_documento = %s
+        ORDER BY id DESC
+        LIMIT 1
+    """
+
+
+async def leer_paciente(cur, numero_documento: str, campos: Optional[tuple] = None) -> Optional[dict]:
+    """
+    Fila del paciente desde la caché del proceso o la base de datos.
+    Con `campos` (proyección) y sin la fila en caché, se leen solo las
+    columnas necesarias y el resultado parcial no se guarda en caché.
+    """
+    row = cache_pacientes.obtener(numero_documento)
+    if row is not None:
+        return row
+
+    if campos:
+        await cur.execute(_sql_leer_paciente(columnas_para(campos)), (numero_documento,))
+        return await cur.fetchone()
+
+    marca = cache_pacientes.marca()
+    await cur.execute("""
+        SELECT * FROM public.pacientes
+        WHERE numero_documento = %s
+        ORDER BY id DESC
+        LIMIT 1
+    """, (numero_documento,))
+    row = await cur.fetchone()
+    if row:
+        cache_pacientes.guardar(numero_documento, row, marca)
+    return row
+
+
 @app.post(
     "/pacientes",
     response_model=PacienteResponse,
@@ -430,7 +793,7 @@ def listar_usuarios(
     summary="Crear paciente (Admisionista/Médico/Admin)",
     status_code=201
 )
-def crear_paciente(
+async def crear_paciente(
     paciente: PacienteCreate,
     current_user: Usuario = Depends(require_role(RolEnum.ADMISIONISTA, RolEnum.MEDICO, RolEnum.ADMIN))
 ):
@@ -449,55 +812,215 @@ def crear_paciente(
 
     **Campos opcionales**: 57 campos adicionales disponibles
     """
-    conn = None
+    datos = {
+        field: value
+        for field, value in paciente.dict(exclude_unset=True).items()
+        if value is not None
+    }
+
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
+        async with async_db_connection() as conn:
+            cur = conn.cursor()
+
+            # Un solo round trip: el documento duplicado no retorna fila
+            await cur.execute(_sql_insertar_paciente(tuple(datos)), list(datos.values()))
+            row = await cur.fetchone()
+            if row:
+                await aplicar_deltas(cur, calcular_deltas(None, row))
+                await notificar_cambio(cur, row['numero_documento'])
+                await notificar_actividad(cur, [row['fecha_atencion']])
+            await conn.commit()
+            await cur.close()
 
-        # Verificar que el documento no exista
-        cur.execute(
-            "SELECT id FROM public.pacientes WHERE numero_documento = %s",
-            (paciente.numero_documento,)
-        )
-        if cur.fetchone():
+        if not row:
             raise HTTPException(
                 status_code=400,
                 detail=f"Ya existe un paciente con documento {paciente.numero_documento}"
             )
 
-        # Construir query dinámicamente
-        fields = []
-        values = []
-        placeholders = []
-
-        for field, value in paciente.dict(exclude_unset=True).items():
-            if value is not None:
-                fields.append(field)
-                values.append(value)
-                placeholders.append("%s")
-
-        query = f"""
-            INSERT INTO public.pacientes ({', '.join(fields)})
-            VALUES ({', '.join(placeholders)})
-            RETURNING *
-        """
-
-        cur.execute(query, values)
-        row = cur.fetchone()
-        conn.commit()
-        cur.close()
-
+        indice_sugerencias.actualizar(row)
+        cache_actividad.invalidar([row['fecha_atencion']])
         return PacienteResponse.from_db(dict(row))
 
     except HTTPException:
         raise
     except Exception as e:
-        if conn:
-            conn.rollback()
         raise HTTPException(status_code=500, detail=f"Error al crear paciente: {str(e)}")
-    finally:
-        if conn:
-            conn.close()
+
+
+@app.post(
+    "/pacientes/importar",
+    response_model=TrabajoResponse,
+    tags=["👨‍⚕️ Pacientes"],
+    summary="Importación masiva de pacientes (Admisionista/Admin)",
+    status_code=202
+)
+async def importar_pacientes_archivo(
+    request: Request,
+    formato: str = Query("csv", pattern=f"^({'|'.join(FORMATOS_IMPORTACION)})$"),
+    current_user: Usuario = Depends(require_role(RolEnum.ADMISIONISTA, RolEnum.ADMIN))
+):
+    """
+    Carga pacientes desde el cuerpo de la petición en CSV (con encabezado
+    con los nombres de campo de `POST /pacientes`) o NDJSON (un objeto por
+    línea). Se aceptan además `fecha_atencion` y `fecha_cierre`.
+
+    **Requiere rol**: Admisionista o Admin
+
+    El archivo se guarda a medida que llega y se importa en un worker como
+    trabajo `importar_pacientes`: responde 202 con el id del trabajo. El
+    avance (filas insertadas) se consulta en `GET /trabajos/{id}` y el
+    resumen, con los errores por número de línea del archivo, se descarga
+    de `GET /trabajos/{id}/resultado`. Cada fila se valida como en
+    `POST /pacientes` y las válidas se cargan por lotes con `COPY`. Los
+    documentos ya existentes no se modifican. Reintentar es seguro: lo ya
+    cargado se reporta como duplicado.
+
+    ```bash
+    curl -X POST "http://localhost:8000/pacientes/importar?formato=csv" \\
+         -H "Authorization: Bearer $TOKEN" --data-binary @pacientes.csv
+    ```
+    """
+    try:
+        trabajo = await encolar_trabajo_con_archivo(
+            "importar_pacientes", {"formato": formato}, current_user.username, request.stream()
+        )
+        return TrabajoResponse(**trabajo)
+    except ArchivoExcedido as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al recibir la importación: {str(e)}")
+
+
+@app.get(
+    "/pacientes/sugerir",
+    response_model=List[PacienteResumen],
+    tags=["👨‍⚕️ Pacientes"],
+    summary="Autocompletar pacientes (Staff)"
+)
+async def sugerir_pacientes(
+    q: str = Query(..., min_length=1, description="Prefijo de nombre/apellido o de documento"),
+    k: int = Query(10, ge=1, le=50),
+    current_user: Usuario = Depends(require_staff())
+):
+    """
+    Sugerencias mientras se escribe en admisión.
+
+    **Requiere rol**: Médico, Admisionista, Resultados o Admin
+
+    Cada palabra de `q` debe ser prefijo de alguna palabra del nombre
+    (sin importar tildes ni mayúsculas) o del número de documento:
+    `q=jua per` encuentra a "Juan Pérez". Se resuelve con un índice en
+    memoria del proceso, sin consultar la base de datos; mientras el
+    índice se carga al iniciar, o si todas las palabras son demasiado
+    comunes para cruzarlas en memoria, se usa la búsqueda por trigramas.
+    """
+    if indice_sugerencias.listo:
+        sugerencias = indice_sugerencias.sugerir(q, k)
+        if sugerencias is not None:
+            return [PacienteResumen(**r) for r in sugerencias]
+
+    try:
+        async with async_db_connection() as conn:
+            cur = conn.cursor()
+            if q.strip().isdigit():
+                query, params = construir_busqueda(None, q.strip(), k)
+            else:
+                query, params = construir_busqueda(q, None, k)
+            await cur.execute(query, params)
+            rows = await cur.fetchall()
+            await cur.close()
+
+        return [PacienteResumen(**dict(row)) for row in rows]
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error en sugerencias: {str(e)}")
+
+
+@app.post(
+    "/pacientes/lote",
+    response_model=List[ResultadoPacienteLote],
+    tags=["👨‍⚕️ Pacientes"],
+    summary="Obtener varios pacientes por documento"
+)
+async def obtener_pacientes_lote(
+    solicitud: PacientesLote,
+    current_user: Usuario = Depends(get_current_active_principal)
+):
+    """
+    Obtiene hasta 500 pacientes en una sola petición.
+
+    **Control de acceso**: el mismo de `GET /pacientes/{doc}`, por documento.
+
+    Retorna un resultado por documento, en el orden recibido, con `estado`
+    200 (y `paciente`), 403 o 404; un documento sin acceso o inexistente
+    no hace fallar a los demás. Acepta `fields` como el GET individual.
+    Los que no están en la caché se leen con una sola consulta
+    `= ANY(...)`, que Citus reparte en paralelo solo a los shards que
+    contienen esos documentos.
+    """
+    try:
+        campos = resolver_campos(solicitud.fields) if solicitud.fields else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    permitidos = {
+        doc for doc in solicitud.documentos
+        if user_can_access_patient(current_user, doc)
+    }
+    filas = {}
+    faltantes = []
+    for doc in dict.fromkeys(solicitud.documentos):
+        if doc not in permitidos:
+            continue
+        row = cache_pacientes.obtener(doc)
+        if row is None:
+            faltantes.append(doc)
+        else:
+            filas[doc] = row
+
+    try:
+        if faltantes:
+            marca = cache_pacientes.marca()
+            columnas = ', '.join(columnas_para(campos)) if campos else '*'
+            async with async_db_connection() as conn:
+                cur = conn.cursor()
+                await cur.execute(
+                    f"SELECT {columnas} FROM public.pacientes WHERE numero_documento = ANY(%s)",
+                    (faltantes,)
+                )
+                rows = await cur.fetchall()
+                await cur.close()
+
+            for row in rows:
+                filas[row['numero_documento']] = row
+                if not campos:
+                    cache_pacientes.guardar(row['numero_documento'], row, marca)
+
+        resultados = []
+        for doc in solicitud.documentos:
+            if doc not in permitidos:
+                resultados.append(ResultadoPacienteLote(
+                    numero_documento=doc, estado=403,
+                    detalle="No tiene permiso para acceder a este paciente"
+                ))
+            elif doc not in filas:
+                resultados.append(ResultadoPacienteLote(
+                    numero_documento=doc, estado=404,
+                    detalle=f"Paciente con documento {doc} no encontrado"
+                ))
+            else:
+                modelo = (
+                    proyectar_paciente(filas[doc], campos) if campos
+                    else PacienteResponse.from_db(dict(filas[doc]))
+                )
+                resultados.append(ResultadoPacienteLote(
+                    numero_documento=doc, estado=200, paciente=modelo.model_dump(mode="json")
+                ))
+        return resultados
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al obtener pacientes: {str(e)}")
 
 
 @app.get(
@@ -506,9 +1029,14 @@ def crear_paciente(
     tags=["👨‍⚕️ Pacientes"],
     summary="Obtener paciente por documento"
 )
-def obtener_paciente(
+async def obtener_paciente(
     numero_documento: str,
-    current_user: Usuario = Depends(get_current_active_user)
+    response: Response,
+    if_none_match: Optional[str] = Header(None, description="ETag de la copia que ya tiene el cliente"),
+    fields: Optional[str] = Query(
+        None, description="Campos o secciones separados por coma (p. ej. identificacion,signos_vitales)"
+    ),
+    current_user: Usuario = Depends(get_current_active_principal)
 ):
     """
     Obtiene la historia clínica completa de un paciente.
@@ -516,6 +1044,15 @@ def obtener_paciente(
     **Control de acceso**:
     - Staff (médico/admisionista/resultados/admin): acceso a cualquier paciente
     - Paciente: solo acceso a su propia historia
+
+    La respuesta incluye `ETag` con la versión del registro, para enviarlo
+    en `If-Match` al actualizar. Con `If-None-Match` y la versión vigente
+    se responde 304 sin cuerpo tras consultar solo la versión.
+
+    **Proyección**: `?fields=` limita la respuesta (y la consulta) a esos
+    campos o secciones: `identificacion`, `atencion`, `signos_vitales`,
+    `diagnostico`, `cierre`, `profesional`. Siempre se incluyen `id`,
+    `numero_documento` y `ultima_actualizacion`.
     """
     # Verificar permisos
     if not user_can_access_patient(current_user, numero_documento):
@@ -524,36 +1061,62 @@ def obtener_paciente(
             detail="No tiene permiso para acceder a este paciente"
         )
 
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
+        campos = resolver_campos(fields) if fields else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        cur.execute("""
-            SELECT * FROM public.pacientes
-            WHERE numero_documento = %s
-            ORDER BY id DESC
-            LIMIT 1
-        """, (numero_documento,))
+    cache_headers = {"Cache-Control": "private, no-cache"}
 
-        row = cur.fetchone()
-        cur.close()
-
-        if not row:
-            raise HTTPException(
-                status_code=404,
-                detail=f"Paciente con documento {numero_documento} no encontrado"
+    try:
+        row = cache_pacientes.obtener(numero_documento)
+        if row is None:
+            async with async_db_connection() as conn:
+                cur = conn.cursor()
+
+                if if_none_match:
+                    # Solo la versión: si el cliente ya la tiene no se lee ni serializa la fila
+                    await cur.execute("""
+                        SELECT ultima_actualizacion FROM public.pacientes
+                        WHERE numero_documento = %s
+                        ORDER BY id DESC
+                        LIMIT 1
+                    """, (numero_documento,))
+                    version = await cur.fetchone()
+                    etag = etag_version(version['ultima_actualizacion']) if version else None
+                    if coincide_if_none_match(if_none_match, etag):
+                        await cur.close()
+                        return Response(status_code=304, headers={"ETag": etag, **cache_headers})
+
+                row = await leer_paciente(cur, numero_documento, campos)
+                await cur.close()
+
+            if not row:
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"Paciente con documento {numero_documento} no encontrado"
+                )
+
+        etag = etag_version(row['ultima_actualizacion'])
+        if coincide_if_none_match(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag, **cache_headers})
+        if etag:
+            response.headers["ETag"] = etag
+        response.headers.update(cache_headers)
+
+        if campos:
+            # Modelo parcial: se serializa directamente, sin pasar por PacienteResponse
+            return Response(
+                content=proyectar_paciente(row, campos).model_dump_json(),
+                media_type="application/json",
+                headers=dict(response.headers)
             )
-
         return PacienteResponse.from_db(dict(row))
 
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener paciente: {str(e)}")
-    finally:
-        if conn:
-            conn.close()
 
 
 # ==================== FIX 1: LISTAR PACIENTES CORREGIDO ====================
@@ -563,50 +1126,74 @@ def obtener_paciente(
     tags=["👨‍⚕️ Pacientes"],
     summary="Listar pacientes (Staff)"
 )
-def listar_pacientes(
+async def listar_pacientes(
+    response: Response,
     current_user: Usuario = Depends(require_staff()),
     limit: int = Query(20, ge=1, le=100),
-    offset: int = Query(0, ge=0)
+    cursor: Optional[str] = Query(None, description="Cursor de la página siguiente (header X-Next-Cursor)"),
+    offset: int = Query(0, ge=0, description="Obsoleto: usar cursor")
 ):
     """
     Lista todos los pacientes del sistema (vista resumida).
 
     **Requiere rol**: Médico, Admisionista, Resultados o Admin
 
+    **Paginación**: los resultados van del registro más reciente al más
+    antiguo. Si hay más páginas, la respuesta incluye el header
+    `X-Next-Cursor`; enviarlo como `?cursor=` trae la página siguiente
+    con el mismo costo que la primera. `offset` se mantiene por
+    compatibilidad y se ignora cuando se envía `cursor`.
+
     **FIX**: Calcula edad usando DATE_PART en lugar de columna
     """
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-
-        # ✅ FIX: Calcular edad con DATE_PART, no usar columna inexistente
-        cur.execute("""
-            SELECT
-                id,
-                numero_documento,
-                CONCAT(primer_nombre, ' ', primer_apellido) as nombre_completo,
-                DATE_PART('year', AGE(fecha_nacimiento))::INTEGER as edad,
-                sexo,
-                tipo_atencion,
-                fecha_atencion,
-                nombre_profesional
-            FROM public.pacientes
-            WHERE activo = TRUE
-            ORDER BY fecha_registro DESC
-            LIMIT %s OFFSET %s
-        """, (limit, offset))
-
-        rows = cur.fetchall()
-        cur.close()
+        desde = decodificar_cursor(cursor)
+    except CursorInvalido as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    conditions = ["activo = TRUE"]
+    params = []
+
+    if desde:
+        conditions.append("(fecha_registro, id) < (%s, %s)")
+        params.extend(desde)
+        offset = 0
+
+    params.extend([limit, offset])
+
+    try:
+        async with async_db_connection() as conn:
+            cur = conn.cursor()
+
+            # ✅ FIX: Calcular edad con DATE_PART, no usar columna inexistente
+            await cur.execute(f"""
+                SELECT
+                    id,
+                    numero_documento,
+                    CONCAT(primer_nombre, ' ', primer_apellido) as nombre_completo,
+                    DATE_PART('year', AGE(fecha_nacimiento))::INTEGER as edad,
+                    sexo,
+                    tipo_atencion,
+                    fecha_atencion,
+                    nombre_profesional,
+                    fecha_registro
+                FROM public.pacientes
+                WHERE {' AND '.join(conditions)}
+                ORDER BY fecha_registro DESC, id DESC
+                LIMIT %s OFFSET %s
+            """, params)
+
+            rows = await cur.fetchall()
+            await cur.close()
+
+        if len(rows) == limit:
+            ultimo = rows[-1]
+            response.headers["X-Next-Cursor"] = codificar_cursor(ultimo['fecha_registro'], ultimo['id'])
 
         return [PacienteResumen(**dict(row)) for row in rows]
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al listar pacientes: {str(e)}")
-    finally:
-        if conn:
-            conn.close()
 
 
 @app.put(
@@ -615,9 +1202,11 @@ def listar_pacientes(
     tags=["👨‍⚕️ Pacientes"],
     summary="Actualizar paciente (Médico/Admin)"
 )
-def actualizar_paciente(
+async def actualizar_paciente(
     numero_documento: str,
     paciente: PacienteUpdate,
+    response: Response,
+    if_match: Optional[str] = Header(None, description="ETag obtenido al leer el paciente"),
     current_user: Usuario = Depends(require_medico())
 ):
     """
@@ -626,60 +1215,71 @@ def actualizar_paciente(
     **Requiere rol**: Médico o Admin
 
     Solo se actualizan los campos proporcionados (PATCH semántico).
-    """
-    conn = None
-    try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-
-        # Verificar que el paciente exista
-        cur.execute(
-            "SELECT id FROM public.pacientes WHERE numero_documento = %s",
-            (numero_documento,)
-        )
-        if not cur.fetchone():
-            raise HTTPException(
-                status_code=404,
-                detail=f"Paciente con documento {numero_documento} no encontrado"
-            )
-
-        # Construir query de actualización dinámicamente
-        updates = []
-        values = []
 
-        for field, value in paciente.dict(exclude_unset=True).items():
-            if value is not None:
-                updates.append(f"{field} = %s")
-                values.append(value)
+    **Concurrencia**: enviar en `If-Match` el `ETag` recibido al leer el
+    paciente. Si otro usuario lo modificó entretanto, se responde 409 con
+    el `ETag` actual y no se aplica ningún cambio. Sin `If-Match` la
+    actualización es incondicional.
+    """
+    datos = {
+        field: value
+        for field, value in paciente.dict(exclude_unset=True).items()
+        if value is not None
+    }
+    if not datos:
+        raise HTTPException(status_code=400, detail="No hay campos para actualizar")
 
-        if not updates:
-            raise HTTPException(status_code=400, detail="No hay campos para actualizar")
+    try:
+        versiones = parsear_if_match(if_match)
+    except VersionInvalida as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        values.append(numero_documento)
+    params = list(datos.values()) + [numero_documento, numero_documento]
+    if versiones:
+        params.append(versiones)
 
-        query = f"""
-            UPDATE public.pacientes
-            SET {', '.join(updates)}, ultima_actualizacion = NOW()
-            WHERE numero_documento = %s
-            RETURNING *
-        """
+    try:
+        async with async_db_connection() as conn:
+            cur = conn.cursor()
 
-        cur.execute(query, values)
-        row = cur.fetchone()
-        conn.commit()
-        cur.close()
+            row, actual = await _escribir_paciente(
+                cur, _sql_actualizar_paciente(tuple(datos), bool(versiones)), params,
+                numero_documento, bool(versiones)
+            )
 
+            if not row:
+                await conn.rollback()
+                await cur.close()
+
+                if not actual:
+                    raise HTTPException(
+                        status_code=404,
+                        detail=f"Paciente con documento {numero_documento} no encontrado"
+                    )
+                etag = etag_version(actual['ultima_actualizacion'])
+                raise HTTPException(
+                    status_code=409,
+                    detail="El paciente fue modificado por otro usuario; recargue los datos antes de guardar",
+                    headers={"ETag": etag} if etag else None
+                )
+
+            row, anterior = separar_anterior(row)
+            await aplicar_deltas(cur, calcular_deltas(anterior, row))
+            await notificar_cambio(cur, numero_documento)
+            await notificar_actividad(cur, [anterior['fecha_atencion'], row['fecha_atencion']])
+            await conn.commit()
+            await cur.close()
+
+        cache_pacientes.invalidar(numero_documento)
+        indice_sugerencias.actualizar(row)
+        cache_actividad.invalidar([anterior['fecha_atencion'], row['fecha_atencion']])
+        response.headers["ETag"] = etag_version(row['ultima_actualizacion'])
         return PacienteResponse.from_db(dict(row))
 
     except HTTPException:
         raise
     except Exception as e:
-        if conn:
-            conn.rollback()
         raise HTTPException(status_code=500, detail=f"Error al actualizar paciente: {str(e)}")
-    finally:
-        if conn:
-            conn.close()
 
 
 @app.delete(
@@ -688,7 +1288,7 @@ def actualizar_paciente(
     summary="Eliminar paciente (Admin)",
     status_code=204
 )
-def eliminar_paciente(
+async def eliminar_paciente(
     numero_documento: str,
     current_user: Usuario = Depends(require_admin())
 ):
@@ -699,37 +1299,45 @@ def eliminar_paciente(
 
     **Nota**: No se eliminan datos, solo se marca como inactivo.
     """
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-
-        cur.execute("""
-            UPDATE public.pacientes
-            SET activo = FALSE, ultima_actualizacion = NOW()
-            WHERE numero_documento = %s
-        """, (numero_documento,))
-
-        if cur.rowcount == 0:
-            raise HTTPException(
-                status_code=404,
-                detail=f"Paciente con documento {numero_documento} no encontrado"
-            )
-
-        conn.commit()
-        cur.close()
-
+        async with async_db_connection() as conn:
+            cur = conn.cursor()
+
+            row, actual = await _escribir_paciente(cur, f"""
+                UPDATE public.pacientes AS p
+                SET activo = FALSE, ultima_actualizacion = NOW()
+                FROM (SELECT * FROM public.pacientes WHERE numero_documento = %s) AS anterior
+                WHERE p.numero_documento = %s AND {_MISMA_VERSION}
+                RETURNING {COLUMNAS_ANTERIOR}
+            """, (numero_documento, numero_documento), numero_documento, False)
+
+            if not row and actual:
+                raise HTTPException(
+                    status_code=409,
+                    detail="El paciente está siendo modificado por otro usuario; intente de nuevo"
+                )
+            if not row:
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"Paciente con documento {numero_documento} no encontrado"
+                )
+
+            _, anterior = separar_anterior(row)
+            await aplicar_deltas(cur, calcular_deltas(anterior, None))
+            await notificar_cambio(cur, numero_documento)
+            await notificar_actividad(cur, [anterior['fecha_atencion']])
+            await conn.commit()
+            await cur.close()
+
+        cache_pacientes.invalidar(numero_documento)
+        indice_sugerencias.eliminar(numero_documento)
+        cache_actividad.invalidar([anterior['fecha_atencion']])
         return None
 
     except HTTPException:
         raise
     except Exception as e:
-        if conn:
-            conn.rollback()
         raise HTTPException(status_code=500, detail=f"Error al eliminar paciente: {str(e)}")
-    finally:
-        if conn:
-            conn.close()
 
 
 # ==================== FIX 2: BÚSQUEDA CORREGIDA ====================
@@ -739,7 +1347,7 @@ def eliminar_paciente(
     tags=["👨‍⚕️ Pacientes"],
     summary="Buscar pacientes (Staff)"
 )
-def buscar_pacientes(
+async def buscar_pacientes(
     nombre: Optional[str] = Query(None, description="Nombre o apellido del paciente"),
     documento: Optional[str] = Query(None, description="Número de documento"),
     current_user: Usuario = Depends(require_staff()),
@@ -753,8 +1361,11 @@ def buscar_pacientes(
     **FIX**: Endpoint correcto con parámetros query
 
     **Parámetros**:
-    - `nombre`: Busca en primer_nombre y primer_apellido (ILIKE)
-    - `documento`: Busca en numero_documento (ILIKE)
+    - `nombre`: Busca en los cuatro campos de nombre, sin importar tildes
+      ni mayúsculas y tolerando errores de digitación (índice de trigramas)
+    - `documento`: Busca en numero_documento (coincidencia parcial)
+
+    Los resultados se ordenan por similitud con el nombre buscado.
 
     **Uso**:
     ```
@@ -769,56 +1380,31 @@ def buscar_pacientes(
             detail="Debe proporcionar al menos un parámetro de búsqueda (nombre o documento)"
         )
 
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-
-        conditions = ["activo = TRUE"]
-        params = []
-
-        if nombre:
-            conditions.append("(primer_nombre ILIKE %s OR primer_apellido ILIKE %s)")
-            params.extend([f"%{nombre}%", f"%{nombre}%"])
-
-        if documento:
-            conditions.append("numero_documento ILIKE %s")
-            params.append(f"%{documento}%")
-
-        params.append(limit)
-
-        # ✅ FIX: Calcular edad correctamente
-        query = f"""
-            SELECT
-                id,
-                numero_documento,
-                CONCAT(primer_nombre, ' ', primer_apellido) as nombre_completo,
-                DATE_PART('year', AGE(fecha_nacimiento))::INTEGER as edad,
-                sexo,
-                tipo_atencion,
-                fecha_atencion,
-                nombre_profesional
-            FROM public.pacientes
-            WHERE {' AND '.join(conditions)}
-            ORDER BY fecha_registro DESC
-            LIMIT %s
-        """
-
-        cur.execute(query, params)
-        rows = cur.fetchall()
-        cur.close()
+        async with async_db_connection() as conn:
+            cur = conn.cursor()
 
-        return [PacienteResumen(**dict(row)) for row in rows]
+            # Consulta respaldada por idx_pacientes_nombre_trgm / idx_pacientes_documento_trgm
+            query, params = construir_busqueda(nombre, documento, limit)
+
+            await cur.execute(query, params)
+            rows = await cur.fetchall()
+            await cur.close()
+
+            return [PacienteResumen(**dict(row)) for row in rows]
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error en búsqueda: {str(e)}")
-    finally:
-        if conn:
-            conn.close()
 
 
 # ==================== FIX 3: EXPORTACIÓN PDF CORREGIDA ====================
-from app.pdf_generator import generar_pdf_paciente
+from app.pdf_generator import preparar_datos_pdf, calcular_edad, cache_pdf
+from app.exportacion import generar_zip, contar_pacientes
+from app.trabajos import (
+    TIPOS_TRABAJO, encolar_trabajo, encolar_trabajo_con_archivo, ArchivoExcedido,
+    obtener_trabajo, leer_resultado
+)
+
 
 @app.get(
     "/pacientes/{numero_documento}/pdf",
@@ -826,9 +1412,10 @@ from app.pdf_generator import generar_pdf_paciente
     summary="Exportar historia clínica a PDF",
     response_class=StreamingResponse
 )
-def exportar_pdf(
+async def exportar_pdf(
     numero_documento: str,
-    current_user: Usuario = Depends(get_current_active_user)
+    if_none_match: Optional[str] = Header(None),
+    current_user: Usuario = Depends(get_current_active_principal)
 ):
     """
     Genera un PDF con la historia clínica completa del paciente.
@@ -840,6 +1427,11 @@ def exportar_pdf(
     **Retorna**: Archivo PDF para descarga
 
     **FIX**: Sintaxis correcta de WeasyPrint
+
+    El PDF se genera en un pool de procesos dedicado; si está lleno se
+    responde 503 con `Retry-After`. Los PDFs quedan en caché en disco por
+    versión del registro: mientras el paciente no cambie se sirve el mismo
+    archivo, y con `If-None-Match` se responde 304 sin enviarlo.
     """
     # Verificar permisos
     if not user_can_access_patient(current_user, numero_documento):
@@ -848,84 +1440,253 @@ def exportar_pdf(
             detail="No tiene permiso para exportar este paciente"
         )
 
-    conn = None
-    try:
-        # Obtener datos completos del paciente
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-
-        cur.execute("""
-            SELECT * FROM public.pacientes
-            WHERE numero_documento = %s
-            ORDER BY id DESC
-            LIMIT 1
-        """, (numero_documento,))
-
-        row = cur.fetchone()
-        cur.close()
+    nombre_archivo = f"HC_{numero_documento}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+    headers = {
+        "Content-Disposition": f'attachment; filename="{nombre_archivo}"',
+        "Cache-Control": "private, no-cache"
+    }
 
-        if not row:
+    try:
+        row = version = cache_pacientes.obtener(numero_documento)
+        if version is None:
+            async with async_db_connection() as conn:
+                cur = conn.cursor()
+
+                # Solo la versión: decide entre 304, caché o render
+                await cur.execute("""
+                    SELECT ultima_actualizacion, fecha_nacimiento FROM public.pacientes
+                    WHERE numero_documento = %s
+                    ORDER BY id DESC
+                    LIMIT 1
+                """, (numero_documento,))
+
+                version = await cur.fetchone()
+                await cur.close()
+
+        if not version:
             raise HTTPException(
                 status_code=404,
                 detail=f"Paciente con documento {numero_documento} no encontrado"
             )
 
-        # Convertir a diccionario y preparar datos
-        paciente_dict = dict(row)
-
-        # Convertir fechas a string para el template
-        if paciente_dict.get('fecha_nacimiento'):
-            paciente_dict['fecha_nacimiento'] = str(paciente_dict['fecha_nacimiento'])
-        if paciente_dict.get('fecha_atencion'):
-            paciente_dict['fecha_atencion'] = str(paciente_dict['fecha_atencion'])
-        if paciente_dict.get('fecha_cierre'):
-            paciente_dict['fecha_cierre'] = str(paciente_dict['fecha_cierre'])
-
-        # Calcular edad e IMC para el PDF
-        if paciente_dict.get('fecha_nacimiento'):
-            from datetime import date
-            born = paciente_dict['fecha_nacimiento']
-            if isinstance(born, str):
-                from datetime import datetime
-                born = datetime.strptime(born, '%Y-%m-%d').date()
-            today = date.today()
-            paciente_dict['edad'] = today.year - born.year - ((today.month, today.day) < (born.month, born.day))
-
-        peso = paciente_dict.get('peso')
-        talla = paciente_dict.get('talla')
-        if peso and talla and talla > 0:
-            paciente_dict['imc'] = round(peso / ((talla/100) ** 2), 2)
-        else:
-            paciente_dict['imc'] = None
+        clave = cache_pdf.clave(
+            numero_documento, version['ultima_actualizacion'], calcular_edad(version['fecha_nacimiento'])
+        )
+        headers["ETag"] = f'"{clave}"'
+
+        if coincide_if_none_match(if_none_match, headers["ETag"]):
+            return Response(
+                status_code=304,
+                headers={"ETag": headers["ETag"], "Cache-Control": headers["Cache-Control"]}
+            )
 
-        # ✅ FIX: Generar PDF con sintaxis correcta
-        pdf_content = generar_pdf_paciente(paciente_dict)
+        ruta = cache_pdf.obtener(clave)
+        if ruta:
+            return FileResponse(ruta, media_type="application/pdf", headers=headers)
+
+        # Obtener datos completos del paciente
+        if row is None:
+            async with async_db_connection() as conn:
+                cur = conn.cursor()
+                row = await leer_paciente(cur, numero_documento)
+                await cur.close()
+
+            if not row:
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"Paciente con documento {numero_documento} no encontrado"
+                )
+
+        # Conexión ya devuelta al pool: el render no la retiene
+        # El render es CPU: se ejecuta en el pool de procesos de PDF
+        datos = preparar_datos_pdf(row)
+        pdf_content = await renderizar_pdf(datos)
+
+        # Clave de la versión efectivamente renderizada
+        clave = cache_pdf.clave(numero_documento, row['ultima_actualizacion'], datos.get('edad'))
+        headers["ETag"] = f'"{clave}"'
+        try:
+            await run_in_threadpool(cache_pdf.guardar, clave, pdf_content)
+        except OSError as e:
+            # Sin caché (disco lleno, sin permisos) el PDF se entrega igual
+            logger.warning("No se pudo guardar el PDF en caché: %s", e)
 
         # Crear stream de respuesta
         pdf_stream = io.BytesIO(pdf_content)
         pdf_stream.seek(0)
 
-        # Nombre del archivo
-        nombre_archivo = f"HC_{numero_documento}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-
         return StreamingResponse(
             pdf_stream,
             media_type="application/pdf",
-            headers={
-                "Content-Disposition": f'attachment; filename="{nombre_archivo}"'
-            }
+            headers=headers
         )
 
     except HTTPException:
         raise
+    except RenderSaturado:
+        raise HTTPException(
+            status_code=503,
+            detail="Demasiados PDFs en generación, intente de nuevo",
+            headers={"Retry-After": str(PDF_RETRY_AFTER)}
+        )
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Error al generar PDF: {str(e)}"
         )
-    finally:
-        if conn:
-            conn.close()
+
+
+@app.post(
+    "/pacientes/pdf/lote",
+    tags=["📄 Exportación"],
+    summary="Exportar varias historias clínicas en un ZIP (Staff)",
+    response_class=StreamingResponse
+)
+async def exportar_pdf_lote(
+    solicitud: ExportacionLote,
+    current_user: Usuario = Depends(require_staff())
+):
+    """
+    Exporta las historias clínicas de varios pacientes como un ZIP con un
+    PDF por paciente, para auditorías y traslados.
+
+    **Requiere rol**: Médico, Admisionista, Resultados o Admin
+
+    **Selección**: `documentos` (lista explícita) o un filtro por
+    `tipo_atencion` y rango de `fecha_atencion`, hasta `limite` pacientes.
+
+    El ZIP se envía a medida que se generan los PDFs; el header
+    `X-Total-Pacientes` indica cuántos se incluirán. Los documentos que no
+    se pudieron exportar se listan en `errores.txt`. Sin documentos ni
+    filtro la solicitud se rechaza con 422.
+
+    Para consultar el avance desde cualquier réplica, encolar la misma
+    solicitud como trabajo `exportar_pdf_lote` en `POST /trabajos`.
+    """
+    try:
+        total = await contar_pacientes(solicitud)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al preparar exportación: {str(e)}")
+
+    nombre_archivo = f"historias_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+    return StreamingResponse(
+        generar_zip(solicitud),
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": f'attachment; filename="{nombre_archivo}"',
+            "X-Total-Pacientes": str(total)
+        }
+    )
+
+
+# ==================== TRABAJOS EN SEGUNDO PLANO ====================
+
+def _trabajo_visible(trabajo: Optional[dict], current_user) -> bool:
+    return bool(trabajo) and (
+        trabajo["username"] == current_user.username or current_user.rol == RolEnum.ADMIN
+    )
+
+
+@app.post(
+    "/trabajos",
+    response_model=TrabajoResponse,
+    tags=["⚙️ Trabajos"],
+    summary="Encolar un trabajo en segundo plano (Staff)",
+    status_code=202
+)
+async def crear_trabajo(
+    solicitud: TrabajoCreate,
+    current_user: Usuario = Depends(require_staff())
+):
+    """
+    Encola una operación pesada para que la ejecute un worker
+    (`python -m app.trabajos`). Responde de inmediato con el id; el avance
+    se consulta en `GET /trabajos/{id}` y el archivo en
+    `GET /trabajos/{id}/resultado`.
+
+    **Tipos disponibles**:
+    - `exportar_pdf_lote`: ZIP de PDFs; mismos parámetros que `POST /pacientes/pdf/lote`
+    - `estadisticas`: reporte JSON de estadísticas generales (Admin)
+
+    `importar_pacientes` se encola con el archivo en `POST /pacientes/importar`.
+    """
+    tipo = TIPOS_TRABAJO.get(solicitud.tipo)
+    if tipo is None or tipo.archivo:
+        disponibles = [nombre for nombre, t in TIPOS_TRABAJO.items() if not t.archivo]
+        raise HTTPException(
+            status_code=400,
+            detail=f"Tipo de trabajo desconocido. Disponibles: {', '.join(disponibles)}"
+        )
+    if current_user.rol not in tipo.roles:
+        raise HTTPException(status_code=403, detail="No tiene permiso para este tipo de trabajo")
+
+    parametros = solicitud.parametros
+    if tipo.parametros is not None:
+        try:
+            parametros = tipo.parametros(**parametros).model_dump(mode="json", exclude_none=True)
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail=e.errors(include_url=False))
+
+    try:
+        trabajo = await encolar_trabajo(solicitud.tipo, parametros, current_user.username)
+        return TrabajoResponse(**trabajo)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al encolar trabajo: {str(e)}")
+
+
+@app.get(
+    "/trabajos/{trabajo_id}",
+    response_model=TrabajoResponse,
+    tags=["⚙️ Trabajos"],
+    summary="Estado de un trabajo"
+)
+async def estado_trabajo(
+    trabajo_id: int,
+    current_user: Usuario = Depends(require_staff())
+):
+    """Estado y avance de un trabajo. Solo lo consulta quien lo creó (o un administrador)."""
+    try:
+        trabajo = await obtener_trabajo(trabajo_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al obtener trabajo: {str(e)}")
+
+    if not _trabajo_visible(trabajo, current_user):
+        raise HTTPException(status_code=404, detail=f"Trabajo {trabajo_id} no encontrado")
+    return TrabajoResponse(**trabajo)
+
+
+@app.get(
+    "/trabajos/{trabajo_id}/resultado",
+    tags=["⚙️ Trabajos"],
+    summary="Descargar el resultado de un trabajo"
+)
+async def resultado_trabajo(
+    trabajo_id: int,
+    current_user: Usuario = Depends(require_staff())
+):
+    """
+    Archivo generado por un trabajo completado (409 si aún no termina).
+    Se envía por partes, sin cargarlo entero en memoria.
+    """
+    try:
+        trabajo = await obtener_trabajo(trabajo_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al obtener resultado: {str(e)}")
+
+    if not _trabajo_visible(trabajo, current_user):
+        raise HTTPException(status_code=404, detail=f"Trabajo {trabajo_id} no encontrado")
+    if trabajo["estado"] != "completado":
+        raise HTTPException(status_code=409, detail=f"El trabajo está en estado '{trabajo['estado']}'")
+
+    total = trabajo["resultado_bytes"] or 0
+    return StreamingResponse(
+        leer_resultado(trabajo_id, total),
+        media_type=trabajo["resultado_tipo"],
+        headers={
+            "Content-Disposition": f'attachment; filename="{trabajo["resultado_nombre"]}"',
+            "Content-Length": str(total)
+        }
+    )
 
 
 # ==================== ESTADÍSTICAS (Admin) ====================
@@ -935,55 +1696,98 @@ def exportar_pdf(
     tags=["📊 Estadísticas"],
     summary="Estadísticas del sistema (Admin)"
 )
-def obtener_estadisticas(
+async def obtener_estadisticas(
     current_user: Usuario = Depends(require_admin())
 ):
     """
     Obtiene estadísticas generales del sistema.
 
     **Requiere rol**: Admin
+
+    Los conteos de pacientes salen de la tabla pre-agregada
+    `estadisticas_pacientes` y sus deltas pendientes (registrados en cada
+    alta, edición y borrado), no de recorrer los shards de pacientes.
     """
-    conn = None
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-
-        # Total de pacientes
-        cur.execute("SELECT COUNT(*) as total FROM public.pacientes WHERE activo = TRUE")
-        total_pacientes = cur.fetchone()['total']
-
-        # Total de usuarios
-        cur.execute("SELECT COUNT(*) as total FROM public.usuarios WHERE activo = TRUE")
-        total_usuarios = cur.fetchone()['total']
-
-        # Distribución por tipo de atención
-        cur.execute("""
-            SELECT tipo_atencion, COUNT(*) as cantidad
-            FROM public.pacientes
-            WHERE activo = TRUE AND tipo_atencion IS NOT NULL
-            GROUP BY tipo_atencion
-            ORDER BY cantidad DESC
-        """)
-        tipos_atencion = cur.fetchall()
-
-        # Distribución Citus
-        cur.execute("SELECT * FROM citus_tables WHERE table_name::text = 'pacientes'")
-        distribucion = cur.fetchone()
-
-        cur.close()
-
-        return {
-            "total_pacientes": total_pacientes,
-            "total_usuarios": total_usuarios,
-            "tipos_atencion": [dict(row) for row in tipos_atencion],
-            "distribucion_citus": {
-                "shards": distribucion['shard_count'] if distribucion else 0,
-                "columna_distribucion": distribucion['distribution_column'] if distribucion else None
+        async with async_db_connection() as conn:
+            cur = conn.cursor()
+
+            # Conteos de pacientes desde los rollups
+            resultados = {}
+            for nombre, query in consultas_resumen():
+                await cur.execute(query)
+                resultados[nombre] = await cur.fetchall()
+
+            # Usuarios por rol (tabla local del coordinador)
+            await cur.execute("""
+                SELECT rol, COUNT(*) as cantidad
+                FROM public.usuarios
+                WHERE activo = TRUE
+                GROUP BY rol
+            """)
+            usuarios_por_rol = {row['rol']: row['cantidad'] for row in await cur.fetchall()}
+
+            # Distribución Citus
+            await cur.execute("SELECT * FROM citus_tables WHERE table_name::text = 'pacientes'")
+            distribucion = await cur.fetchone()
+
+            await cur.close()
+
+            return {
+                **armar_resumen(resultados),
+                "total_usuarios": sum(usuarios_por_rol.values()),
+                "usuarios_por_rol": usuarios_por_rol,
+                "distribucion_citus": {
+                    "shards": distribucion['shard_count'] if distribucion else 0,
+                    "columna_distribucion": distribucion['distribution_column'] if distribucion else None
+                }
             }
-        }
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener estadísticas: {str(e)}")
-    finally:
-        if conn:
-            conn.close()
+
+
+@app.get(
+    "/estadisticas/actividad",
+    tags=["📊 Estadísticas"],
+    summary="Actividad clínica por periodo (Staff)"
+)
+async def actividad_clinica(
+    desde: date = Query(..., description="Fecha de atención inicial"),
+    hasta: Optional[date] = Query(None, description="Fecha de atención final (por defecto hoy)"),
+    granularidad: str = Query("dia", pattern="^(dia|semana|mes)$"),
+    dimension: str = Query("tipo_atencion", pattern=f"^({'|'.join(DIMENSIONES_ACTIVIDAD)})$"),
+    current_user: Usuario = Depends(require_staff())
+):
+    """
+    Volumen de atenciones por día, semana o mes, desglosado por tipo de
+    atención, profesional o estado de egreso.
+
+    **Requiere rol**: Médico, Admisionista, Resultados o Admin
+
+    El rango se amplía a periodos completos (semanas de lunes a domingo,
+    meses calendario). Los periodos ya cerrados se sirven de memoria y
+    solo se consulta la base para los que faltan, normalmente el actual.
+    """
+    hasta = hasta or date.today()
+    if desde > hasta:
+        raise HTTPException(status_code=400, detail="'desde' debe ser anterior o igual a 'hasta'")
+    try:
+        cantidad = contar_periodos(desde, hasta, granularidad)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if cantidad > ACTIVIDAD_MAX_PERIODOS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"El rango supera {ACTIVIDAD_MAX_PERIODOS} periodos; use una granularidad mayor"
+        )
+
+    try:
+        async with async_db_connection() as conn:
+            cur = conn.cursor()
+            resultado = await consultar_actividad(cur, desde, hasta, granularidad, dimension)
+            await cur.close()
+        return resultado
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al obtener actividad: {str(e)}")
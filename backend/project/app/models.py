@@ -4,8 +4,9 @@ Modelos Pydantic para Historia Clínica Distribuida
 Incluye: Usuario, Paciente (57 campos), Token
 """
 
-from pydantic import BaseModel, EmailStr, Field, ConfigDict
-from typing import Optional
+from functools import lru_cache
+from pydantic import BaseModel, EmailStr, Field, ConfigDict, create_model, model_validator
+from typing import Any, Dict, List, Optional, Tuple, Type
 from datetime import date, datetime
 from enum import Enum
 
@@ -97,12 +98,27 @@ class Usuario(BaseModel):
     activo: bool = True
     fecha_creacion: datetime
     ultimo_acceso: Optional[datetime] = None
+    # Época de revocación de tokens (no se expone en las respuestas)
+    token_epoch: int = Field(0, exclude=True)
 
     class Config:
         from_attributes = True
         use_enum_values = True
 
 
+class UsuarioClaims(BaseModel):
+    """Usuario reconstruido solo desde los claims firmados del token"""
+    id: Optional[int] = None
+    username: str
+    rol: RolEnum
+    documento_vinculado: Optional[str] = None
+    activo: bool = True
+    token_epoch: int = 0
+
+    class Config:
+        use_enum_values = True
+
+
 class UsuarioCreate(BaseModel):
     """Schema para crear usuario"""
     username: str = Field(..., min_length=3, max_length=50)
@@ -113,6 +129,15 @@ class UsuarioCreate(BaseModel):
     documento_vinculado: Optional[str] = None
 
 
+class UsuarioUpdate(BaseModel):
+    """Schema para actualizar usuario - todos los campos opcionales"""
+    rol: Optional[RolEnum] = None
+    nombres: Optional[str] = None
+    apellidos: Optional[str] = None
+    documento_vinculado: Optional[str] = None
+    activo: Optional[bool] = None
+
+
 class UsuarioLogin(BaseModel):
     """Schema para login"""
     username: str
@@ -283,6 +308,11 @@ class PacienteResponse(PacienteBase):
     @classmethod
     def from_db(cls, db_row: dict):
         """Crea instancia calculando edad e IMC"""
+        return cls(**cls.datos_con_calculados(db_row))
+
+    @staticmethod
+    def datos_con_calculados(db_row: dict) -> dict:
+        """Fila de BD más edad e IMC (si están sus columnas de origen)"""
         from datetime import date
 
         # Calcular edad
@@ -307,7 +337,7 @@ class PacienteResponse(PacienteBase):
         data['edad'] = edad
         data['imc'] = imc
 
-        return cls(**data)
+        return data
 
     # Todos los campos opcionales del modelo completo
     segundo_apellido: Optional[str] = None
@@ -387,3 +417,162 @@ class PacienteResumen(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+# ==================== PROYECCIÓN DE CAMPOS ====================
+
+# Secciones de la historia clínica (mismos grupos que PacienteCreate)
+SECCIONES_PACIENTE: Dict[str, Tuple[str, ...]] = {
+    "identificacion": (
+        "tipo_documento", "numero_documento", "primer_apellido", "segundo_apellido",
+        "primer_nombre", "segundo_nombre", "fecha_nacimiento", "edad", "sexo", "genero",
+        "grupo_sanguineo", "factor_rh", "estado_civil", "direccion_residencia", "municipio",
+        "departamento", "telefono", "celular", "correo_electronico", "ocupacion", "entidad",
+        "regimen_afiliacion", "tipo_usuario",
+    ),
+    "atencion": (
+        "fecha_atencion", "tipo_atencion", "motivo_consulta", "enfermedad_actual",
+        "antecedentes_personales", "antecedentes_familiares", "alergias_conocidas",
+        "habitos", "medicamentos_actuales",
+    ),
+    "signos_vitales": (
+        "tension_arterial", "frecuencia_cardiaca", "frecuencia_respiratoria", "temperatura",
+        "saturacion_oxigeno", "peso", "talla", "imc",
+    ),
+    "diagnostico": (
+        "examen_fisico_general", "examen_fisico_sistemas", "impresion_diagnostica",
+        "codigos_cie10", "conducta_plan", "recomendaciones", "medicos_interconsultados",
+        "procedimientos_realizados", "resultados_examenes",
+    ),
+    "cierre": (
+        "diagnostico_definitivo", "evolucion_medica", "tratamiento_instaurado",
+        "formulacion_medica", "educacion_paciente", "referencia_contrarreferencia",
+        "estado_egreso", "fecha_cierre",
+    ),
+    "profesional": (
+        "nombre_profesional", "tipo_profesional", "registro_medico", "cargo_servicio",
+        "firma_profesional", "firma_paciente", "responsable_registro",
+    ),
+}
+
+# Siempre presentes: identifican el registro y su versión (ETag)
+CAMPOS_SIEMPRE = ("id", "numero_documento", "ultima_actualizacion")
+
+# Campos calculados en la API y las columnas que necesitan
+CAMPOS_CALCULADOS = {"edad": ("fecha_nacimiento",), "imc": ("peso", "talla")}
+
+
+def resolver_campos(fields: str) -> Tuple[str, ...]:
+    """
+    Convierte `?fields=` (campos o secciones separados por coma) en la
+    tupla ordenada de campos de PacienteResponse a retornar.
+
+    Raises:
+        ValueError: Si algún nombre no es campo ni sección
+    """
+    pedidos = set(CAMPOS_SIEMPRE)
+    desconocidos = []
+    for nombre in fields.split(","):
+        nombre = nombre.strip()
+        if not nombre:
+            continue
+        if nombre in SECCIONES_PACIENTE:
+            pedidos.update(SECCIONES_PACIENTE[nombre])
+        elif nombre in PacienteResponse.model_fields:
+            pedidos.add(nombre)
+        else:
+            desconocidos.append(nombre)
+    if desconocidos:
+        raise ValueError(
+            f"Campos desconocidos: {', '.join(desconocidos)}. "
+            f"Secciones válidas: {', '.join(SECCIONES_PACIENTE)}"
+        )
+    # Orden del modelo completo: la respuesta es estable entre llamadas
+    return tuple(campo for campo in PacienteResponse.model_fields if campo in pedidos)
+
+
+def columnas_para(campos: Tuple[str, ...]) -> Tuple[str, ...]:
+    """Columnas de public.pacientes necesarias para armar esos campos"""
+    columnas = []
+    for campo in campos:
+        for columna in CAMPOS_CALCULADOS.get(campo, (campo,)):
+            if columna not in columnas:
+                columnas.append(columna)
+    return tuple(columnas)
+
+
+@lru_cache(maxsize=128)
+def modelo_parcial(campos: Tuple[str, ...]) -> Type[BaseModel]:
+    """Modelo de respuesta con solo esos campos de PacienteResponse (uno por combinación)"""
+    return create_model(
+        "PacienteParcial",
+        **{campo: (PacienteResponse.model_fields[campo].annotation, PacienteResponse.model_fields[campo])
+           for campo in campos}
+    )
+
+
+def proyectar_paciente(db_row: dict, campos: Tuple[str, ...]) -> BaseModel:
+    """Respuesta parcial a partir de una fila completa o proyectada"""
+    datos = PacienteResponse.datos_con_calculados(db_row)
+    return modelo_parcial(campos)(**{campo: datos.get(campo) for campo in campos})
+
+
+class PacientesLote(BaseModel):
+    """Consulta de varios pacientes por documento en una sola petición"""
+    documentos: List[str] = Field(..., min_length=1, max_length=500)
+    fields: Optional[str] = Field(None, description="Campos o secciones separados por coma")
+
+
+class ResultadoPacienteLote(BaseModel):
+    """Resultado de un documento dentro de una consulta por lote"""
+    numero_documento: str
+    estado: int = Field(..., description="200, 403 o 404, como en GET /pacientes/{doc}")
+    paciente: Optional[Dict[str, Any]] = None
+    detalle: Optional[str] = None
+
+
+# ==================== EXPORTACIÓN ====================
+
+class ExportacionLote(BaseModel):
+    """Solicitud de exportación masiva de historias clínicas en PDF"""
+    documentos: Optional[List[str]] = Field(None, max_length=1000, description="Documentos a exportar")
+    # Filtro alternativo a la lista de documentos
+    tipo_atencion: Optional[TipoAtencionEnum] = None
+    fecha_desde: Optional[date] = Field(None, description="fecha_atencion desde (inclusive)")
+    fecha_hasta: Optional[date] = Field(None, description="fecha_atencion hasta (inclusive)")
+    limite: int = Field(500, ge=1, le=1000, description="Máximo de pacientes con filtro")
+
+    @model_validator(mode="after")
+    def requiere_seleccion(self) -> "ExportacionLote":
+        """Sin documentos ni filtro se exportarían los más recientes sin pedirlo"""
+        if not self.documentos and not (self.tipo_atencion or self.fecha_desde or self.fecha_hasta):
+            raise ValueError(
+                "Debe indicar documentos o al menos un filtro (tipo_atencion, fecha_desde, fecha_hasta)"
+            )
+        return self
+
+
+# ==================== TRABAJOS ====================
+
+class TrabajoCreate(BaseModel):
+    """Solicitud de un trabajo en segundo plano"""
+    tipo: str = Field(..., description="Tipo de trabajo (p. ej. exportar_pdf_lote, estadisticas)")
+    parametros: Dict[str, Any] = {}
+
+
+class TrabajoResponse(BaseModel):
+    """Estado de un trabajo en segundo plano (sin el resultado)"""
+    id: int
+    tipo: str
+    estado: str
+    username: str
+    parametros: Dict[str, Any] = {}
+    intentos: int = 0
+    progreso: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    resultado_tipo: Optional[str] = None
+    resultado_nombre: Optional[str] = None
+    resultado_bytes: Optional[int] = None
+    fecha_creacion: datetime
+    fecha_inicio: Optional[datetime] = None
+    fecha_fin: Optional[datetime] = None
@@ -0,0 +1,37 @@
+# backend/project/app/paginacion.py
+"""
+Paginación por cursor (keyset) para listados
+El cursor es opaco para el cliente: codifica la última clave de orden vista
+"""
+
+import json
+import base64
+from datetime import datetime
+from typing import Optional, Tuple
+
+
+class CursorInvalido(ValueError):
+    """El cursor recibido no se pudo decodificar"""
+
+
+def codificar_cursor(fecha_registro: datetime, id: int) -> str:
+    """Codifica la clave (fecha_registro, id) de la última fila de una página"""
+    crudo = json.dumps([fecha_registro.isoformat(), id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(crudo.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decodificar_cursor(cursor: Optional[str]) -> Optional[Tuple[datetime, int]]:
+    """
+    Decodifica un cursor generado por codificar_cursor.
+
+    Raises:
+        CursorInvalido: Si el cursor está malformado
+    """
+    if not cursor:
+        return None
+    try:
+        relleno = "=" * (-len(cursor) % 4)
+        fecha, id = json.loads(base64.urlsafe_b64decode(cursor + relleno).decode("utf-8"))
+        return datetime.fromisoformat(fecha), int(id)
+    except Exception:
+        raise CursorInvalido("Cursor de paginación inválido")
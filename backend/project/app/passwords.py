@@ -0,0 +1,133 @@
+# backend/project/app/passwords.py
+"""
+Hashing y verificación de contraseñas con bcrypt en la aplicación
+Se ejecuta en un pool de hilos acotado para no cargar al coordinador Citus
+"""
+
+import os
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Optional
+
+import bcrypt
+from dotenv import load_dotenv
+
+load_dotenv(override=False)
+
+# Configuración bcrypt
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))  # Factor de costo para hashes nuevos
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", os.cpu_count() or 2))
+BCRYPT_MAX_PENDING = int(os.getenv("BCRYPT_MAX_PENDING", 64))  # Operaciones en cola + en curso
+BCRYPT_QUEUE_TIMEOUT = float(os.getenv("BCRYPT_QUEUE_TIMEOUT", 5))  # Segundos esperando cupo
+
+
+class HashingSaturado(Exception):
+    """La cola de bcrypt está llena: el cliente debe reintentar más tarde"""
+
+
+# bcrypt libera el GIL mientras calcula, por eso basta un pool de hilos
+_executor = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix="bcrypt")
+_cupos: Optional[asyncio.Semaphore] = None
+_metricas = {
+    "operaciones": 0,
+    "pendientes": 0,
+    "rechazadas": 0,
+    "espera_total_ms": 0.0,
+    "computo_total_ms": 0.0,
+}
+
+
+@lru_cache(maxsize=1)
+def _hash_ficticio() -> bytes:
+    """Hash de referencia para igualar tiempos cuando el usuario no existe"""
+    return bcrypt.hashpw(b"usuario-inexistente", bcrypt.gensalt(BCRYPT_ROUNDS))
+
+
+def _semaforo() -> asyncio.Semaphore:
+    global _cupos
+    if _cupos is None:
+        _cupos = asyncio.Semaphore(BCRYPT_MAX_PENDING)
+    return _cupos
+
+
+async def _ejecutar(funcion, *args):
+    """Ejecuta una operación bcrypt en el pool, con límite de operaciones pendientes"""
+    inicio = time.monotonic()
+    try:
+        await asyncio.wait_for(_semaforo().acquire(), timeout=BCRYPT_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        _metricas["rechazadas"] += 1
+        raise HashingSaturado("Demasiadas verificaciones de contraseña en curso")
+
+    _metricas["pendientes"] += 1
+    try:
+        encolado = time.monotonic()
+        resultado = await asyncio.get_running_loop().run_in_executor(_executor, funcion, *args)
+        fin = time.monotonic()
+        _metricas["operaciones"] += 1
+        _metricas["espera_total_ms"] += (encolado - inicio) * 1000
+        _metricas["computo_total_ms"] += (fin - encolado) * 1000
+        return resultado
+    finally:
+        _metricas["pendientes"] -= 1
+        _semaforo().release()
+
+
+def _hash_sync(password: str, rounds: int) -> str:
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds)).decode("utf-8")
+
+
+def _verify_sync(password: str, password_hash: Optional[str]) -> bool:
+    if not password_hash:
+        # Mismo costo que una verificación real, resultado siempre falso
+        bcrypt.checkpw(password.encode("utf-8"), _hash_ficticio())
+        return False
+    try:
+        return bcrypt.checkpw(password.encode("utf-8"), password_hash.encode("utf-8"))
+    except ValueError:
+        # Hash con formato no reconocido
+        return False
+
+
+async def hash_password(password: str, rounds: int = BCRYPT_ROUNDS) -> str:
+    """
+    Genera un hash bcrypt ($2b$) con el factor de costo configurado.
+
+    Raises:
+        HashingSaturado: Si la cola de bcrypt está llena
+    """
+    return await _ejecutar(_hash_sync, password, rounds)
+
+
+async def verify_password(password: str, password_hash: Optional[str]) -> bool:
+    """
+    Verifica una contraseña contra su hash bcrypt.
+    Acepta hashes $2a$ generados por pgcrypto (crypt/gen_salt('bf')) y $2b$.
+    Si password_hash es None, consume el mismo tiempo y retorna False.
+
+    Raises:
+        HashingSaturado: Si la cola de bcrypt está llena
+    """
+    return await _ejecutar(_verify_sync, password, password_hash)
+
+
+def get_hashing_stats() -> dict:
+    """Métricas del pool de bcrypt"""
+    operaciones = _metricas["operaciones"]
+    return {
+        "costo": BCRYPT_ROUNDS,
+        "workers": BCRYPT_WORKERS,
+        "max_pendientes": BCRYPT_MAX_PENDING,
+        "pendientes": _metricas["pendientes"],
+        "operaciones": operaciones,
+        "rechazadas": _metricas["rechazadas"],
+        "espera_promedio_ms": round(_metricas["espera_total_ms"] / operaciones, 3) if operaciones else 0.0,
+        "computo_promedio_ms": round(_metricas["computo_total_ms"] / operaciones, 3) if operaciones else 0.0,
+    }
+
+
+def shutdown_hashing():
+    """Detiene el pool de bcrypt (al apagar la aplicación)"""
+    _executor.shutdown(wait=False, cancel_futures=True)
@@ -5,10 +5,179 @@ VERSIÓN CORREGIDA - Sintaxis actualizada para WeasyPrint 60.1
 """
 
 import io
-from datetime import datetime
-from typing import Dict, Any
-from weasyprint import HTML, CSS
-from jinja2 import Template
+import os
+import hashlib
+import threading
+from datetime import date, datetime
+from typing import Dict, Any, Optional
+from functools import lru_cache
+
+# WeasyPrint (Cairo/Pango/fontTools) y Jinja se importan en el primer PDF:
+# la API solo los carga en los procesos que renderizan (app.pdf_workers)
+
+
+# ==================== ESTILOS ====================
+
+# Hoja de estilos separada del template: WeasyPrint la parsea una sola vez
+ESTILOS_CSS = """
+@page {
+    size: Letter;
+    margin: 2cm;
+    @bottom-right {
+        content: "Página " counter(page) " de " counter(pages);
+        font-size: 9pt;
+        color: #666;
+    }
+}
+
+body {
+    font-family: 'Arial', sans-serif;
+    font-size: 10pt;
+    line-height: 1.4;
+    color: #333;
+}
+
+.header {
+    text-align: center;
+    border-bottom: 3px solid #2c3e50;
+    padding-bottom: 10px;
+    margin-bottom: 20px;
+}
+
+.header h1 {
+    color: #2c3e50;
+    font-size: 18pt;
+    margin: 0;
+}
+
+.header .subtitle {
+    color: #7f8c8d;
+    font-size: 10pt;
+    margin-top: 5px;
+}
+
+.section {
+    margin-bottom: 15px;
+    page-break-inside: avoid;
+}
+
+.section-title {
+    background-color: #3498db;
+    color: white;
+    padding: 6px 10px;
+    font-size: 12pt;
+    font-weight: bold;
+    margin-bottom: 8px;
+}
+
+.data-grid {
+    display: table;
+    width: 100%;
+    border-collapse: collapse;
+}
+
+.data-row {
+    display: table-row;
+}
+
+.data-cell {
+    display: table-cell;
+    padding: 4px 8px;
+    border-bottom: 1px solid #ecf0f1;
+}
+
+.data-label {
+    font-weight: bold;
+    color: #2c3e50;
+    width: 35%;
+}
+
+.data-value {
+    color: #555;
+}
+
+.full-width {
+    margin: 10px 0;
+    padding: 8px;
+    background-color: #f8f9fa;
+    border-left: 3px solid #3498db;
+}
+
+.full-width-label {
+    font-weight: bold;
+    color: #2c3e50;
+    display: block;
+    margin-bottom: 5px;
+}
+
+.footer {
+    position: fixed;
+    bottom: 0;
+    left: 0;
+    right: 0;
+    text-align: center;
+    font-size: 8pt;
+    color: #95a5a6;
+    border-top: 1px solid #ecf0f1;
+    padding-top: 5px;
+}
+
+.signature-section {
+    margin-top: 40px;
+    display: table;
+    width: 100%;
+}
+
+.signature-box {
+    display: table-cell;
+    text-align: center;
+    width: 50%;
+    padding: 10px;
+}
+
+.signature-line {
+    border-top: 2px solid #2c3e50;
+    margin-top: 60px;
+    padding-top: 5px;
+}
+
+.alert {
+    background-color: #fff3cd;
+    border: 1px solid #ffc107;
+    padding: 8px;
+    margin: 10px 0;
+    border-radius: 3px;
+}
+
+.vitals-grid {
+    display: table;
+    width: 100%;
+}
+
+.vitals-row {
+    display: table-row;
+}
+
+.vitals-cell {
+    display: table-cell;
+    padding: 5px;
+    text-align: center;
+    border: 1px solid #ddd;
+    background-color: #f8f9fa;
+}
+
+.vitals-label {
+    font-weight: bold;
+    font-size: 8pt;
+    color: #666;
+}
+
+.vitals-value {
+    font-size: 14pt;
+    color: #2c3e50;
+    font-weight: bold;
+}
+"""
 
 
 # ==================== TEMPLATE HTML ====================
@@ -19,165 +188,6 @@ HTML_TEMPLATE = """
 <head>
     <meta charset="UTF-8">
     <title>Historia Clínica - {{ paciente.numero_documento }}</title>
-    <style>
-        @page {
-            size: Letter;
-            margin: 2cm;
-            @bottom-right {
-                content: "Página " counter(page) " de " counter(pages);
-                font-size: 9pt;
-                color: #666;
-            }
-        }
-
-        body {
-            font-family: 'Arial', sans-serif;
-            font-size: 10pt;
-            line-height: 1.4;
-            color: #333;
-        }
-
-        .header {
-            text-align: center;
-            border-bottom: 3px solid #2c3e50;
-            padding-bottom: 10px;
-            margin-bottom: 20px;
-        }
-
-        .header h1 {
-            color: #2c3e50;
-            font-size: 18pt;
-            margin: 0;
-        }
-
-        .header .subtitle {
-            color: #7f8c8d;
-            font-size: 10pt;
-            margin-top: 5px;
-        }
-
-        .section {
-            margin-bottom: 15px;
-            page-break-inside: avoid;
-        }
-
-        .section-title {
-            background-color: #3498db;
-            color: white;
-            padding: 6px 10px;
-            font-size: 12pt;
-            font-weight: bold;
-            margin-bottom: 8px;
-        }
-
-        .data-grid {
-            display: table;
-            width: 100%;
-            border-collapse: collapse;
-        }
-
-        .data-row {
-            display: table-row;
-        }
-
-        .data-cell {
-            display: table-cell;
-            padding: 4px 8px;
-            border-bottom: 1px solid #ecf0f1;
-        }
-
-        .data-label {
-            font-weight: bold;
-            color: #2c3e50;
-            width: 35%;
-        }
-
-        .data-value {
-            color: #555;
-        }
-
-        .full-width {
-            margin: 10px 0;
-            padding: 8px;
-            background-color: #f8f9fa;
-            border-left: 3px solid #3498db;
-        }
-
-        .full-width-label {
-            font-weight: bold;
-            color: #2c3e50;
-            display: block;
-            margin-bottom: 5px;
-        }
-
-        .footer {
-            position: fixed;
-            bottom: 0;
-            left: 0;
-            right: 0;
-            text-align: center;
-            font-size: 8pt;
-            color: #95a5a6;
-            border-top: 1px solid #ecf0f1;
-            padding-top: 5px;
-        }
-
-        .signature-section {
-            margin-top: 40px;
-            display: table;
-            width: 100%;
-        }
-
-        .signature-box {
-            display: table-cell;
-            text-align: center;
-            width: 50%;
-            padding: 10px;
-        }
-
-        .signature-line {
-            border-top: 2px solid #2c3e50;
-            margin-top: 60px;
-            padding-top: 5px;
-        }
-
-        .alert {
-            background-color: #fff3cd;
-            border: 1px solid #ffc107;
-            padding: 8px;
-            margin: 10px 0;
-            border-radius: 3px;
-        }
-
-        .vitals-grid {
-            display: table;
-            width: 100%;
-        }
-
-        .vitals-row {
-            display: table-row;
-        }
-
-        .vitals-cell {
-            display: table-cell;
-            padding: 5px;
-            text-align: center;
-            border: 1px solid #ddd;
-            background-color: #f8f9fa;
-        }
-
-        .vitals-label {
-            font-weight: bold;
-            font-size: 8pt;
-            color: #666;
-        }
-
-        .vitals-value {
-            font-size: 14pt;
-            color: #2c3e50;
-            font-weight: bold;
-        }
-    </style>
 </head>
 <body>
     <!-- HEADER -->
@@ -584,8 +594,65 @@ HTML_TEMPLATE = """
 """
 
 
+@lru_cache(maxsize=1)
+def _template():
+    """Template compilado una vez por proceso, en el primer uso"""
+    from jinja2 import Template
+    return Template(HTML_TEMPLATE)
+
+
+@lru_cache(maxsize=1)
+def _recursos_weasyprint():
+    """
+    Configuración de fuentes y hoja de estilos compartidas entre renders.
+    Se crean en el primer PDF del proceso y se reutilizan en los siguientes.
+    """
+    from weasyprint import HTML, CSS
+    from weasyprint.text.fonts import FontConfiguration
+
+    font_config = FontConfiguration()
+    hoja_estilos = CSS(string=ESTILOS_CSS, font_config=font_config)
+    return HTML, hoja_estilos, font_config
+
+
 # ==================== FUNCIONES ====================
 
+def calcular_edad(born) -> Optional[int]:
+    """Edad en años cumplidos a la fecha de hoy"""
+    if isinstance(born, datetime):
+        born = born.date()
+    if not isinstance(born, date):
+        return None
+    today = date.today()
+    return today.year - born.year - ((today.month, today.day) < (born.month, born.day))
+
+
+def preparar_datos_pdf(row: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Convierte una fila de public.pacientes en los datos del template:
+    fechas como texto, edad e IMC calculados.
+    """
+    paciente = dict(row)
+
+    edad = calcular_edad(paciente.get('fecha_nacimiento'))
+    if edad is not None:
+        paciente['edad'] = edad
+
+    # Convertir fechas a string para el template
+    for campo in ('fecha_nacimiento', 'fecha_atencion', 'fecha_cierre'):
+        if paciente.get(campo):
+            paciente[campo] = str(paciente[campo])
+
+    peso = paciente.get('peso')
+    talla = paciente.get('talla')
+    if peso and talla and talla > 0:
+        paciente['imc'] = round(float(peso) / ((float(talla) / 100) ** 2), 2)
+    else:
+        paciente['imc'] = None
+
+    return paciente
+
+
 def generar_pdf_paciente(paciente_data: Dict[str, Any]) -> bytes:
     """
     Genera un PDF a partir de los datos de un paciente.
@@ -608,16 +675,12 @@ def generar_pdf_paciente(paciente_data: Dict[str, Any]) -> bytes:
             "fecha_generacion": datetime.now().strftime("%d/%m/%Y %H:%M:%S")
         }
 
-        # Renderizar template
-        template = Template(HTML_TEMPLATE)
-        html_content = template.render(**context)
-
-        # ✅ SINTAXIS CORRECTA - Cambio clave aquí
-        # Antes: HTML(string=html_content)  ❌
-        # Ahora: HTML(string=html_content)  ✅ (correcto, el problema estaba en write_pdf())
+        # Renderizar template (ya compilado)
+        html_content = _template().render(**context)
 
+        HTML, hoja_estilos, font_config = _recursos_weasyprint()
         html_doc = HTML(string=html_content)
-        pdf_bytes = html_doc.write_pdf()
+        pdf_bytes = html_doc.write_pdf(stylesheets=[hoja_estilos], font_config=font_config)
 
         return pdf_bytes
 
@@ -642,3 +705,131 @@ def guardar_pdf_local(paciente_data: Dict[str, Any], ruta: str) -> str:
         f.write(pdf_content)
 
     return ruta
+
+
+# ==================== CACHÉ EN DISCO ====================
+
+# Las historias clínicas no van a un directorio compartido como /tmp
+PDF_CACHE_DIR = os.getenv("PDF_CACHE_DIR", os.path.join(
+    os.getenv("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")), "historiaclinica-pdf"
+))
+PDF_CACHE_MAX_MB = int(os.getenv("PDF_CACHE_MAX_MB", 512))
+
+# Cambia si cambia el template o los estilos: invalida todos los PDFs guardados
+HUELLA_TEMPLATE = hashlib.sha256((HTML_TEMPLATE + ESTILOS_CSS).encode("utf-8")).hexdigest()[:16]
+
+
+class CachePDF:
+    """
+    PDFs ya generados, en disco, direccionados por contenido.
+
+    La clave combina documento, ultima_actualizacion, edad (cambia con la
+    fecha aunque el registro no cambie) y la huella del template, así que
+    una entrada nunca queda desactualizada: las versiones viejas solo
+    dejan de pedirse y salen por LRU (mtime) al superar el tamaño máximo.
+
+    El directorio queda con permisos 0700 y los PDFs con 0600; un
+    directorio de otro usuario no se usa.
+    """
+
+    def __init__(self, directorio: str, max_bytes: int):
+        self.directorio = directorio
+        self.max_bytes = max_bytes
+        self._bytes: Optional[int] = None  # Se mide del disco en la primera escritura
+        self._preparado = False
+        self._lock = threading.Lock()
+        self._metricas = {"aciertos": 0, "fallos": 0, "guardados": 0, "desalojados": 0}
+
+    @staticmethod
+    def clave(numero_documento: str, ultima_actualizacion, edad: Optional[int]) -> str:
+        marca = ultima_actualizacion.isoformat() if ultima_actualizacion else ""
+        texto = f"{numero_documento}|{marca}|{edad}|{HUELLA_TEMPLATE}"
+        return hashlib.sha256(texto.encode("utf-8")).hexdigest()[:32]
+
+    def ruta(self, clave: str) -> str:
+        return os.path.join(self.directorio, f"{clave}.pdf")
+
+    def _preparar(self):
+        """Crea el directorio solo para este usuario (una vez por proceso)"""
+        if self._preparado:
+            return
+        os.makedirs(self.directorio, mode=0o700, exist_ok=True)
+        info = os.stat(self.directorio)
+        if info.st_uid != os.getuid():
+            raise PermissionError(f"El directorio de caché {self.directorio} pertenece a otro usuario")
+        if info.st_mode & 0o077:
+            os.chmod(self.directorio, 0o700)
+        self._preparado = True
+
+    def obtener(self, clave: str) -> Optional[str]:
+        """Ruta del PDF si está en caché (y lo marca como usado)"""
+        ruta = self.ruta(clave)
+        try:
+            self._preparar()
+            os.utime(ruta)  # mtime = último uso, para el LRU
+        except OSError:
+            self._metricas["fallos"] += 1
+            return None
+        self._metricas["aciertos"] += 1
+        return ruta
+
+    def guardar(self, clave: str, pdf: bytes) -> str:
+        """Escribe el PDF de forma atómica y desaloja si se supera el tamaño máximo"""
+        self._preparar()
+        ruta = self.ruta(clave)
+        temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+        descriptor = os.open(temporal, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(descriptor, "wb") as f:
+            f.write(pdf)
+        os.replace(temporal, ruta)
+
+        with self._lock:
+            self._metricas["guardados"] += 1
+            if self._bytes is None:
+                self._bytes = self._medir()
+            else:
+                self._bytes += len(pdf)
+            if self._bytes > self.max_bytes:
+                self._desalojar()
+        return ruta
+
+    def _archivos(self):
+        with os.scandir(self.directorio) as entradas:
+            for entrada in entradas:
+                if entrada.name.endswith(".pdf"):
+                    try:
+                        info = entrada.stat()
+                    except FileNotFoundError:
+                        continue
+                    yield info.st_mtime, info.st_size, entrada.path
+
+    def _medir(self) -> int:
+        return sum(tamano for _, tamano, _ in self._archivos())
+
+    def _desalojar(self):
+        """Borra los menos usados hasta quedar en el 90% del máximo"""
+        archivos = sorted(self._archivos())
+        total = sum(tamano for _, tamano, _ in archivos)
+        objetivo = self.max_bytes * 0.9
+        for _, tamano, ruta in archivos:
+            if total <= objetivo:
+                break
+            try:
+                os.remove(ruta)
+                self._metricas["desalojados"] += 1
+            except FileNotFoundError:
+                pass
+            total -= tamano
+        self._bytes = total
+
+    def estadisticas(self) -> dict:
+        return {
+            "directorio": self.directorio,
+            "max_mb": round(self.max_bytes / 1024 / 1024, 1),
+            "uso_mb": round(self._bytes / 1024 / 1024, 1) if self._bytes is not None else None,
+            **self._metricas,
+        }
+
+
+# Instancia global por proceso (el directorio puede compartirse entre procesos)
+cache_pdf = CachePDF(PDF_CACHE_DIR, PDF_CACHE_MAX_MB * 1024 * 1024)
@@ -0,0 +1,143 @@
+# backend/project/app/pdf_workers.py
+"""
+Servicio de renderizado de PDFs en procesos dedicados
+WeasyPrint es CPU puro: un pool de procesos lo reparte entre núcleos sin
+ocupar el event loop ni el threadpool de la API
+"""
+
+import os
+import time
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv(override=False)
+
+# Configuración del pool de render
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", max(1, (os.cpu_count() or 2) - 1)))
+PDF_MAX_PENDING = int(os.getenv("PDF_MAX_PENDING", PDF_WORKERS * 4))  # En cola + en curso
+PDF_RETRY_AFTER = int(os.getenv("PDF_RETRY_AFTER", 5))  # Segundos sugeridos al cliente
+
+
+class RenderSaturado(Exception):
+    """Hay demasiados PDFs pendientes: el cliente debe reintentar más tarde"""
+
+
+_executor: Optional[ProcessPoolExecutor] = None
+_metricas = {
+    "renderizados": 0,
+    "pendientes": 0,
+    "rechazados": 0,
+    "errores": 0,
+    "reinicios": 0,
+    "render_total_ms": 0.0,
+}
+
+
+def _calentar_worker():
+    """
+    Inicializador de cada proceso: importa WeasyPrint, compila recursos y
+    genera un PDF mínimo para cargar fuentes antes del primer pedido real.
+    """
+    try:
+        from app import pdf_generator
+        pdf_generator.generar_pdf_paciente({"numero_documento": "-", "primer_nombre": "-"})
+    except Exception as e:
+        # Un error aquí rompería el pool completo; el pedido real lo reportará
+        print(f"Error calentando worker de PDF: {e}")
+
+
+def _renderizar(paciente_data: Dict[str, Any]) -> bytes:
+    """Se ejecuta en el worker: WeasyPrint solo se importa en estos procesos"""
+    from app.pdf_generator import generar_pdf_paciente
+    return generar_pdf_paciente(paciente_data)
+
+
+def _crear_executor() -> ProcessPoolExecutor:
+    # spawn: el proceso de la API tiene hilos (pools de conexiones, bcrypt)
+    # y hacer fork con hilos activos no es seguro
+    return ProcessPoolExecutor(
+        max_workers=PDF_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_calentar_worker
+    )
+
+
+def iniciar_pdf_workers():
+    """Crea el pool y lanza el calentamiento de todos los procesos (al iniciar la API)"""
+    global _executor
+    if _executor is None:
+        _executor = _crear_executor()
+        # Los procesos arrancan con la primera tarea: una por worker
+        for _ in range(PDF_WORKERS):
+            _executor.submit(os.getpid)
+
+
+def detener_pdf_workers():
+    """Detiene el pool de render (al apagar la API)"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def renderizar_pdf(paciente_data: Dict[str, Any]) -> bytes:
+    """
+    Genera el PDF de un paciente en el pool de procesos.
+
+    Args:
+        paciente_data: Datos ya preparados con preparar_datos_pdf()
+
+    Raises:
+        RenderSaturado: Si hay PDF_MAX_PENDING renders en cola o en curso
+    """
+    global _executor
+    if _metricas["pendientes"] >= PDF_MAX_PENDING:
+        _metricas["rechazados"] += 1
+        raise RenderSaturado("Demasiados PDFs en generación")
+
+    if _executor is None:
+        iniciar_pdf_workers()
+
+    _metricas["pendientes"] += 1
+    inicio = time.monotonic()
+    try:
+        executor = _executor
+        pdf = await asyncio.get_running_loop().run_in_executor(
+            executor, _renderizar, paciente_data
+        )
+        _metricas["renderizados"] += 1
+        _metricas["render_total_ms"] += (time.monotonic() - inicio) * 1000
+        return pdf
+    except BrokenProcessPool:
+        # Un worker murió (p. ej. OOM): el pool queda inutilizable, se recrea
+        _metricas["errores"] += 1
+        if _executor is executor:
+            _metricas["reinicios"] += 1
+            executor.shutdown(wait=False, cancel_futures=True)
+            _executor = _crear_executor()
+        raise
+    except Exception:
+        _metricas["errores"] += 1
+        raise
+    finally:
+        _metricas["pendientes"] -= 1
+
+
+def get_pdf_workers_stats() -> dict:
+    """Métricas del pool de render"""
+    renderizados = _metricas["renderizados"]
+    return {
+        "workers": PDF_WORKERS,
+        "max_pendientes": PDF_MAX_PENDING,
+        "pendientes": _metricas["pendientes"],
+        "renderizados": renderizados,
+        "rechazados": _metricas["rechazados"],
+        "errores": _metricas["errores"],
+        "reinicios": _metricas["reinicios"],
+        "render_promedio_ms": round(_metricas["render_total_ms"] / renderizados, 1) if renderizados else 0.0,
+    }
@@ -0,0 +1,423 @@
+# backend/project/app/sugerencias.py
+"""
+Índice en memoria para autocompletar pacientes (typeahead)
+Prefijos de nombres normalizados y números de documento, sin ir a la BD
+"""
+
+import os
+import time
+import heapq
+import asyncio
+from bisect import bisect_left, insort
+from datetime import date, datetime, timedelta
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Set
+
+from app.busqueda import normalizar
+from app.database import async_db_connection
+
+SUGERENCIAS_REFRESH_SECONDS = float(os.getenv("SUGERENCIAS_REFRESH_SECONDS", 30))
+SUGERENCIAS_LOTE_CARGA = int(os.getenv("SUGERENCIAS_LOTE_CARGA", 5000))
+SUGERENCIAS_MAX_CANDIDATOS = int(os.getenv("SUGERENCIAS_MAX_CANDIDATOS", 2000))
+SUGERENCIAS_MAX_INTERSECCION = int(os.getenv("SUGERENCIAS_MAX_INTERSECCION", 50000))
+
+# Filas aplicadas por vuelta del event loop en las actualizaciones por lote
+_APLICAR_POR_VUELTA = 500
+
+# Solapamiento al pedir cambios: cubre transacciones que confirmaron tarde
+_SOLAPE_REFRESCO = timedelta(seconds=60)
+
+COLUMNAS_INDICE = """
+    id, numero_documento, primer_nombre, segundo_nombre, primer_apellido,
+    segundo_apellido, fecha_nacimiento, sexo, tipo_atencion, fecha_atencion,
+    nombre_profesional, activo, fecha_registro, ultima_actualizacion
+"""
+
+
+class _Entrada:
+    """Datos mínimos de un paciente para armar un PacienteResumen"""
+
+    __slots__ = (
+        "id", "numero_documento", "nombre_completo", "fecha_nacimiento", "sexo",
+        "tipo_atencion", "fecha_atencion", "nombre_profesional", "claves"
+    )
+
+    def __init__(self, row: dict):
+        self.id = row["id"]
+        self.numero_documento = row["numero_documento"]
+        self.nombre_completo = f"{row['primer_nombre']} {row['primer_apellido']}"
+        self.fecha_nacimiento = row.get("fecha_nacimiento")
+        self.sexo = row["sexo"]
+        self.tipo_atencion = row.get("tipo_atencion")
+        self.fecha_atencion = row.get("fecha_atencion")
+        self.nombre_profesional = row.get("nombre_profesional")
+
+        palabras = normalizar(" ".join(
+            row.get(campo) or ""
+            for campo in ("primer_nombre", "segundo_nombre", "primer_apellido", "segundo_apellido")
+        )).split()
+        self.claves = tuple(sorted(set(palabras) | {self.numero_documento.lower()}))
+
+    def resumen(self) -> dict:
+        edad = None
+        if self.fecha_nacimiento:
+            hoy = date.today()
+            born = self.fecha_nacimiento
+            edad = hoy.year - born.year - ((hoy.month, hoy.day) < (born.month, born.day))
+        return {
+            "id": self.id,
+            "numero_documento": self.numero_documento,
+            "nombre_completo": self.nombre_completo,
+            "edad": edad,
+            "sexo": self.sexo,
+            "tipo_atencion": self.tipo_atencion,
+            "fecha_atencion": self.fecha_atencion,
+            "nombre_profesional": self.nombre_profesional,
+        }
+
+
+class _TablaClaves:
+    """
+    Claves -> documentos. Las claves distintas se guardan ordenadas en
+    cubetas por sus dos primeros caracteres: una clave nueva solo reordena
+    su cubeta (pocas claves) y un prefijo se resuelve con bisect en ella.
+    """
+
+    def __init__(self):
+        self._documentos: Dict[str, Set[str]] = {}
+        self._cubetas: Dict[str, List[str]] = {}
+        self._nombres: List[str] = []  # cubetas ordenadas, para prefijos de un carácter
+        self.pares = 0
+
+    @classmethod
+    def construir(cls, entradas: Dict[str, _Entrada]) -> "_TablaClaves":
+        """Tabla completa a partir de las entradas (se llama fuera del event loop)"""
+        tabla = cls()
+        documentos = tabla._documentos
+        for doc, entrada in entradas.items():
+            for clave in entrada.claves:
+                docs = documentos.get(clave)
+                if docs is None:
+                    documentos[clave] = {doc}
+                else:
+                    docs.add(doc)
+            tabla.pares += len(entrada.claves)
+        for clave in documentos:
+            tabla._cubetas.setdefault(clave[:2], []).append(clave)
+        for claves in tabla._cubetas.values():
+            claves.sort()
+        tabla._nombres = sorted(tabla._cubetas)
+        return tabla
+
+    def agregar(self, clave: str, doc: str):
+        docs = self._documentos.get(clave)
+        if docs is None:
+            self._documentos[clave] = {doc}
+            cubeta = self._cubetas.get(clave[:2])
+            if cubeta is None:
+                self._cubetas[clave[:2]] = [clave]
+                insort(self._nombres, clave[:2])
+            else:
+                insort(cubeta, clave)
+        elif doc in docs:
+            return
+        else:
+            docs.add(doc)
+        self.pares += 1
+
+    def quitar(self, clave: str, doc: str):
+        docs = self._documentos.get(clave)
+        if not docs or doc not in docs:
+            return
+        docs.remove(doc)
+        self.pares -= 1
+        if not docs:
+            del self._documentos[clave]
+            cubeta = self._cubetas[clave[:2]]
+            del cubeta[bisect_left(cubeta, clave)]
+            if not cubeta:
+                del self._cubetas[clave[:2]]
+                del self._nombres[bisect_left(self._nombres, clave[:2])]
+
+    def _claves(self, prefijo: str) -> Iterator[str]:
+        """Claves que empiezan por el prefijo, en orden"""
+        if len(prefijo) >= 2:
+            nombres = [prefijo[:2]]
+        else:
+            inicio = bisect_left(self._nombres, prefijo)
+            nombres = self._nombres[inicio:bisect_left(self._nombres, prefijo + "\uffff")]
+        for nombre in nombres:
+            cubeta = self._cubetas.get(nombre, [])
+            pos = bisect_left(cubeta, prefijo)
+            while pos < len(cubeta) and cubeta[pos].startswith(prefijo):
+                yield cubeta[pos]
+                pos += 1
+
+    def documentos(self, prefijo: str) -> Iterator[str]:
+        """Documentos con alguna clave que empieza por el prefijo (las exactas primero)"""
+        for clave in self._claves(prefijo):
+            yield from self._documentos[clave]
+
+    def contar(self, prefijo: str, tope: int) -> int:
+        """Pares (clave, documento) del prefijo, contando solo hasta `tope`"""
+        total = 0
+        for clave in self._claves(prefijo):
+            total += len(self._documentos[clave])
+            if total >= tope:
+                break
+        return total
+
+
+def _entradas(rows: Iterable[dict]) -> Dict[str, Optional[_Entrada]]:
+    """Entradas por documento; None para los pacientes inactivos"""
+    return {
+        row["numero_documento"]: _Entrada(row) if row.get("activo", True) else None
+        for row in rows
+    }
+
+
+class IndiceSugerencias:
+    """
+    Índice de prefijos sobre las claves de cada paciente.
+
+    - Claves: cada palabra del nombre normalizado y el número de documento
+    - Búsqueda: rango del prefijo más selectivo y filtrado del resto de
+      palabras sobre las claves de cada candidato
+    - Se carga por lotes al iniciar (normalización y armado de la tabla en
+      un hilo, el índice nuevo se publica de una vez) y se mantiene con los
+      cambios hechos en este proceso y un refresco periódico por
+      ultima_actualizacion
+    """
+
+    def __init__(self):
+        self._tabla = _TablaClaves()
+        self._entradas: Dict[str, _Entrada] = {}
+        self._cargado = False
+        self._cargando = False
+        self._pendientes: Dict[str, Optional[dict]] = {}  # cambios durante la carga
+        self._ultima_marca: Optional[datetime] = None
+        self._tarea: Optional[asyncio.Task] = None
+        self._metricas = {"consultas": 0, "refrescos": 0, "errores": 0, "carga_ms": 0.0}
+
+    @property
+    def listo(self) -> bool:
+        return self._cargado
+
+    # ---------- mantenimiento ----------
+
+    def _quitar(self, numero_documento: str):
+        entrada = self._entradas.pop(numero_documento, None)
+        if entrada is None:
+            return
+        for clave in entrada.claves:
+            self._tabla.quitar(clave, numero_documento)
+
+    def _poner(self, numero_documento: str, entrada: Optional[_Entrada]):
+        self._quitar(numero_documento)
+        if entrada is None:
+            return
+        self._entradas[numero_documento] = entrada
+        for clave in entrada.claves:
+            self._tabla.agregar(clave, numero_documento)
+
+    def _marcar(self, row: dict):
+        marca = row.get("ultima_actualizacion")
+        if marca and (self._ultima_marca is None or marca > self._ultima_marca):
+            self._ultima_marca = marca
+
+    def actualizar(self, row: dict):
+        """Aplica un paciente creado/actualizado (fila completa de pacientes)"""
+        if self._cargando:
+            self._pendientes[row["numero_documento"]] = row
+        if self._cargado:
+            self._poner(row["numero_documento"], _Entrada(row) if row.get("activo", True) else None)
+
+    async def actualizar_lote(self, rows: List[dict]):
+        """
+        actualizar() para muchas filas: las entradas se arman en un hilo y
+        se aplican de a _APLICAR_POR_VUELTA, cediendo el event loop
+        """
+        if self._cargando:
+            for row in rows:
+                self._pendientes[row["numero_documento"]] = row
+        if not self._cargado:
+            return
+        entradas = list((await asyncio.to_thread(_entradas, rows)).items())
+        for inicio in range(0, len(entradas), _APLICAR_POR_VUELTA):
+            for doc, entrada in entradas[inicio:inicio + _APLICAR_POR_VUELTA]:
+                self._poner(doc, entrada)
+            await asyncio.sleep(0)
+
+    def eliminar(self, numero_documento: str):
+        """Quita un paciente (borrado lógico)"""
+        if self._cargando:
+            self._pendientes[numero_documento] = None
+        if self._cargado:
+            self._quitar(numero_documento)
+
+    async def cargar(self):
+        """Carga completa por lotes keyset (fecha_registro, id) sin bloquear la API"""
+        inicio = time.monotonic()
+        self._cargando = True
+        self._pendientes = {}
+        entradas: Dict[str, _Entrada] = {}
+        marca: Optional[datetime] = None
+        desde = None
+
+        try:
+            while True:
+                condicion = "activo = TRUE"
+                params: list = []
+                if desde:
+                    condicion += " AND (fecha_registro, id) < (%s, %s)"
+                    params.extend(desde)
+                params.append(SUGERENCIAS_LOTE_CARGA)
+
+                async with async_db_connection() as conn:
+                    async with conn.cursor() as cur:
+                        await cur.execute(f"""
+                            SELECT {COLUMNAS_INDICE}
+                            FROM public.pacientes
+                            WHERE {condicion}
+                            ORDER BY fecha_registro DESC, id DESC
+                            LIMIT %s
+                        """, params)
+                        rows = await cur.fetchall()
+
+                # Normalizar los nombres es lo costoso: en un hilo
+                entradas.update(await asyncio.to_thread(_entradas, rows))
+                for row in rows:
+                    if row["ultima_actualizacion"] and (marca is None or row["ultima_actualizacion"] > marca):
+                        marca = row["ultima_actualizacion"]
+
+                if len(rows) < SUGERENCIAS_LOTE_CARGA:
+                    break
+                desde = (rows[-1]["fecha_registro"], rows[-1]["id"])
+
+            tabla = await asyncio.to_thread(_TablaClaves.construir, entradas)
+            self._tabla, self._entradas = tabla, entradas
+            self._ultima_marca = marca
+            self._cargado = True
+
+            # Cambios locales ocurridos durante la carga
+            for doc, row in self._pendientes.items():
+                self._poner(doc, _Entrada(row) if row is not None and row.get("activo", True) else None)
+        finally:
+            self._cargando = False
+            self._pendientes = {}
+
+        self._metricas["carga_ms"] = round((time.monotonic() - inicio) * 1000, 1)
+
+    async def refrescar(self):
+        """Aplica los cambios hechos por otras réplicas desde el último refresco"""
+        if not self._cargado:
+            return
+        if self._ultima_marca is None:
+            # Tabla vacía al cargar: todo lo que haya ahora es nuevo
+            condicion, params = "TRUE", ()
+        else:
+            condicion, params = "ultima_actualizacion > %s", (self._ultima_marca - _SOLAPE_REFRESCO,)
+        async with async_db_connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(f"""
+                    SELECT {COLUMNAS_INDICE}
+                    FROM public.pacientes
+                    WHERE {condicion}
+                """, params)
+                rows = await cur.fetchall()
+        await self.actualizar_lote(rows)
+        for row in rows:
+            self._marcar(row)
+        self._metricas["refrescos"] += 1
+
+    async def _ciclo(self):
+        try:
+            await self.cargar()
+        except Exception as e:
+            self._metricas["errores"] += 1
+            print(f"Error cargando índice de sugerencias: {e}")
+        while True:
+            await asyncio.sleep(SUGERENCIAS_REFRESH_SECONDS)
+            try:
+                if self._cargado:
+                    await self.refrescar()
+                else:
+                    await self.cargar()
+            except Exception as e:
+                self._metricas["errores"] += 1
+                print(f"Error refrescando índice de sugerencias: {e}")
+
+    def iniciar(self):
+        if self._tarea is None:
+            self._tarea = asyncio.create_task(self._ciclo())
+
+    async def detener(self):
+        if self._tarea is not None:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
+
+    # ---------- consulta ----------
+
+    def sugerir(self, texto: str, k: int = 10) -> Optional[List[dict]]:
+        """
+        Top-k pacientes cuyas claves empiezan por cada palabra del texto.
+        Orden: documento exacto, palabras completas coincidentes, nombre.
+
+        Con varias palabras se intersectan sus documentos, del prefijo más
+        selectivo al menos selectivo. Si hasta el más selectivo supera
+        SUGERENCIAS_MAX_INTERSECCION devuelve None: el texto es demasiado
+        común para resolverlo en memoria y se busca en la BD.
+        """
+        self._metricas["consultas"] += 1
+        palabras = normalizar(texto).split()
+        if not palabras:
+            return []
+
+        tabla = self._tabla
+        entradas = self._entradas
+        conteos = {p: tabla.contar(p, SUGERENCIAS_MAX_INTERSECCION) for p in set(palabras)}
+        orden = sorted(conteos, key=conteos.get)
+
+        if len(orden) == 1:
+            # Una palabra: todas las coincidencias sirven, basta una ventana
+            # (las claves exactas salen primero)
+            docs = set(islice(tabla.documentos(orden[0]), SUGERENCIAS_MAX_CANDIDATOS))
+        elif conteos[orden[0]] >= SUGERENCIAS_MAX_INTERSECCION:
+            return None
+        else:
+            docs = set(tabla.documentos(orden[0]))
+            for p in orden[1:]:
+                if not docs:
+                    break
+                # Intersección con los documentos del prefijo, vía las claves de
+                # cada candidato (el conjunto ya acotado es el más chico)
+                docs = {
+                    doc for doc in docs
+                    if any(clave.startswith(p) for clave in entradas[doc].claves)
+                }
+
+        candidatos = []
+        for doc in docs:
+            entrada = entradas[doc]
+            exactas = sum(1 for p in palabras if p in entrada.claves)
+            # El documento desempata: las tuplas se comparan sin llegar a la entrada
+            candidatos.append((doc != palabras[0], -exactas, entrada.nombre_completo, doc))
+
+        return [entradas[c[3]].resumen() for c in heapq.nsmallest(k, candidatos)]
+
+    def estadisticas(self) -> dict:
+        return {
+            "listo": self._cargado,
+            "pacientes": len(self._entradas),
+            "claves": self._tabla.pares,
+            "ultima_actualizacion": self._ultima_marca.isoformat() if self._ultima_marca else None,
+            **self._metricas,
+        }
+
+
+# Instancia global por proceso
+indice_sugerencias = IndiceSugerencias()
@@ -0,0 +1,581 @@
+# backend/project/app/trabajos.py
+"""
+Cola de trabajos en segundo plano (tabla public.trabajos)
+La API encola y consulta; los workers (`python -m app.trabajos`) toman
+trabajos con FOR UPDATE SKIP LOCKED y guardan el resultado en la tabla
+"""
+
+import os
+import json
+import time
+import signal
+import asyncio
+import zipfile
+import argparse
+import tempfile
+import threading
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Dict, NamedTuple, Optional
+
+from psycopg.types.json import Jsonb
+from psycopg2 import Binary
+from psycopg2.extras import Json
+from dotenv import load_dotenv
+
+from app.database import async_db_connection, db_connection, close_pool
+from app.models import ExportacionLote, RolEnum
+from app.estadisticas import (
+    consultas_resumen, armar_resumen, reconciliar_estadisticas, consolidar_estadisticas,
+    ESTADISTICAS_RECONCILIAR_SECONDS, ESTADISTICAS_CONSOLIDAR_SECONDS
+)
+
+load_dotenv(override=False)
+
+# Configuración de workers
+TRABAJOS_POLL_SECONDS = float(os.getenv("TRABAJOS_POLL_SECONDS", 1))  # Espera con la cola vacía
+TRABAJOS_LATIDO_SECONDS = float(os.getenv("TRABAJOS_LATIDO_SECONDS", 15))  # Aviso de vida del worker
+TRABAJOS_HUERFANO_SECONDS = float(os.getenv("TRABAJOS_HUERFANO_SECONDS", 120))  # Sin latido: se reintenta
+TRABAJOS_MAX_INTENTOS = int(os.getenv("TRABAJOS_MAX_INTENTOS", 3))
+TRABAJOS_RETENCION_DIAS = int(os.getenv("TRABAJOS_RETENCION_DIAS", 7))  # Luego se borran con su resultado
+TRABAJOS_RESULTADO_MAX_MB = int(os.getenv("TRABAJOS_RESULTADO_MAX_MB", 200))  # Tope del archivo guardado en la tabla
+TRABAJOS_DESCARGA_PARTE_KB = int(os.getenv("TRABAJOS_DESCARGA_PARTE_KB", 1024))  # Bytes leídos por consulta al descargar
+TRABAJOS_ARCHIVO_PARTE_KB = int(os.getenv("TRABAJOS_ARCHIVO_PARTE_KB", 1024))  # Partes del archivo de entrada
+TRABAJOS_ARCHIVO_MAX_MB = int(os.getenv("TRABAJOS_ARCHIVO_MAX_MB", 200))  # Tope del archivo de entrada
+
+STAFF = (RolEnum.MEDICO, RolEnum.ADMISIONISTA, RolEnum.RESULTADOS, RolEnum.ADMIN)
+
+
+class Resultado(NamedTuple):
+    """Salida de un trabajo: se guarda en public.trabajos para descargarla"""
+    contenido: bytes
+    tipo: str
+    nombre: str
+
+
+class TipoTrabajo(NamedTuple):
+    ejecutar: Callable[[Dict[str, Any], "Progreso"], Resultado]
+    parametros: Optional[type]  # Modelo Pydantic que valida los parámetros en la API
+    roles: tuple
+    archivo: bool = False  # Se encola con un archivo de entrada (no desde POST /trabajos)
+
+
+class ArchivoExcedido(Exception):
+    """El archivo de entrada supera TRABAJOS_ARCHIVO_MAX_MB"""
+
+
+# ==================== TIPOS DE TRABAJO ====================
+
+TIPOS_TRABAJO: Dict[str, TipoTrabajo] = {}
+
+
+def tipo_trabajo(nombre: str, parametros: Optional[type] = None, roles: tuple = STAFF, archivo: bool = False):
+    """Registra una función como tipo de trabajo"""
+    def registrar(funcion):
+        TIPOS_TRABAJO[nombre] = TipoTrabajo(funcion, parametros, roles, archivo)
+        return funcion
+    return registrar
+
+
+class Progreso:
+    """Avance del trabajo en curso; se escribe en la tabla como máximo una vez por segundo"""
+
+    def __init__(self, trabajo_id: int):
+        self.trabajo_id = trabajo_id
+        self.datos: Dict[str, Any] = {}
+        self._ultimo = 0.0
+
+    def actualizar(self, forzar: bool = False, **datos):
+        self.datos.update(datos)
+        ahora = time.monotonic()
+        if not forzar and ahora - self._ultimo < 1:
+            return
+        self._ultimo = ahora
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                "UPDATE public.trabajos SET progreso = %s, latido = NOW() WHERE id = %s",
+                (Json(self.datos), self.trabajo_id)
+            )
+            conn.commit()
+            cur.close()
+
+
+@tipo_trabajo("exportar_pdf_lote", parametros=ExportacionLote)
+def _exportar_pdf_lote(parametros: Dict[str, Any], progreso: Progreso) -> Resultado:
+    """Mismo ZIP que POST /pacientes/pdf/lote, generado en el worker"""
+    from app.exportacion import SeleccionLotes
+    from app.pdf_generator import generar_pdf_paciente, preparar_datos_pdf
+
+    solicitud = ExportacionLote(**parametros)
+    seleccion = SeleccionLotes(solicitud)
+    fallidos = seleccion.fallidos
+    procesados = 0
+
+    def lotes():
+        while True:
+            consulta = seleccion.siguiente()
+            if consulta is None:
+                return
+            # Una conexión por lote: no se retiene mientras se generan los PDFs
+            with db_connection() as conn:
+                cur = conn.cursor()
+                cur.execute(*consulta)
+                rows = cur.fetchall()
+                cur.close()
+            yield seleccion.recibir(rows)
+
+    total = len(dict.fromkeys(solicitud.documentos)) if solicitud.documentos else None
+    progreso.actualizar(forzar=True, total=total, procesados=0, fallidos=0)
+
+    # El ZIP se arma en disco y solo se lee entero, con tope, al guardarlo
+    maximo = TRABAJOS_RESULTADO_MAX_MB * 1024 * 1024
+    with tempfile.TemporaryFile() as salida:
+        with zipfile.ZipFile(salida, mode="w", compression=zipfile.ZIP_STORED) as zf:
+            for rows in lotes():
+                for row in rows:
+                    try:
+                        pdf = generar_pdf_paciente(preparar_datos_pdf(row))
+                        zf.writestr(f"HC_{row['numero_documento']}.pdf", pdf)
+                    except Exception as e:
+                        fallidos.append(f"{row['numero_documento']}: {e}")
+                    procesados += 1
+                    progreso.actualizar(procesados=procesados, fallidos=len(fallidos))
+                    if salida.tell() > maximo:
+                        raise RuntimeError(
+                            f"El ZIP supera {TRABAJOS_RESULTADO_MAX_MB} MB tras {procesados} pacientes; "
+                            f"divida la exportación (menos documentos o un rango de fechas menor)"
+                        )
+            if fallidos:
+                zf.writestr("errores.txt", "\n".join(fallidos) + "\n")
+
+        progreso.actualizar(forzar=True, procesados=procesados, fallidos=len(fallidos))
+        salida.seek(0)
+        contenido = salida.read()
+
+    nombre = f"historias_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+    return Resultado(contenido, "application/zip", nombre)
+
+
+@tipo_trabajo("estadisticas", roles=(RolEnum.ADMIN,))
+def _estadisticas(parametros: Dict[str, Any], progreso: Progreso) -> Resultado:
+    """Reporte de estadísticas generales en JSON (desde los rollups)"""
+    with db_connection() as conn:
+        cur = conn.cursor()
+        resultados = {}
+        for nombre, query in consultas_resumen():
+            cur.execute(query)
+            resultados[nombre] = cur.fetchall()
+        cur.execute("SELECT COUNT(*) AS total FROM public.usuarios WHERE activo = TRUE")
+        total_usuarios = cur.fetchone()['total']
+        cur.close()
+
+    reporte = {
+        "generado": datetime.now().isoformat(),
+        **armar_resumen(resultados),
+        "total_usuarios": total_usuarios,
+    }
+    contenido = json.dumps(reporte, ensure_ascii=False, indent=2, default=str).encode("utf-8")
+    return Resultado(contenido, "application/json", f"estadisticas_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+
+
+@tipo_trabajo("reconciliar_estadisticas", roles=(RolEnum.ADMIN,))
+def _reconciliar_estadisticas(parametros: Dict[str, Any], progreso: Progreso) -> Resultado:
+    """Recalcula los rollups de estadísticas contra public.pacientes"""
+    resultado = reconciliar_estadisticas(db_connection)
+    if resultado is None:
+        raise RuntimeError("Otra reconciliación de estadísticas está en curso")
+    if resultado["celdas_corregidas"]:
+        print(f"Estadísticas reconciliadas: {resultado}")
+    progreso.actualizar(forzar=True, **resultado)
+    contenido = json.dumps(resultado, ensure_ascii=False, indent=2).encode("utf-8")
+    return Resultado(contenido, "application/json", "reconciliacion_estadisticas.json")
+
+
+@tipo_trabajo("importar_pacientes", roles=(RolEnum.ADMISIONISTA, RolEnum.ADMIN), archivo=True)
+def _importar_pacientes(parametros: Dict[str, Any], progreso: Progreso) -> Resultado:
+    """Importación de POST /pacientes/importar, leyendo el archivo guardado con el trabajo"""
+    from app.database import open_async_pool, close_async_pool
+    from app.importacion import importar_pacientes
+
+    insertadas = 0
+
+    async def al_insertar(rows):
+        nonlocal insertadas
+        insertadas += len(rows)
+        await asyncio.to_thread(progreso.actualizar, insertadas=insertadas)
+
+    async def importar():
+        # La importación usa el pool asíncrono, como la CLI
+        await open_async_pool()
+        try:
+            return await importar_pacientes(leer_archivo(progreso.trabajo_id), parametros["formato"], al_insertar)
+        finally:
+            await close_async_pool()
+
+    progreso.actualizar(forzar=True, insertadas=0)
+    resumen = asyncio.run(importar())
+    progreso.actualizar(forzar=True, **{
+        campo: resumen[campo] for campo in ("leidas", "insertadas", "duplicadas", "invalidas")
+    })
+
+    # Reintentar ya no hace falta: el archivo se libera
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM public.trabajos_archivos WHERE trabajo_id = %s", (progreso.trabajo_id,))
+        conn.commit()
+        cur.close()
+
+    contenido = json.dumps(resumen, ensure_ascii=False, indent=2, default=str).encode("utf-8")
+    return Resultado(contenido, "application/json", f"importacion_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+
+
+# ==================== API (ASÍNCRONO) ====================
+
+COLUMNAS_TRABAJO = """
+    id, tipo, parametros, estado, username, intentos, progreso, error,
+    resultado_tipo, resultado_nombre, octet_length(resultado) AS resultado_bytes,
+    fecha_creacion, fecha_inicio, fecha_fin
+"""
+
+
+async def encolar_trabajo(tipo: str, parametros: Dict[str, Any], username: str) -> dict:
+    """Inserta un trabajo pendiente; un worker lo tomará en segundos"""
+    async with async_db_connection() as conn:
+        cur = conn.cursor()
+        await cur.execute(f"""
+            INSERT INTO public.trabajos (tipo, parametros, username)
+            VALUES (%s, %s, %s)
+            RETURNING {COLUMNAS_TRABAJO}
+        """, (tipo, Jsonb(parametros), username))
+        row = await cur.fetchone()
+        await conn.commit()
+        await cur.close()
+    return dict(row)
+
+
+async def _guardar_parte(trabajo_id: int, parte: int, datos: bytes):
+    async with async_db_connection() as conn:
+        cur = conn.cursor()
+        await cur.execute(
+            "INSERT INTO public.trabajos_archivos (trabajo_id, parte, datos) VALUES (%s, %s, %s)",
+            (trabajo_id, parte, datos)
+        )
+        await conn.commit()
+        await cur.close()
+
+
+async def encolar_trabajo_con_archivo(
+    tipo: str,
+    parametros: Dict[str, Any],
+    username: str,
+    bloques: AsyncIterator[bytes]
+) -> dict:
+    """
+    Guarda el archivo por partes de TRABAJOS_ARCHIVO_PARTE_KB y luego deja
+    el trabajo pendiente. Mientras se recibe queda 'recibiendo' (ningún
+    worker lo toma) y cada parte usa una conexión del pool solo para su
+    INSERT. Si la recepción falla, el trabajo se borra con lo recibido.
+    ArchivoExcedido si supera TRABAJOS_ARCHIVO_MAX_MB.
+    """
+    async with async_db_connection() as conn:
+        cur = conn.cursor()
+        await cur.execute("""
+            INSERT INTO public.trabajos (tipo, parametros, username, estado)
+            VALUES (%s, %s, %s, 'recibiendo')
+            RETURNING id
+        """, (tipo, Jsonb(parametros), username))
+        trabajo_id = (await cur.fetchone())['id']
+        await conn.commit()
+        await cur.close()
+
+    tamano_parte = TRABAJOS_ARCHIVO_PARTE_KB * 1024
+    maximo = TRABAJOS_ARCHIVO_MAX_MB * 1024 * 1024
+    try:
+        buffer = bytearray()
+        partes = 0
+        total = 0
+        async for bloque in bloques:
+            total += len(bloque)
+            if total > maximo:
+                raise ArchivoExcedido(f"El archivo supera {TRABAJOS_ARCHIVO_MAX_MB} MB; divídalo en varios")
+            buffer += bloque
+            while len(buffer) >= tamano_parte:
+                await _guardar_parte(trabajo_id, partes, bytes(buffer[:tamano_parte]))
+                del buffer[:tamano_parte]
+                partes += 1
+        if buffer:
+            await _guardar_parte(trabajo_id, partes, bytes(buffer))
+
+        async with async_db_connection() as conn:
+            cur = conn.cursor()
+            await cur.execute(f"""
+                UPDATE public.trabajos
+                SET estado = 'pendiente', fecha_creacion = NOW()
+                WHERE id = %s
+                RETURNING {COLUMNAS_TRABAJO}
+            """, (trabajo_id,))
+            row = await cur.fetchone()
+            await conn.commit()
+            await cur.close()
+        return dict(row)
+    except BaseException:
+        # Incluye la cancelación (el cliente cortó la subida)
+        async with async_db_connection() as conn:
+            cur = conn.cursor()
+            await cur.execute("DELETE FROM public.trabajos WHERE id = %s", (trabajo_id,))
+            await conn.commit()
+            await cur.close()
+        raise
+
+
+async def leer_archivo(trabajo_id: int) -> AsyncIterator[bytes]:
+    """Archivo de entrada de un trabajo, parte por parte (una consulta por parte)"""
+    parte = 0
+    while True:
+        async with async_db_connection() as conn:
+            cur = conn.cursor()
+            await cur.execute(
+                "SELECT datos FROM public.trabajos_archivos WHERE trabajo_id = %s AND parte = %s",
+                (trabajo_id, parte)
+            )
+            row = await cur.fetchone()
+            await cur.close()
+        if row is None:
+            return
+        yield bytes(row['datos'])
+        parte += 1
+
+
+async def obtener_trabajo(trabajo_id: int) -> Optional[dict]:
+    """Estado de un trabajo, sin el resultado"""
+    async with async_db_connection() as conn:
+        cur = conn.cursor()
+        await cur.execute(
+            f"SELECT {COLUMNAS_TRABAJO} FROM public.trabajos WHERE id = %s", (trabajo_id,)
+        )
+        row = await cur.fetchone()
+        await cur.close()
+    return dict(row) if row else None
+
+
+async def leer_resultado(trabajo_id: int, total_bytes: int) -> AsyncIterator[bytes]:
+    """
+    Resultado de un trabajo por partes de TRABAJOS_DESCARGA_PARTE_KB. La
+    columna no se comprime (STORAGE EXTERNAL): cada substring lee solo sus
+    bloques, y la conexión vuelve al pool mientras se envía cada parte.
+    """
+    parte = TRABAJOS_DESCARGA_PARTE_KB * 1024
+    for inicio in range(0, total_bytes, parte):
+        async with async_db_connection() as conn:
+            cur = conn.cursor()
+            await cur.execute(
+                "SELECT substring(resultado FROM %s FOR %s) AS parte FROM public.trabajos WHERE id = %s",
+                (inicio + 1, parte, trabajo_id)
+            )
+            row = await cur.fetchone()
+            await cur.close()
+        if row is None or not row['parte']:
+            raise RuntimeError(f"El resultado del trabajo {trabajo_id} ya no está disponible")
+        yield bytes(row['parte'])
+
+
+# ==================== WORKER ====================
+
+def reclamar_trabajo() -> Optional[dict]:
+    """
+    Toma el trabajo pendiente más antiguo (o uno huérfano cuyo worker dejó
+    de dar latido). SKIP LOCKED: varios workers nunca toman el mismo.
+    """
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE public.trabajos
+            SET estado = 'en_curso', intentos = intentos + 1,
+                fecha_inicio = NOW(), latido = NOW(), error = NULL
+            WHERE id = (
+                SELECT id FROM public.trabajos
+                WHERE estado = 'pendiente'
+                   OR (estado = 'en_curso' AND latido < NOW() - make_interval(secs => %s))
+                ORDER BY fecha_creacion
+                FOR UPDATE SKIP LOCKED
+                LIMIT 1
+            )
+            RETURNING id, tipo, parametros, username, intentos
+        """, (TRABAJOS_HUERFANO_SECONDS,))
+        trabajo = cur.fetchone()
+        conn.commit()
+        cur.close()
+    return dict(trabajo) if trabajo else None
+
+
+def _finalizar(trabajo_id: int, resultado: Optional[Resultado] = None, error: Optional[str] = None):
+    with db_connection() as conn:
+        cur = conn.cursor()
+        if resultado is not None:
+            cur.execute("""
+                UPDATE public.trabajos
+                SET estado = 'completado', resultado = %s, resultado_tipo = %s,
+                    resultado_nombre = %s, fecha_fin = NOW(), latido = NOW()
+                WHERE id = %s
+            """, (Binary(resultado.contenido), resultado.tipo, resultado.nombre, trabajo_id))
+        else:
+            cur.execute("""
+                UPDATE public.trabajos
+                SET estado = 'error', error = %s, fecha_fin = NOW(), latido = NOW()
+                WHERE id = %s
+            """, (error, trabajo_id))
+        conn.commit()
+        cur.close()
+
+
+class _Latido(threading.Thread):
+    """Mantiene el latido mientras el trabajo corre, aunque no reporte avance"""
+
+    def __init__(self, trabajo_id: int):
+        super().__init__(daemon=True, name=f"latido-{trabajo_id}")
+        self.trabajo_id = trabajo_id
+        self.detener = threading.Event()
+
+    def run(self):
+        while not self.detener.wait(TRABAJOS_LATIDO_SECONDS):
+            try:
+                with db_connection() as conn:
+                    cur = conn.cursor()
+                    cur.execute("UPDATE public.trabajos SET latido = NOW() WHERE id = %s", (self.trabajo_id,))
+                    conn.commit()
+                    cur.close()
+            except Exception as e:
+                print(f"Error actualizando latido del trabajo {self.trabajo_id}: {e}")
+
+
+def ejecutar_trabajo(trabajo: dict):
+    """Ejecuta un trabajo reclamado y guarda su resultado o error"""
+    trabajo_id = trabajo['id']
+    tipo = TIPOS_TRABAJO.get(trabajo['tipo'])
+
+    if tipo is None:
+        _finalizar(trabajo_id, error=f"Tipo de trabajo desconocido: {trabajo['tipo']}")
+        return
+    if trabajo['intentos'] > TRABAJOS_MAX_INTENTOS:
+        _finalizar(trabajo_id, error="Se agotaron los intentos (el worker se detuvo durante la ejecución)")
+        return
+
+    latido = _Latido(trabajo_id)
+    latido.start()
+    inicio = time.monotonic()
+    try:
+        resultado = tipo.ejecutar(trabajo['parametros'] or {}, Progreso(trabajo_id))
+        _finalizar(trabajo_id, resultado=resultado)
+        print(f"Trabajo {trabajo_id} ({trabajo['tipo']}) completado en {time.monotonic() - inicio:.1f}s")
+    except Exception as e:
+        _finalizar(trabajo_id, error=str(e))
+        print(f"Trabajo {trabajo_id} ({trabajo['tipo']}) falló: {e}")
+    finally:
+        latido.detener.set()
+        latido.join()
+
+
+def purgar_trabajos() -> int:
+    """
+    Borra trabajos terminados (con sus archivos y resultados) más viejos que
+    la retención, y las subidas que quedaron a medias hace más de un día
+    """
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            DELETE FROM public.trabajos
+            WHERE (estado IN ('completado', 'error')
+                   AND fecha_fin < NOW() - make_interval(days => %s))
+               OR (estado = 'recibiendo' AND fecha_creacion < NOW() - INTERVAL '1 day')
+        """, (TRABAJOS_RETENCION_DIAS,))
+        borrados = cur.rowcount
+        conn.commit()
+        cur.close()
+    return borrados
+
+
+def programar_reconciliacion() -> bool:
+    """
+    Encola la reconciliación de estadísticas si no hay una pendiente, en
+    curso o creada dentro de ESTADISTICAS_RECONCILIAR_SECONDS. El registro
+    queda en la tabla: reiniciar los workers no la vuelve a disparar.
+    """
+    with db_connection() as conn:
+        cur = conn.cursor()
+        # Varios workers revisan a la vez: solo uno encola
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext('programar_reconciliacion'))")
+        cur.execute("""
+            INSERT INTO public.trabajos (tipo, username)
+            SELECT 'reconciliar_estadisticas', 'sistema'
+            WHERE NOT EXISTS (
+                SELECT 1 FROM public.trabajos
+                WHERE tipo = 'reconciliar_estadisticas'
+                  AND (estado IN ('pendiente', 'en_curso')
+                       OR fecha_creacion > NOW() - make_interval(secs => %s))
+            )
+        """, (ESTADISTICAS_RECONCILIAR_SECONDS,))
+        encolado = cur.rowcount > 0
+        conn.commit()
+        cur.close()
+    return encolado
+
+
+def trabajar(una_vez: bool = False):
+    """Bucle del worker: reclama y ejecuta trabajos hasta recibir SIGTERM/SIGINT"""
+    detener = threading.Event()
+    for senal in (signal.SIGTERM, signal.SIGINT):
+        # El trabajo en curso termina; luego el worker sale
+        signal.signal(senal, lambda *_: detener.set())
+
+    ultima_purga = None
+    ultima_programacion = None
+    ultima_consolidacion = None
+    while not detener.is_set():
+        try:
+            if ultima_purga is None or time.monotonic() - ultima_purga > 3600:
+                ultima_purga = time.monotonic()
+                borrados = purgar_trabajos()
+                if borrados:
+                    print(f"Trabajos purgados: {borrados}")
+
+            if ESTADISTICAS_RECONCILIAR_SECONDS > 0 and (
+                ultima_programacion is None or time.monotonic() - ultima_programacion > 60
+            ):
+                # Se ejecuta como un trabajo más, en el worker que lo tome
+                ultima_programacion = time.monotonic()
+                if programar_reconciliacion():
+                    print("Reconciliación de estadísticas encolada")
+
+            if ESTADISTICAS_CONSOLIDAR_SECONDS > 0 and (
+                ultima_consolidacion is None
+                or time.monotonic() - ultima_consolidacion > ESTADISTICAS_CONSOLIDAR_SECONDS
+            ):
+                # Deltas de estadísticas registrados por las escrituras -> rollup
+                ultima_consolidacion = time.monotonic()
+                consolidar_estadisticas(db_connection)
+
+            trabajo = reclamar_trabajo()
+            if trabajo:
+                ejecutar_trabajo(trabajo)
+                continue
+            if una_vez:
+                break
+        except Exception as e:
+            print(f"Error en el worker de trabajos: {e}")
+        detener.wait(TRABAJOS_POLL_SECONDS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker de la cola de trabajos")
+    parser.add_argument("--una-vez", action="store_true", help="Procesar lo pendiente y salir")
+    args = parser.parse_args()
+
+    print(f"Worker de trabajos iniciado (pid {os.getpid()}): {', '.join(TIPOS_TRABAJO)}")
+    try:
+        trabajar(una_vez=args.una_vez)
+    finally:
+        close_pool()
+
+
+if __name__ == "__main__":
+    main()
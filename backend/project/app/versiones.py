@@ -0,0 +1,74 @@
+# backend/project/app/versiones.py
+"""
+Versiones de registros para ETag / If-Match (concurrencia optimista)
+La versión de un paciente es su columna ultima_actualizacion
+"""
+
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+_EPOCA = datetime(1970, 1, 1)
+_MICROSEGUNDO = timedelta(microseconds=1)
+
+
+class VersionInvalida(ValueError):
+    """El header If-Match no contiene una versión reconocible"""
+
+
+def etag_version(ultima_actualizacion: Optional[datetime]) -> Optional[str]:
+    """
+    ETag fuerte a partir de ultima_actualizacion (TIMESTAMP, precisión de
+    microsegundos). Se codifica como entero para que el valor sea exacto
+    al volver a la base de datos.
+    """
+    if ultima_actualizacion is None:
+        return None
+    marca = ultima_actualizacion.replace(tzinfo=None)
+    return f'"{(marca - _EPOCA) // _MICROSEGUNDO}"'
+
+
+def parsear_if_match(valor: Optional[str]) -> Optional[List[datetime]]:
+    """
+    Convierte un header If-Match en la lista de versiones aceptadas.
+
+    Retorna None si no hay condición (header ausente o `*`).
+
+    Raises:
+        VersionInvalida: Si alguna etiqueta no es una versión válida
+    """
+    if valor is None or valor.strip() == "*":
+        return None
+
+    versiones = []
+    for etiqueta in valor.split(","):
+        etiqueta = etiqueta.strip()
+        if etiqueta.startswith("W/"):
+            # If-Match usa comparación fuerte: una etiqueta débil no coincide
+            raise VersionInvalida("If-Match no admite ETags débiles")
+        try:
+            versiones.append(_EPOCA + int(etiqueta.strip('"')) * _MICROSEGUNDO)
+        except (ValueError, OverflowError):
+            raise VersionInvalida(f"Versión inválida en If-Match: {etiqueta}")
+
+    if not versiones:
+        raise VersionInvalida("If-Match vacío")
+    return versiones
+
+
+def coincide_if_none_match(valor: Optional[str], etag: Optional[str]) -> bool:
+    """
+    True si el header If-None-Match incluye el ETag actual (el cliente ya
+    tiene esa versión y se puede responder 304). Usa comparación débil.
+    """
+    if not valor or not etag:
+        return False
+    if valor.strip() == "*":
+        return True
+    actual = etag[2:] if etag.startswith("W/") else etag
+    for etiqueta in valor.split(","):
+        etiqueta = etiqueta.strip()
+        if etiqueta.startswith("W/"):
+            etiqueta = etiqueta[2:]
+        if etiqueta == actual:
+            return True
+    return False
@@ -0,0 +1,101 @@
+# backend/project/benchmarks/bench_arranque.py
+"""
+Benchmark de arranque de la API basado en `python -X importtime`
+
+Mide cuánto tarda `import app.main` en un intérprete nuevo (lo que paga
+cada worker de uvicorn y cada pod al reiniciar) y lista los módulos más
+costosos. Con --con-pdf mide además lo que costaría cargar el motor de
+PDF al arrancar (WeasyPrint + Jinja), que ahora solo se carga en los
+procesos de render.
+
+Uso (desde backend/project):
+    python -m benchmarks.bench_arranque --n 5 --top 15
+    python -m benchmarks.bench_arranque --con-pdf
+"""
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+PROYECTO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_API = "import app.main"
+IMPORT_PDF = "import app.main; from app.pdf_generator import _template, _recursos_weasyprint; _template(); _recursos_weasyprint()"
+
+_LINEA = re.compile(r"^import time:\s+(\d+)\s+\|\s+\d+\s+\|\s*(\S+)")
+
+
+def importtime(codigo: str) -> Tuple[float, Dict[str, int]]:
+    """
+    Ejecuta el código con -X importtime en un proceso nuevo.
+    Retorna (total en ms, {paquete raíz: tiempo propio sumado en µs}).
+    """
+    proceso = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", codigo],
+        cwd=PROYECTO, capture_output=True, text=True
+    )
+    if proceso.returncode != 0:
+        raise RuntimeError(proceso.stderr.strip().splitlines()[-1])
+
+    total_us = 0
+    por_paquete: Dict[str, int] = {}
+    for linea in proceso.stderr.splitlines():
+        m = _LINEA.match(linea)
+        if not m:
+            continue
+        propio, raiz = int(m[1]), m[2].split(".")[0]
+        total_us += propio
+        por_paquete[raiz] = por_paquete.get(raiz, 0) + propio
+    return total_us / 1000, por_paquete
+
+
+def medir(codigo: str, n: int) -> Tuple[List[float], Dict[str, int]]:
+    totales = []
+    por_paquete: Dict[str, int] = {}
+    for _ in range(n):
+        total, por_paquete = importtime(codigo)
+        totales.append(total)
+    return totales, por_paquete
+
+
+def resumen(nombre: str, totales: List[float]):
+    print(
+        f"{nombre:<22} mediana={statistics.median(totales):8.1f} ms  "
+        f"min={min(totales):8.1f} ms  max={max(totales):8.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tiempo de importación de la API")
+    parser.add_argument("--n", type=int, default=5, help="Repeticiones (intérprete nuevo cada vez)")
+    parser.add_argument("--top", type=int, default=15, help="Módulos más costosos a listar")
+    parser.add_argument("--con-pdf", action="store_true", help="Comparar con el motor de PDF cargado")
+    args = parser.parse_args()
+
+    totales, por_paquete = medir(IMPORT_API, args.n)
+    resumen("import app.main", totales)
+
+    if args.con_pdf:
+        try:
+            totales_pdf, _ = medir(IMPORT_PDF, args.n)
+            resumen("+ motor de PDF", totales_pdf)
+            print(f"{'ahorro por proceso':<22} {statistics.median(totales_pdf) - statistics.median(totales):8.1f} ms")
+        except RuntimeError as e:
+            print(f"No se pudo cargar el motor de PDF: {e}")
+
+    cargados = set(por_paquete)
+    for pesado in ("weasyprint", "jinja2"):
+        estado = "CARGADO AL ARRANCAR" if pesado in cargados else "diferido"
+        print(f"{pesado:<22} {estado}")
+
+    print("\nPaquetes más costosos (tiempo propio de sus módulos, última corrida):")
+    for modulo, us in sorted(por_paquete.items(), key=lambda m: m[1], reverse=True)[:args.top]:
+        print(f"  {modulo:<30} {us / 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# backend/project/benchmarks/bench_pdf.py
+"""
+Microbenchmark de generación de PDF de historia clínica
+
+Compara el camino anterior (template y CSS parseados en cada PDF) con el
+actual (template compilado una vez, CSS y fuentes compartidos).
+
+Uso (desde backend/project):
+    python -m benchmarks.bench_pdf --n 20
+"""
+
+import argparse
+import statistics
+import time
+from datetime import date, datetime
+
+from jinja2 import Template
+from weasyprint import HTML, CSS
+
+from app.pdf_generator import HTML_TEMPLATE, ESTILOS_CSS, generar_pdf_paciente
+
+PACIENTE = {
+    "tipo_documento": "CC", "numero_documento": "12345",
+    "primer_nombre": "Juan", "segundo_nombre": "Carlos",
+    "primer_apellido": "Pérez", "segundo_apellido": "Gómez",
+    "fecha_nacimiento": date(1985, 5, 15).isoformat(), "edad": 40,
+    "sexo": "M", "genero": "Masculino", "estado_civil": "Casado",
+    "ocupacion": "Ingeniero", "direccion_residencia": "Calle 10 # 20-30",
+    "municipio": "Medellín", "departamento": "Antioquia",
+    "telefono": "6041234567", "celular": "3001234567",
+    "correo_electronico": "juan.perez@example.com",
+    "regimen_afiliacion": "Contributivo", "entidad": "EPS Sura",
+    "tipo_usuario": "Cotizante", "grupo_sanguineo": "O", "factor_rh": "+",
+    "fecha_atencion": datetime(2025, 1, 10, 9, 30).isoformat(),
+    "tipo_atencion": "Consulta externa",
+    "motivo_consulta": "Dolor torácico de 2 días de evolución",
+    "enfermedad_actual": "Paciente refiere dolor opresivo en reposo. " * 8,
+    "antecedentes_personales": "HTA en tratamiento. " * 4,
+    "antecedentes_familiares": "Padre con cardiopatía isquémica.",
+    "alergias_conocidas": "Penicilina", "habitos": "No fuma",
+    "medicamentos_actuales": "Losartán 50 mg cada 12 horas",
+    "tension_arterial": "130/85", "frecuencia_cardiaca": 78,
+    "frecuencia_respiratoria": 16, "temperatura": 36.7,
+    "saturacion_oxigeno": 97, "peso": 78.5, "talla": 175, "imc": 25.63,
+    "examen_fisico_general": "Alerta, orientado, hidratado. " * 6,
+    "examen_fisico_sistemas": "Ruidos cardiacos rítmicos sin soplos. " * 6,
+    "impresion_diagnostica": "Dolor torácico atípico",
+    "codigos_cie": "R07.4", "diagnostico_definitivo": "Dolor torácico no especificado",
+    "conducta_plan": "Electrocardiograma, troponinas y control. " * 4,
+    "tratamiento_instaurado": "Acetaminofén 1 g", "formulacion_medica": "Acetaminofén 1 g cada 8 horas",
+    "procedimientos_realizados": "Electrocardiograma",
+    "resultados_examenes": "EKG sin alteraciones agudas",
+    "evolucion_medica": "Evoluciona estable. " * 6,
+    "recomendaciones": "Consultar por urgencias si el dolor aumenta",
+    "educacion_paciente": "Signos de alarma explicados",
+    "estado_egreso": "Vivo", "fecha_cierre": datetime(2025, 1, 10, 12, 0).isoformat(),
+    "nombre_profesional": "Dr. Carlos Rodríguez", "tipo_profesional": "Médico general",
+    "registro_medico": "RM-12345", "cargo_servicio": "Consulta externa",
+    "responsable_registro": "dr_rodriguez",
+}
+
+
+def pdf_sin_cache(paciente: dict) -> bytes:
+    """Camino anterior: compila el template y parsea el CSS en cada PDF"""
+    html = Template(HTML_TEMPLATE).render(
+        paciente=paciente,
+        fecha_generacion=datetime.now().strftime("%d/%m/%Y %H:%M:%S")
+    )
+    return HTML(string=html).write_pdf(stylesheets=[CSS(string=ESTILOS_CSS)])
+
+
+def medir(funcion, n: int) -> list:
+    tiempos = []
+    for _ in range(n):
+        inicio = time.perf_counter()
+        funcion(PACIENTE)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return tiempos
+
+
+def resumen(nombre: str, tiempos: list):
+    ordenados = sorted(tiempos)
+    p95 = ordenados[max(0, int(len(ordenados) * 0.95) - 1)]
+    print(
+        f"{nombre:<12} media={statistics.mean(tiempos):8.1f} ms  "
+        f"mediana={statistics.median(tiempos):8.1f} ms  p95={p95:8.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latencia por PDF antes/después")
+    parser.add_argument("--n", type=int, default=20, help="PDFs por variante")
+    args = parser.parse_args()
+
+    # Calentamiento: carga de fuentes de fontconfig/pango en ambos caminos
+    pdf_sin_cache(PACIENTE)
+    generar_pdf_paciente(PACIENTE)
+
+    resumen("antes", medir(pdf_sin_cache, args.n))
+    resumen("después", medir(generar_pdf_paciente, args.n))
+
+    inicio = time.perf_counter()
+    for _ in range(args.n):
+        Template(HTML_TEMPLATE)
+    compilar = (time.perf_counter() - inicio) * 1000 / args.n
+    print(f"compilación del template evitada por PDF: {compilar:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,15 @@
+-- ========================================
+-- ÉPOCA DE REVOCACIÓN DE TOKENS
+-- Se incrementa al desactivar o modificar un usuario; los tokens
+-- emitidos con una época anterior dejan de ser válidos.
+-- ========================================
+
+\connect historiaclinica
+
+ALTER TABLE public.usuarios
+    ADD COLUMN IF NOT EXISTS token_epoch INTEGER NOT NULL DEFAULT 0;
+
+-- Consulta periódica de revocaciones (solo usuarios revocados o inactivos)
+CREATE INDEX IF NOT EXISTS idx_usuarios_revocados
+    ON public.usuarios(username)
+    WHERE token_epoch > 0 OR activo = FALSE;
@@ -0,0 +1,19 @@
+-- ========================================
+-- PAGINACIÓN POR CURSOR (KEYSET) DE PACIENTES
+-- GET /pacientes ordena por (fecha_registro DESC, id DESC) y continúa
+-- desde la última clave vista: cada shard lee solo LIMIT filas del índice.
+-- ========================================
+
+\connect historiaclinica
+
+-- La clave de orden no puede ser NULL
+UPDATE public.pacientes
+SET fecha_registro = COALESCE(fecha_atencion, NOW())
+WHERE fecha_registro IS NULL;
+
+ALTER TABLE public.pacientes ALTER COLUMN fecha_registro SET NOT NULL;
+
+-- Índice de la clave de orden (solo pacientes activos)
+CREATE INDEX IF NOT EXISTS idx_pacientes_registro_keyset
+    ON public.pacientes (fecha_registro DESC, id DESC)
+    WHERE activo = TRUE;
@@ -0,0 +1,48 @@
+-- ========================================
+-- BÚSQUEDA DE PACIENTES CON TRIGRAMAS (pg_trgm + unaccent)
+-- Índices GIN sobre el nombre completo normalizado (sin tildes, en
+-- minúsculas) y sobre numero_documento: las búsquedas con comodín
+-- inicial ('%texto%') y por similitud dejan de recorrer todos los shards.
+-- ========================================
+
+\connect historiaclinica
+
+-- Citus propaga las extensiones a los workers
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE EXTENSION IF NOT EXISTS unaccent;
+
+-- unaccent() es STABLE; este envoltorio IMMUTABLE permite indexarlo.
+-- Debe coincidir con app.busqueda.normalizar()
+CREATE OR REPLACE FUNCTION public.normalizar_texto(texto TEXT)
+RETURNS TEXT
+LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+AS $$
+    SELECT lower(public.unaccent('public.unaccent'::regdictionary, texto))
+$$;
+
+-- Nombre completo normalizado (los cuatro campos de nombre)
+CREATE OR REPLACE FUNCTION public.nombre_busqueda(
+    primer_nombre TEXT,
+    segundo_nombre TEXT,
+    primer_apellido TEXT,
+    segundo_apellido TEXT
+)
+RETURNS TEXT
+LANGUAGE sql IMMUTABLE PARALLEL SAFE
+AS $$
+    SELECT public.normalizar_texto(
+        concat_ws(' ', primer_nombre, segundo_nombre, primer_apellido, segundo_apellido)
+    )
+$$;
+
+-- Las funciones deben existir en los workers para los índices de cada shard
+SELECT create_distributed_function('public.normalizar_texto(text)');
+SELECT create_distributed_function('public.nombre_busqueda(text, text, text, text)');
+
+CREATE INDEX IF NOT EXISTS idx_pacientes_nombre_trgm
+    ON public.pacientes
+    USING gin (public.nombre_busqueda(primer_nombre, segundo_nombre, primer_apellido, segundo_apellido) gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS idx_pacientes_documento_trgm
+    ON public.pacientes
+    USING gin (numero_documento gin_trgm_ops);
@@ -0,0 +1,15 @@
+-- ========================================
+-- ÍNDICE DE SUGERENCIAS (TYPEAHEAD)
+-- Cada réplica de la API mantiene un índice de prefijos en memoria y
+-- cada SUGERENCIAS_REFRESH_SECONDS pide solo las filas modificadas.
+-- ========================================
+
+\connect historiaclinica
+
+UPDATE public.pacientes
+SET ultima_actualizacion = COALESCE(fecha_registro, NOW())
+WHERE ultima_actualizacion IS NULL;
+
+-- Incluye inactivos: el refresco también debe ver los borrados lógicos
+CREATE INDEX IF NOT EXISTS idx_pacientes_ultima_actualizacion
+    ON public.pacientes (ultima_actualizacion);
@@ -0,0 +1,44 @@
+-- ========================================
+-- COLA DE TRABAJOS EN SEGUNDO PLANO
+-- Exportaciones, reportes e importaciones largas. La API inserta el
+-- trabajo y responde de inmediato; los procesos `python -m app.trabajos`
+-- los toman con FOR UPDATE SKIP LOCKED y guardan el resultado.
+-- Tabla local del coordinador (como usuarios): no se distribuye.
+-- ========================================
+
+\connect historiaclinica
+
+CREATE TABLE IF NOT EXISTS public.trabajos (
+    id BIGSERIAL PRIMARY KEY,
+    tipo VARCHAR(50) NOT NULL,
+    parametros JSONB NOT NULL DEFAULT '{}'::jsonb,
+    estado VARCHAR(20) NOT NULL DEFAULT 'pendiente'
+        CHECK (estado IN ('pendiente', 'en_curso', 'completado', 'error')),
+    username VARCHAR(50) NOT NULL,
+    intentos INTEGER NOT NULL DEFAULT 0,
+    progreso JSONB,
+    error TEXT,
+    resultado BYTEA,
+    resultado_tipo VARCHAR(100),
+    resultado_nombre VARCHAR(200),
+    fecha_creacion TIMESTAMP NOT NULL DEFAULT NOW(),
+    fecha_inicio TIMESTAMP,
+    fecha_fin TIMESTAMP,
+    latido TIMESTAMP  -- Último aviso de vida del worker que lo ejecuta
+);
+
+-- Reclamar el siguiente trabajo: solo recorre los pendientes
+CREATE INDEX IF NOT EXISTS idx_trabajos_pendientes
+    ON public.trabajos (fecha_creacion)
+    WHERE estado = 'pendiente';
+
+-- Trabajos huérfanos (worker caído) para reintentar
+CREATE INDEX IF NOT EXISTS idx_trabajos_en_curso
+    ON public.trabajos (latido)
+    WHERE estado = 'en_curso';
+
+CREATE INDEX IF NOT EXISTS idx_trabajos_username
+    ON public.trabajos (username, fecha_creacion DESC);
+
+-- El resultado binario no se comprime (PDF/ZIP ya lo están)
+ALTER TABLE public.trabajos ALTER COLUMN resultado SET STORAGE EXTERNAL;
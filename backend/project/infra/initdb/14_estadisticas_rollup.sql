@@ -0,0 +1,33 @@
+-- ========================================
+-- ESTADÍSTICAS PRE-AGREGADAS DE PACIENTES
+-- Pacientes activos por día de registro, tipo de atención, sexo y
+-- régimen. La API aplica los deltas en la misma transacción que cada
+-- alta, edición o borrado lógico; /estadisticas lee solo esta tabla.
+-- El worker de trabajos la reconcilia periódicamente contra pacientes.
+-- Tabla local del coordinador: pocas filas y escrituras de una fila.
+-- ========================================
+
+\connect historiaclinica
+
+CREATE TABLE IF NOT EXISTS public.estadisticas_pacientes (
+    dia DATE NOT NULL,
+    -- '' representa NULL: las columnas forman la clave primaria
+    tipo_atencion VARCHAR(50) NOT NULL DEFAULT '',
+    sexo VARCHAR(10) NOT NULL DEFAULT '',
+    regimen_afiliacion VARCHAR(50) NOT NULL DEFAULT '',
+    total BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (dia, tipo_atencion, sexo, regimen_afiliacion)
+);
+
+-- Carga inicial desde los datos existentes
+INSERT INTO public.estadisticas_pacientes (dia, tipo_atencion, sexo, regimen_afiliacion, total)
+SELECT fecha_registro::date,
+       COALESCE(tipo_atencion, ''),
+       COALESCE(sexo, ''),
+       COALESCE(regimen_afiliacion, ''),
+       COUNT(*)
+FROM public.pacientes
+WHERE activo = TRUE
+GROUP BY 1, 2, 3, 4
+ON CONFLICT (dia, tipo_atencion, sexo, regimen_afiliacion)
+DO UPDATE SET total = EXCLUDED.total;
@@ -0,0 +1,33 @@
+-- ========================================
+-- DELTAS PENDIENTES DE LAS ESTADÍSTICAS DE PACIENTES
+-- Cada alta, edición o borrado agrega sus deltas a esta tabla en lugar de
+-- actualizar estadisticas_pacientes: con muchas altas del mismo día todas
+-- irían a la misma fila del rollup y se esperarían entre sí. Agregar
+-- filas no bloquea a nadie.
+-- Los workers de trabajos consolidan los deltas en estadisticas_pacientes
+-- cada ESTADISTICAS_CONSOLIDAR_SECONDS; la vista estadisticas_pacientes_vigentes
+-- suma ambas tablas y es la que lee /estadisticas.
+-- Tabla local del coordinador (como estadisticas_pacientes).
+-- ========================================
+
+\connect historiaclinica
+
+CREATE TABLE IF NOT EXISTS public.estadisticas_pacientes_deltas (
+    id BIGSERIAL PRIMARY KEY,
+    dia DATE NOT NULL,
+    tipo_atencion VARCHAR(50) NOT NULL DEFAULT '',
+    sexo VARCHAR(10) NOT NULL DEFAULT '',
+    regimen_afiliacion VARCHAR(50) NOT NULL DEFAULT '',
+    delta BIGINT NOT NULL
+);
+
+CREATE OR REPLACE VIEW public.estadisticas_pacientes_vigentes AS
+SELECT dia, tipo_atencion, sexo, regimen_afiliacion, SUM(total)::bigint AS total
+FROM (
+    SELECT dia, tipo_atencion, sexo, regimen_afiliacion, total
+    FROM public.estadisticas_pacientes
+    UNION ALL
+    SELECT dia, tipo_atencion, sexo, regimen_afiliacion, delta
+    FROM public.estadisticas_pacientes_deltas
+) AS partes
+GROUP BY dia, tipo_atencion, sexo, regimen_afiliacion;
@@ -0,0 +1,22 @@
+-- ========================================
+-- ARCHIVOS DE ENTRADA DE LOS TRABAJOS
+-- POST /pacientes/importar guarda el archivo recibido por partes y encola
+-- un trabajo importar_pacientes; el worker lo lee parte por parte. La API
+-- y los workers corren en pods distintos: el archivo vive en la base.
+-- Mientras se recibe, el trabajo queda en estado 'recibiendo' y ningún
+-- worker lo toma.
+-- Tabla local del coordinador (como trabajos); se borra con su trabajo.
+-- ========================================
+
+\connect historiaclinica
+
+CREATE TABLE IF NOT EXISTS public.trabajos_archivos (
+    trabajo_id BIGINT NOT NULL REFERENCES public.trabajos (id) ON DELETE CASCADE,
+    parte INTEGER NOT NULL,
+    datos BYTEA NOT NULL,
+    PRIMARY KEY (trabajo_id, parte)
+);
+
+ALTER TABLE public.trabajos DROP CONSTRAINT IF EXISTS trabajos_estado_check;
+ALTER TABLE public.trabajos ADD CONSTRAINT trabajos_estado_check
+    CHECK (estado IN ('recibiendo', 'pendiente', 'en_curso', 'completado', 'error'));
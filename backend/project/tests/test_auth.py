@@ -0,0 +1,72 @@
+# backend/project/tests/test_auth.py
+"""
+Pruebas del registro de revocaciones (modo claims)
+"""
+
+import asyncio
+from contextlib import asynccontextmanager
+
+from app import auth
+from app.auth import RegistroRevocaciones
+
+
+def _refrescar(registro, monkeypatch, filas):
+    class Cursor:
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *args):
+            pass
+
+        async def execute(self, query, params=None):
+            pass
+
+        async def fetchall(self):
+            return filas
+
+    class Conexion:
+        def cursor(self):
+            return Cursor()
+
+    @asynccontextmanager
+    async def conexion():
+        yield Conexion()
+
+    monkeypatch.setattr(auth, "async_db_connection", conexion)
+    registro.vencer()
+    asyncio.run(registro.refrescar_si_vencido())
+
+
+def test_refresco_viejo_no_deshace_una_revocacion_local(monkeypatch):
+    registro = RegistroRevocaciones(intervalo=60)
+    registro.revocar("ana", 3, activo=False)
+
+    # Lectura tomada antes del cambio local: época anterior, aún activa
+    _refrescar(registro, monkeypatch, [{"username": "ana", "token_epoch": 2, "activo": True}])
+
+    assert not registro.es_valido("ana", 3)
+
+
+def test_refresco_combina_por_usuario(monkeypatch):
+    registro = RegistroRevocaciones(intervalo=60)
+    registro.revocar("ana", 1)
+
+    _refrescar(registro, monkeypatch, [
+        {"username": "ana", "token_epoch": 4, "activo": True},
+        {"username": "luis", "token_epoch": 0, "activo": False},
+    ])
+
+    assert not registro.es_valido("ana", 3)
+    assert registro.es_valido("ana", 4)
+    assert not registro.es_valido("luis", 0)
+    assert registro.es_valido("eva", 0)
+
+
+def test_reactivar_con_epoca_nueva(monkeypatch):
+    registro = RegistroRevocaciones(intervalo=60)
+    registro.revocar("ana", 2, activo=False)
+
+    _refrescar(registro, monkeypatch, [{"username": "ana", "token_epoch": 3, "activo": True}])
+
+    assert not registro.es_valido("ana", 2)
+    assert registro.es_valido("ana", 3)
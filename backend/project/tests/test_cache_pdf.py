@@ -0,0 +1,42 @@
+# backend/project/tests/test_cache_pdf.py
+"""
+Pruebas de la caché de PDFs en disco
+"""
+
+import os
+import stat
+
+from app.pdf_generator import CachePDF
+
+
+def _modo(ruta):
+    return stat.S_IMODE(os.stat(ruta).st_mode)
+
+
+def test_directorio_y_archivos_privados(tmp_path):
+    directorio = tmp_path / "pdf"
+    cache = CachePDF(str(directorio), 1024 * 1024)
+
+    ruta = cache.guardar("abc", b"%PDF-1")
+
+    assert _modo(directorio) == 0o700
+    assert _modo(ruta) == 0o600
+    assert cache.obtener("abc") == ruta
+
+
+def test_directorio_existente_abierto_se_restringe(tmp_path):
+    directorio = tmp_path / "pdf"
+    directorio.mkdir(mode=0o777)
+    os.chmod(directorio, 0o777)
+    cache = CachePDF(str(directorio), 1024 * 1024)
+
+    assert cache.obtener("abc") is None
+    assert _modo(directorio) == 0o700
+
+
+def test_desaloja_al_superar_el_maximo(tmp_path):
+    cache = CachePDF(str(tmp_path / "pdf"), 250)
+    for i in range(5):
+        cache.guardar(f"c{i}", b"x" * 100)
+
+    assert sum(1 for n in os.listdir(tmp_path / "pdf") if n.endswith(".pdf")) <= 2
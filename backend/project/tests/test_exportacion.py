@@ -0,0 +1,100 @@
+# backend/project/tests/test_exportacion.py
+"""
+Pruebas del ZIP de la exportación masiva (BD y render simulados)
+"""
+
+import io
+import asyncio
+import zipfile
+from contextlib import asynccontextmanager
+from datetime import date, datetime
+
+import pytest
+
+from app import exportacion
+from app.models import ExportacionLote
+
+
+def _fila(documento):
+    return {
+        "id": int(documento),
+        "numero_documento": documento,
+        "fecha_nacimiento": date(1990, 1, 1),
+        "fecha_registro": datetime(2024, 1, 1),
+        "ultima_actualizacion": datetime(2024, 1, 1),
+    }
+
+
+class _Cursor:
+    async def execute(self, query, params=None):
+        self.params = params
+
+    async def fetchall(self):
+        return [_fila(d) for d in self.params[0] if d != "999"]
+
+    async def close(self):
+        pass
+
+
+class _Conexion:
+    def cursor(self):
+        return _Cursor()
+
+
+@asynccontextmanager
+async def _conexion():
+    yield _Conexion()
+
+
+async def _renderizar(datos):
+    if datos["numero_documento"] == "4":
+        raise RuntimeError("fallo de render")
+    return b"%PDF-" + datos["numero_documento"].encode()
+
+
+@pytest.fixture
+def exportacion_simulada(monkeypatch, tmp_path):
+    monkeypatch.setattr(exportacion, "async_db_connection", _conexion)
+    monkeypatch.setattr(exportacion, "renderizar_pdf", _renderizar)
+    monkeypatch.setattr(exportacion, "preparar_datos_pdf", lambda row: dict(row))
+    monkeypatch.setattr(exportacion, "EXPORTACION_LOTE_TAMANO", 2)
+    monkeypatch.setattr(exportacion.cache_pdf, "directorio", str(tmp_path))
+
+
+def _zip(solicitud):
+    async def leer():
+        return b"".join([parte async for parte in exportacion.generar_zip(solicitud)])
+    return zipfile.ZipFile(io.BytesIO(asyncio.run(leer())))
+
+
+def test_zip_incluye_pdfs_y_errores(exportacion_simulada):
+    zf = _zip(ExportacionLote(documentos=["1", "2", "3", "4", "999", "1"]))
+
+    assert zf.namelist() == ["HC_1.pdf", "HC_2.pdf", "HC_3.pdf", "errores.txt"]
+    assert zf.read("HC_2.pdf") == b"%PDF-2"
+    assert zf.read("errores.txt").decode().splitlines() == ["4: fallo de render", "999: no encontrado"]
+    assert zf.testzip() is None
+
+
+def test_zip_sin_fallidos_no_tiene_errores(exportacion_simulada):
+    zf = _zip(ExportacionLote(documentos=["1", "2"]))
+
+    assert zf.namelist() == ["HC_1.pdf", "HC_2.pdf"]
+
+
+def test_seleccion_por_filtro_pagina_por_keyset(monkeypatch):
+    monkeypatch.setattr(exportacion, "EXPORTACION_LOTE_TAMANO", 2)
+    filas = [_fila(str(i)) for i in range(5, 0, -1)]
+    seleccion = exportacion.SeleccionLotes(ExportacionLote(fecha_desde=date(2024, 1, 1), limite=3))
+
+    query, params = seleccion.siguiente()
+    assert "(fecha_registro, id) <" not in query
+    assert params == [date(2024, 1, 1), 2]
+    assert seleccion.recibir(filas[:2]) == filas[:2]
+
+    query, params = seleccion.siguiente()
+    assert "(fecha_registro, id) < (%s, %s)" in query
+    assert params == [date(2024, 1, 1), datetime(2024, 1, 1), 4, 1]
+    seleccion.recibir(filas[2:3])
+
+    assert seleccion.siguiente() is None
@@ -0,0 +1,80 @@
+# backend/project/tests/test_importacion.py
+"""
+Pruebas de la lectura CSV/NDJSON y de la carga por lotes (BD simulada)
+"""
+
+import asyncio
+
+from psycopg import errors as pg_errors
+
+from app import importacion
+from app.importacion import leer_registros, _insertar_lote
+
+
+def _leer(texto: str, formato: str, tamano: int = 7):
+    datos = texto.encode("utf-8")
+
+    async def bloques():
+        # Bloques chicos: los registros y caracteres quedan partidos entre bloques
+        for i in range(0, len(datos), tamano):
+            yield datos[i:i + tamano]
+
+    async def leer():
+        return [registro async for registro in leer_registros(bloques(), formato)]
+    return asyncio.run(leer())
+
+
+def test_csv_con_campos_de_varias_lineas_y_comillas_literales():
+    registros = _leer(
+        "﻿numero_documento,primer_nombre,observaciones\n"
+        '1,Ana,"primera línea\nsegunda, con coma"\n'
+        '2,O"Brien,\n'
+        '3,"Luis ""Lucho""",ok\n',
+        "csv"
+    )
+
+    assert registros == [
+        (2, {"numero_documento": "1", "primer_nombre": "Ana", "observaciones": "primera línea\nsegunda, con coma"}),
+        (4, {"numero_documento": "2", "primer_nombre": 'O"Brien', "observaciones": None}),
+        (5, {"numero_documento": "3", "primer_nombre": 'Luis "Lucho"', "observaciones": "ok"}),
+    ]
+
+
+def test_csv_comillas_sin_cerrar_se_reportan_y_se_relee_lo_demas():
+    registros = _leer(
+        "numero_documento,primer_nombre\n"
+        '1,"Ana\n'
+        "2,Luis\n",
+        "csv"
+    )
+
+    assert registros[0][0] == 2 and "__error__" in registros[0][1]
+    assert registros[1] == (3, {"numero_documento": "2", "primer_nombre": "Luis"})
+
+
+def test_ndjson_reporta_lineas_invalidas():
+    registros = _leer('{"numero_documento": "1"}\n\nno es json\n[1, 2]\n', "ndjson")
+
+    assert registros[0] == (1, {"numero_documento": "1"})
+    assert [fila for fila, _ in registros] == [1, 3, 4]
+    assert all("__error__" in registro for _, registro in registros[1:])
+
+
+def test_lote_rechazado_se_divide_hasta_aislar_la_fila(monkeypatch):
+    llamadas = []
+
+    async def insertar(filas, sql_staging):
+        llamadas.append(len(filas))
+        if any(valores[0] == "malo" for _, valores in filas):
+            raise pg_errors.CheckViolation("viola la restricción chk_documento\nDETAIL: ...")
+        return [{"numero_documento": valores[0]} for _, valores in filas]
+
+    monkeypatch.setattr(importacion, "_insertar", insertar)
+    filas = [(i + 2, [doc]) for i, doc in enumerate(["a", "b", "malo", "c", "d", "e", "f", "g"])]
+    errores = []
+
+    insertados = asyncio.run(_insertar_lote(filas, "", errores))
+
+    assert [row["numero_documento"] for row in insertados] == ["a", "b", "c", "d", "e", "f", "g"]
+    assert errores == [(4, "viola la restricción chk_documento")]
+    assert len(llamadas) < len(filas) * 2
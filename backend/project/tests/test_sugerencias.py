@@ -0,0 +1,86 @@
+# backend/project/tests/test_sugerencias.py
+"""
+Pruebas del índice de sugerencias (sin base de datos)
+"""
+
+from datetime import datetime
+
+from app import sugerencias
+from app.sugerencias import IndiceSugerencias, _TablaClaves, _entradas
+
+
+def _fila(documento, nombre, apellido, activo=True):
+    return {
+        "id": int(documento),
+        "numero_documento": documento,
+        "primer_nombre": nombre,
+        "segundo_nombre": None,
+        "primer_apellido": apellido,
+        "segundo_apellido": None,
+        "fecha_nacimiento": None,
+        "sexo": "F",
+        "tipo_atencion": None,
+        "fecha_atencion": None,
+        "nombre_profesional": None,
+        "activo": activo,
+        "fecha_registro": datetime(2024, 1, 1),
+        "ultima_actualizacion": datetime(2024, 1, 1),
+    }
+
+
+def _indice(filas):
+    indice = IndiceSugerencias()
+    entradas = {doc: e for doc, e in _entradas(filas).items() if e is not None}
+    indice._tabla = _TablaClaves.construir(entradas)
+    indice._entradas = entradas
+    indice._cargado = True
+    return indice
+
+
+def _documentos(resultado):
+    return [r["numero_documento"] for r in resultado]
+
+
+def test_varias_palabras_no_pierde_coincidencias_por_el_tope():
+    filas = [_fila(str(100000 + i), "Maria", f"Perez{i}") for i in range(5000)]
+    filas += [_fila(str(200000 + i), f"Ana{i}", "Gonzalez") for i in range(5000)]
+    filas.append(_fila("999999", "María", "González"))
+    indice = _indice(filas)
+
+    assert _documentos(indice.sugerir("maria gonzalez")) == ["999999"]
+    assert _documentos(indice.sugerir("gonz mar")) == ["999999"]
+
+
+def test_ordena_documento_exacto_y_palabras_completas_primero():
+    indice = _indice([
+        _fila("123", "Juana", "Perez"),
+        _fila("456", "Juan", "Perez"),
+        _fila("789", "Juan", "Pereira"),
+    ])
+
+    assert _documentos(indice.sugerir("juan perez")) == ["456", "123"]
+    assert _documentos(indice.sugerir("123"))[0] == "123"
+    assert indice.sugerir("   ") == []
+
+
+def test_prefijos_demasiado_comunes_devuelven_none(monkeypatch):
+    monkeypatch.setattr(sugerencias, "SUGERENCIAS_MAX_INTERSECCION", 10)
+    indice = _indice([_fila(str(1000 + i), "Maria", "Gonzalez") for i in range(20)])
+
+    assert indice.sugerir("maria gonzalez") is None
+    # Con una sola palabra cualquier coincidencia sirve
+    assert len(indice.sugerir("maria", k=5)) == 5
+
+
+def test_actualizar_y_eliminar_mantienen_el_indice():
+    indice = _indice([_fila("111", "Pedro", "Lopez")])
+
+    indice.actualizar(_fila("111", "Pablo", "Lopez"))
+    assert indice.sugerir("pedro") == []
+    assert _documentos(indice.sugerir("pab lop")) == ["111"]
+
+    indice.actualizar(_fila("222", "Pablo", "Ruiz", activo=False))
+    assert _documentos(indice.sugerir("pablo")) == ["111"]
+
+    indice.eliminar("111")
+    assert indice.sugerir("pablo") == []
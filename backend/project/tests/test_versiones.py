@@ -0,0 +1,49 @@
+# backend/project/tests/test_versiones.py
+"""
+Pruebas de los ETag / If-Match de app/versiones.py
+"""
+
+from datetime import datetime, timezone
+
+import pytest
+
+from app.versiones import (
+    VersionInvalida, etag_version, parsear_if_match, coincide_if_none_match
+)
+
+
+def test_etag_vuelve_exacto_por_if_match():
+    marca = datetime(2024, 3, 5, 14, 30, 15, 123457)
+
+    etag = etag_version(marca)
+
+    assert etag.startswith('"') and etag.endswith('"')
+    assert parsear_if_match(etag) == [marca]
+    assert etag_version(marca.replace(tzinfo=timezone.utc)) == etag
+    assert etag_version(None) is None
+
+
+def test_if_match_sin_condicion_y_varias_versiones():
+    a = datetime(2024, 1, 1, 0, 0, 0, 1)
+    b = datetime(2024, 1, 2)
+
+    assert parsear_if_match(None) is None
+    assert parsear_if_match(" * ") is None
+    assert parsear_if_match(f"{etag_version(a)}, {etag_version(b)}") == [a, b]
+
+
+@pytest.mark.parametrize("valor", ['W/"1"', '"abc"', "", '"1", ', '"99999999999999999999999"'])
+def test_if_match_invalido(valor):
+    with pytest.raises(VersionInvalida):
+        parsear_if_match(valor)
+
+
+def test_if_none_match_usa_comparacion_debil():
+    etag = etag_version(datetime(2024, 1, 1))
+
+    assert coincide_if_none_match(etag, etag)
+    assert coincide_if_none_match(f'"0", W/{etag}', etag)
+    assert coincide_if_none_match("*", etag)
+    assert not coincide_if_none_match('"0"', etag)
+    assert not coincide_if_none_match(None, etag)
+    assert not coincide_if_none_match(etag, None)
@@ -46,6 +46,7 @@ const ENDPOINTS = {
     // Pacientes
     PACIENTES_LIST: '/pacientes',
     PACIENTES_DETAIL: (doc) => `/pacientes/${doc}`,
+    PACIENTES_LOTE: '/pacientes/lote',
     PACIENTES_SEARCH: '/pacientes/buscar/query',
     PACIENTES_CREATE: '/pacientes',
     PACIENTES_UPDATE: (doc) => `/pacientes/${doc}`,
@@ -61,6 +62,7 @@ const ENDPOINTS = {
     // Sistema
     HEALTH: '/health',
     ESTADISTICAS: '/estadisticas',
+    ESTADISTICAS_ACTIVIDAD: (params) => `/estadisticas/actividad?${new URLSearchParams(params)}`,
 };
 
 const TIPOS_DOCUMENTO = {
@@ -199,6 +201,9 @@ const AUTH_UTILS = {
 // ==================== UTILIDADES DE API ====================
 
 const API_UTILS = {
+    // Último ETag recibido por endpoint (se reenvía como If-Match al guardar)
+    versiones: {},
+
     /**
      * Construir headers autenticados
      */
@@ -281,6 +286,9 @@ const API_UTILS = {
                 throw new Error(error.detail || `HTTP ${response.status}`);
             }
 
+            const etag = response.headers.get('ETag');
+            if (etag) this.versiones[endpoint] = etag;
+
             return await response.json();
         } catch (error) {
             console.error(`❌ GET ${endpoint}:`, error);
@@ -316,9 +324,11 @@ const API_UTILS = {
      */
     async put(endpoint, data) {
         try {
+            const version = this.versiones[endpoint];
             const response = await this.fetchWithRetry(endpoint, {
                 method: 'PUT',
-                body: JSON.stringify(data)
+                body: JSON.stringify(data),
+                headers: version ? { 'If-Match': version } : {}
             });
             if (!response) return null;
 
@@ -327,6 +337,9 @@ const API_UTILS = {
                 throw new Error(error.detail || `HTTP ${response.status}`);
             }
 
+            const etag = response.headers.get('ETag');
+            if (etag) this.versiones[endpoint] = etag;
+
             return await response.json();
         } catch (error) {
             console.error(`❌ PUT ${endpoint}:`, error);